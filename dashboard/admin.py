@@ -1,13 +1,15 @@
 # dashboard/admin.py
 
 from django.db.models import Prefetch
+from django.utils import timezone
 from django.urls import reverse # Ensure reverse is imported
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html # Ensure format_html is imported
-from .models import Greenhouse, Sensor, SensorData, User, Actuator, ActuatorStatus, Alert
+from .models import Greenhouse, Sensor, SensorData, User, Actuator, ActuatorStatus, ActuatorState, Alert, AlertRule
 from django_admin_listfilter_dropdown.filters import DropdownFilter
 from advanced_filters.admin import AdminAdvancedFiltersMixin
+from .alerting import alert_engine, publish_alert
 
 
 @admin.register(User)
@@ -224,16 +226,14 @@ class ActuatorAdmin(AdminAdvancedFiltersMixin, admin.ModelAdmin):
     list_per_page = 25
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('greenhouse__user').prefetch_related(
-            Prefetch('statuses', queryset=ActuatorStatus.objects.order_by('-timestamp'))
-        )
+        return super().get_queryset(request).select_related('greenhouse__user', 'current_state')
 
     # Method to display the latest status in the list_display
     def latest_status_display(self, obj):
         try:
-            latest = obj.statuses.latest('timestamp')
+            latest = obj.current_state
             return f"{latest.status_value} ({latest.timestamp.strftime('%Y-%m-%d %H:%M:%S')})"
-        except ActuatorStatus.DoesNotExist:
+        except ActuatorState.DoesNotExist:
             return "No status yet"
     latest_status_display.short_description = "Dernier Statut"
 
@@ -302,7 +302,7 @@ class ActuatorStatusAdmin(AdminAdvancedFiltersMixin, admin.ModelAdmin):
 # Register the Alert model
 @admin.register(Alert)
 class AlertAdmin(admin.ModelAdmin):
-    list_display = ('message', 'clickable_greenhouse', 'sensor', 'severity', 'created_at', 'is_resolved')
+    list_display = ('message', 'clickable_greenhouse', 'sensor', 'rule_key', 'severity', 'peak_value', 'reading_count', 'created_at', 'resolved_at', 'is_resolved')
     list_filter = (
         ('greenhouse', admin.RelatedOnlyFieldListFilter),
         ('sensor', admin.RelatedOnlyFieldListFilter),
@@ -315,7 +315,16 @@ class AlertAdmin(admin.ModelAdmin):
     actions = ['mark_as_resolved']
 
     def mark_as_resolved(self, request, queryset):
-        queryset.update(is_resolved=True)
+        open_alerts = list(queryset.filter(is_resolved=False).values_list('id', 'greenhouse_id', 'sensor_id', 'sensor__type', 'rule_key', 'open_key'))
+        resolved_at = timezone.now()
+        queryset.update(is_resolved=True, open_key=None, resolved_at=resolved_at)
+        for sensor_id in {alert[2] for alert in open_alerts if alert[2]}:
+            alert_engine.forget(sensor_id) # update() sends no post_save
+        for alert_id, greenhouse_id, sensor_id, sensor_type, rule_key, open_key in open_alerts:
+            publish_alert('alert_resolved', greenhouse_id, {
+                'id': alert_id, 'open_key': open_key, 'sensor_id': sensor_id, 'sensor_type': sensor_type,
+                'rule_key': rule_key, 'resolved_at': resolved_at.isoformat(),
+            })
         self.message_user(request, "Selected alerts have been marked as resolved.")
     mark_as_resolved.short_description = "Mark selected alerts as resolved"
 
@@ -332,4 +341,22 @@ class AlertAdmin(admin.ModelAdmin):
             except Exception:
                 return greenhouse.name # Fallback
         return '-' # Display '-' if greenhouse is None
-    clickable_greenhouse.short_description = 'Greenhouse' # Set the column header
\ No newline at end of file
+    clickable_greenhouse.short_description = 'Greenhouse' # Set the column header
+
+
+# Alert rules: global, per greenhouse or per sensor (saving one refreshes the alert engine's rule cache)
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ('sensor_type', 'condition', 'threshold', 'hysteresis', 'min_consecutive', 'min_duration', 'severity', 'scope', 'greenhouse', 'sensor', 'is_active', 'updated_at')
+    list_filter = (
+        'sensor_type',
+        'severity',
+        'is_active',
+        ('greenhouse', admin.RelatedOnlyFieldListFilter),
+    )
+    search_fields = ['message', 'greenhouse__name', 'sensor__name']
+    list_editable = ['threshold', 'is_active']
+    raw_id_fields = ['sensor']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('greenhouse', 'sensor')
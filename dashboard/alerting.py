@@ -0,0 +1,645 @@
+# dashboard/alerting.py
+"""
+Alert rule engine used by check_sensor_alert and the bulk ingestion path.
+
+Rules come from AlertRule rows (global, per greenhouse or per sensor), loaded in one
+query and compiled into a tuple of CompiledRule per sensor, memoized in memory.
+The rule cache is versioned: saving or deleting an AlertRule bumps the version
+(signal), locally at once and, through Django's cache, in other processes within
+RULES_VERSION_CHECK_INTERVAL seconds. A per-reading rule lookup never queries the database.
+
+Each (sensor, rule) pair has a small state machine kept in memory:
+
+    idle --breach--> pending --min_consecutive readings and min_duration seconds--> open
+    open --value back past threshold -/+ hysteresis--> idle (alert resolved)
+
+A noisy value around the threshold therefore opens one alert per excursion. While the
+alert is open, its last value, peak value and reading count are updated in place,
+written at most every ALERT_UPDATE_INTERVAL seconds with a plain UPDATE (no post_save,
+no WebSocket traffic). Opening and resolving an alert publish alert_opened / alert_resolved
+events to the greenhouse's sockets after commit (publish_alert), once per alert: only the worker that
+inserted the row, or whose UPDATE resolved it, publishes. The database is otherwise only touched when an alert opens
+(a merging UPDATE, then an INSERT; race-free across workers thanks to the unique Alert.open_key) or resolves (one UPDATE), and to load a sensor's open alerts the first
+time (again after ALERT_STATE_TTL seconds, so changes made by other processes are picked up).
+
+evaluate_batch() runs the same state machines over columnar arrays of readings (bulk
+ingestion, backfills): each rule is evaluated with numpy over all readings of a sensor,
+and Python only iterates over the resulting transitions, not over readings.
+"""
+import operator
+import threading
+import time
+
+import numpy as np
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+
+from .archive import from_micros, to_micros
+from .constants import ALERT_THRESHOLDS
+from .dispatch import publish_to_greenhouse
+from .models import Alert, AlertRule
+
+
+ALERT_STATE_TTL = 60 # Seconds before a sensor's cached open-alert state is reloaded
+ALERT_UPDATE_INTERVAL = 30 # Seconds between in-place writes of an open alert's excursion summary
+RULES_VERSION_CACHE_KEY = 'dashboard:alert_rules_version'
+RULES_VERSION_CHECK_INTERVAL = 5 # Seconds between checks of the shared rules version
+
+OPERATORS = {
+    'greater_than': operator.gt,
+    'less_than': operator.lt,
+}
+NP_OPERATORS = {
+    'greater_than': np.greater,
+    'less_than': np.less,
+}
+
+
+class CompiledRule:
+    __slots__ = ('key', 'rule_id', 'sensor_type', 'condition', 'threshold', 'message', 'severity',
+                 'hysteresis', 'min_consecutive', 'min_duration', 'predicate', 'clear_level')
+
+    def __init__(self, sensor_type, condition, threshold, message, severity='WARNING', rule_id=None,
+                 hysteresis=0.0, min_consecutive=1, min_duration=0):
+        self.key = f'{sensor_type}:{condition}'
+        self.rule_id = rule_id
+        self.sensor_type = sensor_type
+        self.condition = condition
+        self.threshold = threshold
+        self.message = message
+        self.severity = severity
+        self.hysteresis = hysteresis
+        self.min_consecutive = max(1, min_consecutive)
+        self.min_duration = min_duration
+        self.predicate = OPERATORS[condition]
+        # An open alert clears once the value is past this level, back on the safe side
+        self.clear_level = threshold - hysteresis if condition == 'greater_than' else threshold + hysteresis
+
+    @classmethod
+    def from_model(cls, rule):
+        return cls(
+            rule.sensor_type, rule.condition, rule.threshold, rule.message, rule.severity, rule_id=rule.id,
+            hysteresis=rule.hysteresis, min_consecutive=rule.min_consecutive, min_duration=rule.min_duration,
+        )
+
+    def matches(self, value):
+        return self.predicate(value, self.threshold)
+
+    def clears(self, value):
+        return not self.predicate(value, self.clear_level)
+
+    def worse(self, value, peak):
+        """
+        True if value is further into the breach than peak.
+        """
+        return peak is None or self.predicate(value, peak)
+
+    def format_message(self, value):
+        return f"{self.sensor_type} {self.message.replace('{{ value }}', str(value))}"
+
+
+def compile_rules(thresholds=ALERT_THRESHOLDS):
+    """
+    Returns {sensor_type: (CompiledRule, ...)} for the thresholds dict format of constants.py.
+    """
+    return {
+        sensor_type: tuple(
+            CompiledRule(
+                sensor_type, condition, details['threshold'], details['message'], details.get('severity', 'WARNING'),
+                hysteresis=details.get('hysteresis', 0.0),
+                min_consecutive=details.get('min_consecutive', 1),
+                min_duration=details.get('min_duration', 0),
+            )
+            for condition, details in conditions.items()
+        )
+        for sensor_type, conditions in thresholds.items()
+        if conditions
+    }
+
+
+class StaticRules:
+    """
+    The same rules for every sensor of a type, from a dict in the ALERT_THRESHOLDS format.
+    """
+    def __init__(self, thresholds=ALERT_THRESHOLDS):
+        self.by_type = compile_rules(thresholds)
+
+    def rules_for(self, sensor):
+        return self.by_type.get(sensor.type, ())
+
+    def invalidate(self):
+        pass
+
+
+class DatabaseRules:
+    """
+    AlertRule rows resolved per sensor (sensor rule, else greenhouse rule, else global rule,
+    for each condition) with a versioned in-process cache.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._version = None
+        self._checked_at = 0.0
+        self._global = {} # sensor_type -> {condition: CompiledRule or None}
+        self._greenhouse = {} # (greenhouse_id, sensor_type) -> {condition: ...}
+        self._sensor = {} # (sensor_id, sensor_type) -> {condition: ...}
+        self._per_sensor = {} # (sensor_id, sensor_type, greenhouse_id) -> (CompiledRule, ...)
+
+    def invalidate(self):
+        """
+        Called when rules change: reload here on next use and tell other processes.
+        """
+        cache.add(RULES_VERSION_CACHE_KEY, 0)
+        try:
+            cache.incr(RULES_VERSION_CACHE_KEY)
+        except ValueError:
+            pass # Key evicted in between; other processes will reload after their next check anyway
+        with self._lock:
+            self._loaded = False
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < RULES_VERSION_CHECK_INTERVAL:
+            return
+        version = cache.get(RULES_VERSION_CACHE_KEY, 0)
+        with self._lock:
+            self._checked_at = now
+            if self._loaded and version == self._version:
+                return
+        self._load(version)
+
+    def _load(self, version):
+        scopes = ({}, {}, {})
+        for rule in AlertRule.objects.all():
+            compiled = CompiledRule.from_model(rule) if rule.is_active else None # Inactive rules mask wider scopes
+            if rule.sensor_id:
+                scopes[2].setdefault((rule.sensor_id, rule.sensor_type), {})[rule.condition] = compiled
+            elif rule.greenhouse_id:
+                scopes[1].setdefault((rule.greenhouse_id, rule.sensor_type), {})[rule.condition] = compiled
+            else:
+                scopes[0].setdefault(rule.sensor_type, {})[rule.condition] = compiled
+        with self._lock:
+            self._global, self._greenhouse, self._sensor = scopes
+            self._per_sensor = {}
+            self._version = version
+            self._loaded = True
+
+    def rules_for(self, sensor):
+        self._ensure_loaded()
+        memo_key = (sensor.id, sensor.type, sensor.greenhouse_id)
+        rules = self._per_sensor.get(memo_key)
+        if rules is None:
+            conditions = dict(self._global.get(sensor.type, {}))
+            conditions.update(self._greenhouse.get((sensor.greenhouse_id, sensor.type), {}))
+            conditions.update(self._sensor.get((sensor.id, sensor.type), {}))
+            rules = tuple(rule for rule in conditions.values() if rule is not None)
+            self._per_sensor[memo_key] = rules
+        return rules
+
+
+def scan_rule(rule, timestamps, values, rule_state):
+    """
+    Vectorized equivalent of feeding one sensor's readings, one by one, to the state machine of a rule.
+    timestamps (int64, microseconds since epoch) and values are in time order; rule_state is the
+    state before the first reading and is not modified.
+
+    Returns (breach, excursions, pending):
+      breach      boolean array, readings that break the rule
+      excursions  [(start, opened, closed)] reading indexes; start is where the breach began
+                  (0 for one carried over from rule_state), opened is None for an alert that was
+                  already open, closed is None for one still open after the last reading
+      pending     (start, breaches, started_us) of an unconfirmed breach at the end, or None
+    """
+    n = len(values)
+    compare = NP_OPERATORS[rule.condition]
+    breach = compare(values, rule.threshold)
+    clear = ~compare(values, rule.clear_level)
+
+    # Index where the run of consecutive breaching readings containing each reading began
+    index = np.arange(n)
+    run_start = np.maximum.accumulate(np.where(breach, -1, index)) + 1
+    run_start = np.minimum(run_start, n - 1)
+    run_length = index - run_start + 1
+    run_started = timestamps[run_start]
+    carried = rule_state.open_key is None and rule_state.breaches > 0
+    if carried:
+        from_start = run_start == 0
+        run_length = run_length + np.where(from_start, rule_state.breaches, 0)
+        run_started = np.where(from_start, to_micros(rule_state.breach_started), run_started)
+    confirmed = breach & (run_length >= rule.min_consecutive) & (timestamps - run_started >= rule.min_duration * 1_000_000)
+
+    opens = np.flatnonzero(confirmed)
+    clears = np.flatnonzero(clear)
+    excursions = []
+    is_open = rule_state.open_key is not None
+    start, opened, position = 0, None, 0
+    while position < n:
+        if is_open:
+            k = np.searchsorted(clears, position)
+            if k == len(clears):
+                break
+            closed = int(clears[k])
+            excursions.append((start, opened, closed))
+            is_open, position = False, closed + 1
+        else:
+            k = np.searchsorted(opens, position)
+            if k == len(opens):
+                break
+            opened = int(opens[k])
+            start = int(run_start[opened])
+            is_open, position = True, opened + 1
+    if is_open:
+        excursions.append((start, opened, None))
+
+    pending = None
+    if not is_open and n and breach[-1]:
+        pending = (int(run_start[-1]), int(run_length[-1]), int(run_started[-1]))
+    return breach, excursions, pending
+
+
+class RuleState:
+    """
+    Debounce and excursion state of one rule for one sensor.
+    """
+    __slots__ = ('open_key', 'breaches', 'breach_started', 'last_value', 'peak_value', 'reading_count', 'dirty', 'written_at')
+
+    def __init__(self):
+        self.open_key = None # Alert.open_key of the open alert, if any
+        self.written_at = 0.0
+        self.reset()
+
+    def reset(self):
+        self.breaches = 0
+        self.breach_started = None
+        self.last_value = None
+        self.peak_value = None
+        self.reading_count = 0
+        self.dirty = False
+
+    def record(self, rule, value):
+        self.last_value = value
+        if rule.worse(value, self.peak_value):
+            self.peak_value = value
+        self.reading_count += 1
+        self.dirty = True
+
+    def record_span(self, rule, values):
+        """
+        Same as record() for each value of a numpy array.
+        """
+        peak = float(values.max() if rule.condition == 'greater_than' else values.min())
+        if rule.worse(peak, self.peak_value):
+            self.peak_value = peak
+        self.last_value = float(values[-1])
+        self.reading_count += len(values)
+        self.dirty = True
+
+    def summary(self):
+        return {'last_value': self.last_value, 'peak_value': self.peak_value, 'reading_count': self.reading_count}
+
+
+class SensorAlertState:
+    def __init__(self, loaded_at):
+        self.loaded_at = loaded_at
+        self.rules = {} # rule key -> RuleState
+        self.has_orphans = False # Open alerts no current rule owns (legacy or rule removed)
+        self.lock = threading.Lock()
+
+
+def publish_alert(event_type, greenhouse_id, alert):
+    """
+    Publishes an alert_opened / alert_resolved event to the greenhouse's sockets after commit.
+    alert has at least open_key (identifies the alert while it is open, as in the connect
+    snapshot), sensor_id, sensor_type and rule_key.
+    """
+    try:
+        publish_to_greenhouse(greenhouse_id, {'type': event_type, 'alert': alert})
+    except Exception as e:
+        print(f"publish_alert: ERROR publishing {event_type} for Greenhouse ID {greenhouse_id}: {e}")
+
+
+def opened_payload(sensor, alert):
+    return {
+        'open_key': Alert.make_open_key(sensor.id, alert.rule_key), 'sensor_id': sensor.id, 'sensor_type': sensor.type,
+        'rule_key': alert.rule_key, 'severity': alert.severity, 'message': alert.message,
+        'created_at': alert.created_at.isoformat(), 'peak_value': alert.peak_value,
+    }
+
+
+def resolved_payload(sensor, rule_key, resolved_at, **summary):
+    return {
+        'open_key': Alert.make_open_key(sensor.id, rule_key), 'sensor_id': sensor.id, 'sensor_type': sensor.type,
+        'rule_key': rule_key, 'resolved_at': resolved_at.isoformat(), **summary,
+    }
+
+
+class AlertEngine:
+    def __init__(self, rules=None):
+        self.rules = rules or DatabaseRules() # Anything with rules_for(sensor) and invalidate()
+        self._states = {} # sensor_id -> SensorAlertState
+        self._lock = threading.Lock()
+
+    def sensor_state(self, sensor):
+        """
+        Returns the in-memory alert state of a sensor, (re)loading its open alerts if needed.
+        Pending breaches survive a reload; open alerts are taken from the database.
+        """
+        now = time.monotonic()
+        with self._lock:
+            previous = self._states.get(sensor.id)
+        if previous is not None and now - previous.loaded_at < ALERT_STATE_TTL:
+            return previous
+
+        state = SensorAlertState(now)
+        if previous is not None:
+            with previous.lock:
+                self.write_summaries(previous, force=True)
+                for key, rule_state in previous.rules.items():
+                    if rule_state.open_key is None:
+                        state.rules[key] = rule_state
+
+        open_alerts = Alert.objects.filter(sensor=sensor, is_resolved=False).values_list(
+            'open_key', 'rule_key', 'last_value', 'peak_value', 'reading_count'
+        )
+        for open_key, rule_key, last_value, peak_value, reading_count in open_alerts:
+            if open_key is None:
+                state.has_orphans = True
+                continue
+            rule_state = state.rules[rule_key] = RuleState()
+            rule_state.open_key = open_key
+            rule_state.last_value = last_value
+            rule_state.peak_value = peak_value
+            rule_state.reading_count = reading_count
+            rule_state.written_at = now
+
+        with self._lock:
+            self._states[sensor.id] = state
+        return state
+
+    def forget(self, sensor_id=None):
+        """
+        Drops cached state (of one sensor, or all) after alerts were changed outside the engine.
+        """
+        with self._lock:
+            if sensor_id is None:
+                self._states.clear()
+            else:
+                self._states.pop(sensor_id, None)
+
+    def evaluate(self, sensor, value, timestamp=None):
+        """
+        Feeds one reading to the state machine of each rule of the sensor (see module docstring).
+        timestamp is the reading's time, used for min_duration; defaults to now.
+        """
+        rules = self.rules.rules_for(sensor)
+        if not rules:
+            return
+        timestamp = timestamp or timezone.now()
+        state = self.sensor_state(sensor)
+        with state.lock:
+            breached = False
+            for rule in rules:
+                rule_state = state.rules.get(rule.key)
+                if rule_state is None:
+                    rule_state = state.rules[rule.key] = RuleState()
+
+                if rule.matches(value):
+                    breached = True
+                    if rule_state.breach_started is None and rule_state.open_key is None:
+                        rule_state.breach_started = timestamp
+                    rule_state.breaches += 1
+                    rule_state.record(rule, value)
+                    if rule_state.open_key is None and self.debounced(rule, rule_state, timestamp):
+                        self.open_alert(sensor, rule, rule_state, value, timestamp)
+                elif rule_state.open_key is not None:
+                    rule_state.record(rule, value) # Inside the hysteresis band the excursion goes on
+                    if rule.clears(value):
+                        self.resolve_alert(sensor, rule_state, timestamp)
+                elif rule_state.breaches:
+                    rule_state.reset() # Breach ended before it was confirmed
+
+            if not breached:
+                self.resolve_orphans(sensor, state, {rule.key for rule in rules}, timestamp)
+            self.write_summaries(state)
+
+    def debounced(self, rule, rule_state, timestamp):
+        if rule_state.breaches < rule.min_consecutive:
+            return False
+        return (timestamp - rule_state.breach_started).total_seconds() >= rule.min_duration
+
+    def open_alert(self, sensor, rule, rule_state, value, timestamp):
+        """
+        Opens the alert, unless another worker already opened the same one (same Alert.open_key):
+        then this worker's readings are merged into that row (counts added, worst peak kept), as
+        merge_bucket does for rollups, and the merged summary becomes the local state.
+        alert_opened is only published by the worker whose INSERT created the row.
+        timestamp is the time of the reading that opens it (the alert's created_at).
+        Returns the Alert, or None if it was merged into another worker's.
+        """
+        open_key = Alert.make_open_key(sensor.id, rule.key)
+        rule_state.open_key = open_key
+        rule_state.dirty = False
+        rule_state.written_at = time.monotonic()
+        if self.merge_open_alert(rule, rule_state):
+            return None
+        alert = Alert(
+            greenhouse_id=sensor.greenhouse_id,
+            sensor=sensor,
+            rule_key=rule.key,
+            open_key=open_key,
+            message=rule.format_message(value),
+            severity=rule.severity,
+            created_at=timestamp,
+            updated_at=timezone.now(),
+            **rule_state.summary(),
+        )
+        try:
+            with transaction.atomic(): # Savepoint, so a lost insert race does not break the outer transaction
+                alert.save(force_insert=True)
+        except IntegrityError:
+            # Another worker opened it between our UPDATE and INSERT
+            self.merge_open_alert(rule, rule_state)
+            return None
+        print(f"AlertEngine: !!! New Alert Triggered and Created: {open_key}, Message: {alert.message}")
+        publish_alert('alert_opened', sensor.greenhouse_id, opened_payload(sensor, alert))
+        return alert
+
+    def merge_open_alert(self, rule, rule_state):
+        """
+        Adds this worker's excursion summary to the open alert of rule_state.open_key, if it exists,
+        and reloads the merged summary into rule_state. Returns True if the alert existed.
+        """
+        peak = Value(rule_state.peak_value, output_field=FloatField())
+        worst = Greatest if rule.condition == 'greater_than' else Least
+        rows = Alert.objects.filter(open_key=rule_state.open_key)
+        merged = rows.update(
+            last_value=rule_state.last_value,
+            peak_value=worst(Coalesce('peak_value', peak), peak),
+            reading_count=F('reading_count') + rule_state.reading_count,
+            updated_at=timezone.now(),
+        )
+        if not merged:
+            return False
+        summary = rows.values('last_value', 'peak_value', 'reading_count').first()
+        if summary is not None:
+            rule_state.last_value = summary['last_value']
+            rule_state.peak_value = summary['peak_value']
+            rule_state.reading_count = summary['reading_count']
+        print(f"AlertEngine: Alert {rule_state.open_key} was already open, merged {rule_state.reading_count} reading(s) into it")
+        return True
+
+    def resolve_alert(self, sensor, rule_state, timestamp):
+        """
+        Resolves the open alert of rule_state. alert_resolved is only published if this UPDATE
+        resolved it, not when another worker (or an API call) already had.
+        """
+        summary = rule_state.summary()
+        resolved = Alert.objects.filter(open_key=rule_state.open_key).update(
+            is_resolved=True, open_key=None, resolved_at=timestamp, updated_at=timezone.now(), **summary
+        )
+        if resolved:
+            print(f"AlertEngine: ^^^ Alert {rule_state.open_key} resolved for Sensor ID {sensor.id} after {rule_state.reading_count} reading(s)")
+            rule_key = rule_state.open_key.split(':', 1)[1]
+            publish_alert('alert_resolved', sensor.greenhouse_id, resolved_payload(sensor, rule_key, timestamp, **summary))
+        else:
+            print(f"AlertEngine: Alert {rule_state.open_key} of Sensor ID {sensor.id} was already resolved")
+        rule_state.open_key = None
+        rule_state.reset()
+
+    def resolve_orphans(self, sensor, state, rule_keys, timestamp):
+        """
+        Open alerts whose rule no longer applies are resolved by the first reading that breaches no rule.
+        """
+        for key, rule_state in list(state.rules.items()):
+            if rule_state.open_key is not None and key not in rule_keys:
+                state.has_orphans = True
+                del state.rules[key]
+        if state.has_orphans:
+            current = [Alert.make_open_key(sensor.id, key) for key in rule_keys]
+            orphans = list(Alert.objects.filter(sensor=sensor, is_resolved=False).exclude(open_key__in=current).values_list('id', 'rule_key', 'open_key'))
+            resolved = Alert.objects.filter(pk__in=[alert_id for alert_id, _, _ in orphans]).update(
+                is_resolved=True, open_key=None, resolved_at=timestamp, updated_at=timezone.now()
+            )
+            state.has_orphans = False
+            print(f"AlertEngine: ^^^ {resolved} alert(s) without a current rule resolved for Sensor ID {sensor.id}")
+            for alert_id, rule_key, open_key in orphans:
+                payload = resolved_payload(sensor, rule_key, timestamp, id=alert_id)
+                payload['open_key'] = open_key # The row's own key: NULL for legacy alerts, identified by 'id' (live_state.alert_key)
+                publish_alert('alert_resolved', sensor.greenhouse_id, payload)
+
+    def evaluate_batch(self, sensors, sensor_ids, timestamps, values):
+        """
+        Batch equivalent of calling evaluate() for every reading in time order.
+        sensors is {id: Sensor}; sensor_ids, timestamps (int64, microseconds since epoch)
+        and values are equal-length arrays, in any order.
+        Alerts opened and resolved within the batch are written with one bulk INSERT.
+        Returns the transitions, [(timestamp_us, 'open' or 'close', sensor_id, rule_key)], in time order.
+        """
+        sensor_ids = np.asarray(sensor_ids, dtype=np.int64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        order = np.lexsort((timestamps, sensor_ids))
+        sensor_ids, timestamps, values = sensor_ids[order], timestamps[order], values[order]
+
+        bounds = np.flatnonzero(np.diff(sensor_ids)) + 1
+        transitions = []
+        completed = [] # Alerts opened and resolved within the batch
+        for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(sensor_ids)]))):
+            if start == end:
+                continue
+            sensor = sensors[int(sensor_ids[start])]
+            rules = self.rules.rules_for(sensor)
+            if not rules:
+                continue
+            state = self.sensor_state(sensor)
+            with state.lock:
+                self.apply_batch(sensor, state, rules, timestamps[start:end], values[start:end], transitions, completed)
+                self.write_summaries(state)
+
+        if completed:
+            Alert.objects.bulk_create(completed, batch_size=500)
+            print(f"AlertEngine: !!! {len(completed)} alert(s) opened and resolved within a batch")
+            for alert in completed:
+                publish_alert('alert_opened', alert.greenhouse_id, opened_payload(alert.sensor, alert))
+                publish_alert('alert_resolved', alert.greenhouse_id, resolved_payload(
+                    alert.sensor, alert.rule_key, alert.resolved_at,
+                    last_value=alert.last_value, peak_value=alert.peak_value, reading_count=alert.reading_count,
+                ))
+        transitions.sort(key=lambda transition: transition[0])
+        return transitions
+
+    def apply_batch(self, sensor, state, rules, timestamps, values, transitions, completed):
+        any_breach = np.zeros(len(values), dtype=bool)
+        for rule in rules:
+            rule_state = state.rules.get(rule.key)
+            if rule_state is None:
+                rule_state = state.rules[rule.key] = RuleState()
+            breach, excursions, pending = scan_rule(rule, timestamps, values, rule_state)
+            any_breach |= breach
+
+            for start, opened, closed in excursions:
+                if start > 0 or opened is None and rule_state.open_key is None:
+                    rule_state.reset() # Fresh excursion; otherwise it continues the carried-over state
+                end = len(values) if closed is None else closed + 1
+                rule_state.record_span(rule, values[start:end])
+                if opened is not None:
+                    transitions.append((int(timestamps[opened]), 'open', sensor.id, rule.key))
+                if closed is not None:
+                    transitions.append((int(timestamps[closed]), 'close', sensor.id, rule.key))
+
+                if opened is None:
+                    # Alert open before the batch
+                    if closed is not None:
+                        self.resolve_alert(sensor, rule_state, from_micros(int(timestamps[closed])))
+                elif closed is not None:
+                    completed.append(Alert(
+                        greenhouse_id=sensor.greenhouse_id,
+                        sensor=sensor,
+                        rule_key=rule.key,
+                        message=rule.format_message(float(values[opened])),
+                        severity=rule.severity,
+                        is_resolved=True,
+                        created_at=from_micros(int(timestamps[opened])),
+                        resolved_at=from_micros(int(timestamps[closed])),
+                        updated_at=timezone.now(),
+                        **rule_state.summary(),
+                    ))
+                    rule_state.reset()
+                else:
+                    self.open_alert(sensor, rule, rule_state, float(values[opened]), from_micros(int(timestamps[opened])))
+
+            if rule_state.open_key is None:
+                if pending is None:
+                    rule_state.reset()
+                else:
+                    start, breaches, started_us = pending
+                    if start > 0 or not rule_state.breaches:
+                        rule_state.reset()
+                    rule_state.record_span(rule, values[start:])
+                    rule_state.breaches = breaches
+                    rule_state.breach_started = from_micros(started_us)
+
+        calm = np.flatnonzero(~any_breach)
+        if len(calm):
+            self.resolve_orphans(sensor, state, {rule.key for rule in rules}, from_micros(int(timestamps[calm[0]])))
+
+    def write_summaries(self, state, force=False):
+        """
+        Writes the excursion summary of open alerts, at most every ALERT_UPDATE_INTERVAL seconds each.
+        """
+        now = time.monotonic()
+        for rule_state in state.rules.values():
+            if rule_state.open_key is None or not rule_state.dirty:
+                continue
+            if not force and now - rule_state.written_at < ALERT_UPDATE_INTERVAL:
+                continue
+            Alert.objects.filter(open_key=rule_state.open_key).update(updated_at=timezone.now(), **rule_state.summary())
+            rule_state.dirty = False
+            rule_state.written_at = now
+
+
+alert_engine = AlertEngine()
@@ -0,0 +1,357 @@
+"""
+Cold storage for old SensorData rows.
+
+Readings are moved out of MySQL (see the archive_sensordata command) into one
+column file per sensor and month:
+
+    <SENSOR_ARCHIVE['ROOT']>/sensor_<id>/<YYYY-MM>.col
+
+a 16-byte header (magic, format version, row count) followed by the timestamp
+column (int64, microseconds since epoch, UTC) and the value column (float32), both
+little-endian and sorted by timestamp. Both columns live in the same file, so a
+month is replaced with a single rename and readers always see matching columns;
+a file whose size doesn't match its row count raises ArchiveError. Reads
+memory-map the file and binary-search the timestamp column, so a range query
+only touches the pages it needs. 'notes' is not archived.
+
+Months written by earlier versions as two files (<YYYY-MM>.ts / .val) are still
+read, with the same length check, and converted the next time they are written.
+
+sensor_readings() yields (timestamp, value) pairs; sensor_reading_chunks() yields
+the same series as numpy column chunks, for scans over very long ranges (backtests).
+"""
+import heapq
+import os
+import struct
+import sys
+from array import array
+from itertools import islice
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+
+ARCHIVE_DEFAULTS = {
+    'ROOT': Path(settings.BASE_DIR) / 'archive',
+    'MIN_AGE_DAYS': 90, # Readings older than this are moved to the archive
+}
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def archive_setting(name):
+    return getattr(settings, 'SENSOR_ARCHIVE', {}).get(name, ARCHIVE_DEFAULTS[name])
+
+
+def to_micros(timestamp):
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def month_key(timestamp):
+    return timestamp.astimezone(dt_timezone.utc).strftime('%Y-%m')
+
+
+def month_bounds(key):
+    """
+    Returns the [start, end) datetimes of a 'YYYY-MM' key.
+    """
+    start = datetime.strptime(key, '%Y-%m').replace(tzinfo=dt_timezone.utc)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+MONTH_MAGIC = b'GGAC'
+MONTH_VERSION = 1
+MONTH_HEADER = struct.Struct('<4sIQ') # magic, version, row count
+ROW_SIZE = 8 + 4 # int64 timestamp + float32 value
+
+
+class ArchiveError(Exception):
+    """
+    Raised when an archived month can't be read: bad header, or columns of different lengths.
+    """
+
+
+def sensor_dir(sensor_id):
+    return Path(archive_setting('ROOT')) / f'sensor_{sensor_id}'
+
+
+def month_path(sensor_id, key):
+    return sensor_dir(sensor_id) / f'{key}.col'
+
+
+def legacy_column_paths(sensor_id, key):
+    """
+    The two column files of a month written by earlier versions.
+    """
+    base = sensor_dir(sensor_id)
+    return base / f'{key}.ts', base / f'{key}.val'
+
+
+def _empty_columns():
+    return np.empty(0, dtype='<i8'), np.empty(0, dtype='<f4')
+
+
+def month_columns(sensor_id, key):
+    """
+    Memory-maps one archived month and returns its (timestamps, values) columns as read-only
+    numpy arrays (int64 microseconds, float32), empty if the month isn't archived.
+    Header and columns come from the same open file, so a concurrent rewrite of the month
+    can't mix two versions of it.
+    """
+    path = month_path(sensor_id, key)
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return _legacy_month_columns(sensor_id, key)
+    with f:
+        header = f.read(MONTH_HEADER.size)
+        size = os.fstat(f.fileno()).st_size
+        if len(header) < MONTH_HEADER.size:
+            raise ArchiveError(f"{path}: truncated header")
+        magic, version, count = MONTH_HEADER.unpack(header)
+        if magic != MONTH_MAGIC or version != MONTH_VERSION:
+            raise ArchiveError(f"{path}: not an archive month (version {version})")
+        if size != MONTH_HEADER.size + count * ROW_SIZE:
+            raise ArchiveError(f"{path}: {size} bytes, expected {MONTH_HEADER.size + count * ROW_SIZE} for {count} rows")
+        if not count:
+            return _empty_columns()
+        timestamps = np.memmap(f, dtype='<i8', mode='r', offset=MONTH_HEADER.size, shape=(count,))
+        values = np.memmap(f, dtype='<f4', mode='r', offset=MONTH_HEADER.size + 8 * count, shape=(count,))
+    return timestamps, values
+
+
+def _legacy_month_columns(sensor_id, key):
+    ts_path, val_path = legacy_column_paths(sensor_id, key)
+    if not ts_path.exists():
+        return _empty_columns()
+    ts_size = ts_path.stat().st_size
+    val_size = val_path.stat().st_size if val_path.exists() else -1
+    if ts_size % 8 or val_size < 0 or val_size % 4 or ts_size // 8 != val_size // 4:
+        raise ArchiveError(f"{ts_path}: {ts_size} bytes of timestamps for {val_size} bytes of values")
+    if not ts_size:
+        return _empty_columns()
+    return np.memmap(ts_path, dtype='<i8', mode='r'), np.memmap(val_path, dtype='<f4', mode='r')
+
+
+def _to_little_endian(column):
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+def load_month(sensor_id, key):
+    """
+    Reads a whole month into (timestamps, values) arrays. Used when rewriting a month.
+    """
+    timestamps, values = month_columns(sensor_id, key)
+    return array('q', timestamps.tolist()), array('f', values.tolist())
+
+
+def write_month(sensor_id, key, rows):
+    """
+    Merges rows [(micros, value), ...] into the month's file.
+    The file is written aside and renamed over the old one, so readers never see a
+    half-written month. Rows already present (same timestamp and value) are not
+    duplicated, which makes re-running the archive command after a crash safe.
+    """
+    timestamps, values = load_month(sensor_id, key)
+    merged = sorted(set(zip(timestamps, values)) | {(micros, array('f', [value])[0]) for micros, value in rows})
+
+    path = month_path(sensor_id, key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(MONTH_HEADER.pack(MONTH_MAGIC, MONTH_VERSION, len(merged)))
+        f.write(_to_little_endian(array('q', (micros for micros, _ in merged))).tobytes())
+        f.write(_to_little_endian(array('f', (value for _, value in merged))).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    for legacy_path in legacy_column_paths(sensor_id, key):
+        legacy_path.unlink(missing_ok=True) # Converted: the .col file holds the whole month
+    return len(merged)
+
+
+def _read_month_range(sensor_id, key, since_us, until_us):
+    """
+    Returns [(micros, value), ...] of one month within [since_us, until_us],
+    slicing the mapped columns without copying the whole month.
+    """
+    timestamps, values = month_columns(sensor_id, key)
+    lo = int(np.searchsorted(timestamps, since_us, side='left'))
+    hi = int(np.searchsorted(timestamps, until_us, side='right'))
+    return list(zip(timestamps[lo:hi].tolist(), values[lo:hi].tolist()))
+
+
+def month_keys(sensor_id):
+    """
+    Sorted 'YYYY-MM' keys of all archived months of a sensor.
+    """
+    base = sensor_dir(sensor_id)
+    if not base.is_dir():
+        return []
+    return sorted({path.stem for pattern in ('*.col', '*.ts') for path in base.glob(pattern)})
+
+
+def archived_months(sensor_id, since, until):
+    """
+    Lists the 'YYYY-MM' keys of archived months overlapping [since, until].
+    """
+    first, last = month_key(since), month_key(until)
+    return [key for key in month_keys(sensor_id) if first <= key <= last]
+
+
+def archived_until(sensor_id):
+    """
+    Timestamp of the newest archived reading of a sensor, None if nothing is archived.
+    """
+    for key in reversed(month_keys(sensor_id)):
+        timestamps, _ = month_columns(sensor_id, key)
+        if len(timestamps):
+            return from_micros(int(timestamps[-1]))
+    return None
+
+
+def read_range(sensor_id, since, until):
+    """
+    Yields archived (timestamp, value) pairs of a sensor within [since, until], oldest first.
+    """
+    since_us, until_us = to_micros(since), to_micros(until)
+    for key in archived_months(sensor_id, since, until):
+        for micros, value in _read_month_range(sensor_id, key, since_us, until_us):
+            yield from_micros(micros), value
+
+
+def count_range(sensor_id, since, until):
+    """
+    Number of archived readings of a sensor within [since, until] (binary search only).
+    """
+    total = 0
+    since_us, until_us = to_micros(since), to_micros(until)
+    for key in archived_months(sensor_id, since, until):
+        timestamps, _ = month_columns(sensor_id, key)
+        total += int(np.searchsorted(timestamps, until_us, side='right') - np.searchsorted(timestamps, since_us, side='left'))
+    return total
+
+
+def iter_hot_rows(sensor, since, until, chunk_size=5000):
+    """
+    Yields (timestamp, value, id) rows from the SensorData table, oldest first.
+    Rows are fetched in keyset chunks on (timestamp, id) rather than with a single
+    iterator(chunk_size=...): the MySQL drivers buffer a whole result set client-side,
+    so each chunk is its own bounded index range query and memory stays constant
+    whatever the range.
+    """
+    queryset = sensor.readings.filter(timestamp__gte=since, timestamp__lte=until).order_by('timestamp', 'id')
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(Q(timestamp__gte=last[0]) & (Q(timestamp__gt=last[0]) | Q(id__gt=last[1])))
+        fetched = 0
+        for row in chunk.values_list('timestamp', 'value', 'id')[:chunk_size].iterator(chunk_size=chunk_size):
+            fetched += 1
+            last = (row[0], row[2])
+            yield row
+        if fetched < chunk_size:
+            return
+
+
+def iter_hot_readings(sensor, since, until, chunk_size=5000):
+    """
+    Yields (timestamp, value) pairs from the SensorData table, oldest first (see iter_hot_rows).
+    """
+    for timestamp, value, _ in iter_hot_rows(sensor, since, until, chunk_size=chunk_size):
+        yield timestamp, value
+
+
+def sensor_readings(sensor, since, until, chunk_size=5000):
+    """
+    Yields (timestamp, value) pairs of a sensor within [since, until], oldest first,
+    reading through the archive and the hot SensorData table as one series.
+    """
+    hot = iter_hot_readings(sensor, since, until, chunk_size=chunk_size)
+    return heapq.merge(read_range(sensor.id, since, until), hot, key=lambda row: row[0])
+
+
+def read_range_chunks(sensor_id, since, until, chunk_size=50000):
+    """
+    Yields archived readings of a sensor within [since, until] as (timestamps_us int64, values float64)
+    arrays of at most chunk_size rows, oldest first. Only chunk_size rows are copied out of the maps at a time.
+    """
+    since_us, until_us = to_micros(since), to_micros(until)
+    for key in archived_months(sensor_id, since, until):
+        ts_column, val_column = month_columns(sensor_id, key)
+        lo = int(np.searchsorted(ts_column, since_us, side='left'))
+        hi = int(np.searchsorted(ts_column, until_us, side='right'))
+        for offset in range(lo, hi, chunk_size):
+            end = min(offset + chunk_size, hi)
+            yield np.array(ts_column[offset:end], dtype=np.int64), np.array(val_column[offset:end], dtype=np.float64)
+        del ts_column, val_column # Unmaps the file
+
+
+def hot_reading_chunks(sensor, since, until, chunk_size=50000):
+    """
+    Same as read_range_chunks for the SensorData table (keyset chunks, see iter_hot_readings).
+    """
+    rows = iter_hot_readings(sensor, since, until, chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield (
+            np.fromiter((to_micros(timestamp) for timestamp, _ in chunk), dtype=np.int64, count=len(chunk)),
+            np.fromiter((value for _, value in chunk), dtype=np.float64, count=len(chunk)),
+        )
+
+
+def merge_chunks(left, right):
+    """
+    Merges two iterators of time-ordered (timestamps, values) chunks into one time-ordered
+    chunk stream, holding at most one chunk of each side in memory.
+    """
+    sides = [iter(left), iter(right)]
+    pending = [None, None]
+    while True:
+        for i, side in enumerate(sides):
+            while side is not None and (pending[i] is None or not len(pending[i][0])):
+                pending[i] = next(side, None)
+                if pending[i] is None:
+                    side = sides[i] = None
+        live = [chunk for chunk in pending if chunk is not None and len(chunk[0])]
+        if not live:
+            return
+        if len(live) == 1: # The other side is exhausted
+            yield live[0]
+            pending = [None, None]
+            continue
+        # Everything up to the smaller of the two last timestamps can be emitted in order
+        cut = min(pending[0][0][-1], pending[1][0][-1])
+        heads = []
+        for i in (0, 1):
+            timestamps, values = pending[i]
+            split = int(np.searchsorted(timestamps, cut, side='right'))
+            heads.append((timestamps[:split], values[:split]))
+            pending[i] = (timestamps[split:], values[split:])
+        timestamps = np.concatenate([head[0] for head in heads])
+        values = np.concatenate([head[1] for head in heads])
+        order = np.argsort(timestamps, kind='stable')
+        yield timestamps[order], values[order]
+
+
+def sensor_reading_chunks(sensor, since, until, chunk_size=50000):
+    """
+    Chunked equivalent of sensor_readings(): the archive and the hot table as one
+    time-ordered series of (timestamps_us, values) numpy arrays.
+    """
+    return merge_chunks(
+        read_range_chunks(sensor.id, since, until, chunk_size=chunk_size),
+        hot_reading_chunks(sensor, since, until, chunk_size=chunk_size),
+    )
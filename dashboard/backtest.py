@@ -0,0 +1,174 @@
+# dashboard/backtest.py
+"""
+Alert backtesting: replays historical readings through one or more rule sets and
+reports what the alert engine would have done, without writing any Alert row.
+
+Readings are streamed per sensor with archive.sensor_reading_chunks (cold-storage
+archive plus keyset chunks of SensorData, as numpy columns), and each rule runs
+through alerting.scan_rule, the same vectorized state machine as bulk ingestion.
+Memory is bounded by the chunk size and the number of rules, whatever the range.
+Several rule sets (e.g. the current rules and a candidate) are evaluated in the same pass.
+"""
+from .alerting import StaticRules, scan_rule
+from .archive import from_micros, sensor_reading_chunks, to_micros
+
+
+class ReplayState:
+    """
+    Stand-in for alerting.RuleState: scan_rule only reads open_key, breaches and breach_started.
+    open_key is just an 'alert open' marker here; opened_us is when it opened.
+    """
+    __slots__ = ('open_key', 'breaches', 'breach_started', 'opened_us')
+
+    def __init__(self):
+        self.open_key = None
+        self.opened_us = None
+        self.breaches = 0
+        self.breach_started = None
+
+
+class Stat:
+    """
+    Running count / mean / max, in seconds.
+    """
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, micros):
+        seconds = micros / 1_000_000
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        return {
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'max': round(self.max, 3) if self.count else None,
+            'total': round(self.total, 3),
+        }
+
+
+class RuleReport:
+    def __init__(self, rule):
+        self.rule = rule
+        self.alerts = 0
+        self.resolved = 0
+        self.open_at_end = 0
+        self.sensors = set()
+        self.duration = Stat() # Open -> resolved
+        self.time_to_detect = Stat() # Breach start -> alert open (debouncing delay)
+
+    def as_dict(self):
+        rule = self.rule
+        return {
+            'rule_key': rule.key,
+            'rule_id': rule.rule_id,
+            'threshold': rule.threshold,
+            'hysteresis': rule.hysteresis,
+            'min_consecutive': rule.min_consecutive,
+            'min_duration': rule.min_duration,
+            'alerts': self.alerts,
+            'resolved': self.resolved,
+            'open_at_end': self.open_at_end,
+            'sensors_alerted': len(self.sensors),
+            'duration_s': self.duration.as_dict(),
+            'time_to_detect_s': self.time_to_detect.as_dict(),
+        }
+
+
+def candidate_rules(items):
+    """
+    Builds a rule set from a list of rule dicts (sensor_type, condition, threshold and optionally
+    hysteresis, min_consecutive, min_duration, severity), applied to every sensor of the type.
+    """
+    thresholds = {}
+    for item in items:
+        thresholds.setdefault(item['sensor_type'], {})[item['condition']] = {
+            'threshold': item['threshold'],
+            'message': item.get('message', ''),
+            'severity': item.get('severity', 'WARNING'),
+            'hysteresis': item.get('hysteresis', 0.0),
+            'min_consecutive': item.get('min_consecutive', 1),
+            'min_duration': item.get('min_duration', 0),
+        }
+    return StaticRules(thresholds)
+
+
+class Backtest:
+    def __init__(self, rule_sets, chunk_size=50000):
+        self.rule_sets = rule_sets # {name: object with rules_for(sensor)}
+        self.chunk_size = chunk_size
+        self.reports = {name: {} for name in rule_sets} # name -> {(rule key, rule id): RuleReport}
+        self.readings = 0
+        self.sensors = 0
+
+    def run(self, sensors, since, until):
+        """
+        Replays [since, until] for each sensor and returns the report (see as_dict).
+        """
+        self.since, self.until = since, until
+        for sensor in sensors:
+            plans = []
+            for name, source in self.rule_sets.items():
+                for rule in source.rules_for(sensor):
+                    plans.append((self.report_for(name, rule), rule, ReplayState()))
+            if not plans:
+                continue
+            self.sensors += 1
+            for timestamps, values in sensor_reading_chunks(sensor, since, until, chunk_size=self.chunk_size):
+                self.readings += len(values)
+                for report, rule, state in plans:
+                    self.advance(sensor, report, rule, state, timestamps, values)
+            for report, rule, state in plans:
+                if state.open_key is not None:
+                    report.open_at_end += 1
+        return self.as_dict()
+
+    def report_for(self, name, rule):
+        reports = self.reports[name]
+        report = reports.get((rule.key, rule.rule_id))
+        if report is None:
+            report = reports[(rule.key, rule.rule_id)] = RuleReport(rule)
+        return report
+
+    def advance(self, sensor, report, rule, state, timestamps, values):
+        _, excursions, pending = scan_rule(rule, timestamps, values, state)
+        for start, opened, closed in excursions:
+            if opened is not None:
+                if start == 0 and state.breaches and state.open_key is None:
+                    began = to_micros(state.breach_started) # Breach started in an earlier chunk
+                else:
+                    began = int(timestamps[start])
+                state.open_key = True
+                state.opened_us = int(timestamps[opened])
+                report.alerts += 1
+                report.sensors.add(sensor.id)
+                report.time_to_detect.add(state.opened_us - began)
+            if closed is not None:
+                report.resolved += 1
+                report.duration.add(int(timestamps[closed]) - state.opened_us)
+                state.open_key = state.opened_us = None
+                state.breaches, state.breach_started = 0, None
+
+        if state.open_key is None:
+            if pending is None:
+                state.breaches, state.breach_started = 0, None
+            else:
+                _, state.breaches, started_us = pending
+                state.breach_started = from_micros(started_us)
+
+    def as_dict(self):
+        return {
+            'since': self.since,
+            'until': self.until,
+            'sensors': self.sensors,
+            'readings': self.readings,
+            'rule_sets': {
+                name: sorted((report.as_dict() for report in reports.values()), key=lambda report: report['rule_key'])
+                for name, reports in self.reports.items()
+            },
+        }
@@ -0,0 +1,146 @@
+# dashboard/buffer.py
+"""
+Write-behind ingestion buffer (SENSOR_INGEST['MODE'] = 'buffered').
+
+Validated readings are acknowledged as soon as they are queued in a bounded
+in-process buffer. A background thread writes them to SensorData through
+ingest.persist_readings every FLUSH_INTERVAL_MS, or as soon as FLUSH_BATCH_SIZE
+readings are waiting. When BUFFER_CAPACITY is reached, offer() raises BufferFull
+and the API answers 429. The buffer is flushed on interpreter shutdown (atexit).
+
+Readings still queued are lost if the process is killed with SIGKILL; use the
+default 'sync' mode where every acknowledged reading must be durable.
+"""
+import atexit
+import threading
+import time
+from collections import deque
+
+from django.db import close_old_connections
+
+from . import metrics
+from .ingest import ingest_setting, persist_readings
+
+
+class BufferFull(Exception):
+    pass
+
+
+class IngestBuffer:
+    def __init__(self, capacity, flush_interval_ms, flush_batch_size):
+        self.capacity = capacity
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_batch_size = flush_batch_size
+        self._entries = deque() # (queued_at, greenhouse, reading)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='ingest-buffer-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def offer(self, greenhouse, readings):
+        """
+        Queues readings of one greenhouse, all or nothing. Raises BufferFull when they don't fit.
+        """
+        queued_at = time.monotonic()
+        with self._lock:
+            if self._stopping:
+                raise BufferFull("Ingestion buffer is shutting down.")
+            if len(self._entries) + len(readings) > self.capacity:
+                metrics.incr('ingest_buffer_rejected', len(readings))
+                raise BufferFull(f"Ingestion buffer is full ({self.capacity} readings).")
+            self._entries.extend((queued_at, greenhouse, reading) for reading in readings)
+            depth = len(self._entries)
+        metrics.incr('ingest_buffer_accepted', len(readings))
+        metrics.set_gauge('ingest_buffer_depth', depth)
+        if depth >= self.flush_batch_size:
+            self._wakeup.set()
+
+    def _take_batch(self):
+        with self._lock:
+            count = min(len(self._entries), self.flush_batch_size)
+            batch = [self._entries.popleft() for _ in range(count)]
+            metrics.set_gauge('ingest_buffer_depth', len(self._entries))
+        return batch
+
+    def flush(self):
+        """
+        Writes everything currently queued, one batch of up to FLUSH_BATCH_SIZE at a time.
+        """
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._write(batch)
+
+    def _write(self, batch):
+        by_greenhouse = {}
+        for _, greenhouse, reading in batch:
+            by_greenhouse.setdefault(greenhouse.id, (greenhouse, []))[1].append(reading)
+
+        started = time.monotonic()
+        close_old_connections()
+        for greenhouse, readings in by_greenhouse.values():
+            try:
+                persist_readings(greenhouse, readings)
+                metrics.incr('ingest_buffer_flushed', len(readings))
+            except Exception as e:
+                metrics.incr('ingest_buffer_flush_errors')
+                metrics.incr('ingest_buffer_lost', len(readings))
+                print(f"IngestBuffer: ERROR flushing {len(readings)} readings for Greenhouse ID {greenhouse.id}: {e}")
+        finished = time.monotonic()
+        close_old_connections()
+
+        metrics.observe('ingest_buffer_flush_latency_ms', (finished - started) * 1000)
+        # Time between acknowledgement and commit of the oldest reading of the batch
+        metrics.observe('ingest_buffer_write_delay_ms', (finished - batch[0][0]) * 1000)
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        """
+        Stops the flusher and writes whatever is still queued.
+        """
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+        self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_ingest_buffer():
+    """
+    Returns the process-wide buffer, starting its flusher on first use.
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = IngestBuffer(
+                capacity=ingest_setting('BUFFER_CAPACITY'),
+                flush_interval_ms=ingest_setting('FLUSH_INTERVAL_MS'),
+                flush_batch_size=ingest_setting('FLUSH_BATCH_SIZE'),
+            )
+            _buffer.start()
+        return _buffer
+
+
+def buffered_mode():
+    return ingest_setting('MODE') == 'buffered'
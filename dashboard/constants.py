@@ -48,3 +48,14 @@ ALERT_THRESHOLDS = {
     }
     # Add thresholds for other sensor types as needed
 }
+
+# Alert rules (dashboard.models.AlertRule); ALERT_THRESHOLDS above seeds the global rules
+ALERT_CONDITIONS = [
+    ('greater_than', 'Greater than'),
+    ('less_than', 'Less than'),
+]
+ALERT_SEVERITIES = [
+    ('INFO', 'Info'),
+    ('WARNING', 'Warning'),
+    ('CRITICAL', 'Critical'),
+]
@@ -1,67 +1,539 @@
 # dashboard/consumers.py
 
+import asyncio
 import json
+from collections import deque
+from datetime import datetime
+from urllib.parse import parse_qs
 # Use AsyncWebsocketConsumer for asynchronous channel layer operations
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.conf import settings
+from . import metrics
+from .dispatch import get_dispatcher, greenhouse_group
+from .frames import MAX_PUSH_INDEX, PUSH_SUBPROTOCOL, FrameError, encode_updates
+from .live_state import connect_frame, make_token
+from .models import Greenhouse
+
+
+PUSH_DEFAULTS = {
+    'DEFAULT_TICK_MS': 1000, # Sensor updates are sent at most once per tick, newest value per sensor
+    'MIN_TICK_MS': 250,
+    'MAX_TICK_MS': 5000,
+    'MAX_SUBSCRIPTIONS': 50, # Greenhouses one multiplexed socket may follow
+    'MAX_SEND_QUEUE': 100, # Frames waiting for a slow client before its SLOW_POLICY applies
+    'SLOW_POLICY': 'coalesce', # 'drop_oldest', 'coalesce' or 'disconnect'; a client may pick its own with ?on_slow=
+}
+
+SLOW_POLICIES = ('drop_oldest', 'coalesce', 'disconnect')
+SLOW_CLOSE_CODE = 4008 # Close code of sockets disconnected by the 'disconnect' policy
+
+
+def push_setting(name):
+    """
+    Reads a value from settings.WS_PUSH, falling back to PUSH_DEFAULTS.
+    """
+    return getattr(settings, 'WS_PUSH', {}).get(name, PUSH_DEFAULTS[name])
+
+
+def clamp_tick(tick_ms):
+    return max(push_setting('MIN_TICK_MS'), min(push_setting('MAX_TICK_MS'), int(tick_ms)))
+
+
+def group_metric(name, group, **labels):
+    # Frames not tied to a greenhouse (errors, tick answers) are counted under group=socket
+    return metrics.metric_name(name, group=group or 'socket', **labels)
+
+
+class Subscription:
+    """
+    One greenhouse followed by a socket: its resume position, its sensor filter
+    and the sensor updates waiting for the next tick (latest wins per sensor).
+    """
+    def __init__(self, greenhouse_id, sensors=None, sensor_types=None):
+        self.greenhouse_id = greenhouse_id
+        self.group = greenhouse_group(greenhouse_id)
+        self.sensors = sensors # Set of sensor IDs, None = no filter on IDs
+        self.sensor_types = sensor_types # Set of sensor types, None = no filter on types
+        self.epoch = None
+        self.seq = 0 # Last journal sequence number sent (see dashboard/live_state.py)
+        self.snapshot_seq = 0
+        self.pending = {} # {sensor_id: update}
+
+    @property
+    def filtered(self):
+        return self.sensors is not None or self.sensor_types is not None
+
+    def matches(self, message):
+        if not self.filtered:
+            return True
+        return ((self.sensors is not None and message['sensor_id'] in self.sensors)
+                or (self.sensor_types is not None and message.get('sensor_type') in self.sensor_types))
+
+    def is_stale(self, event):
+        """
+        True for events already included in the snapshot.
+        """
+        seq = event.get('seq')
+        return seq is not None and seq <= self.snapshot_seq
+
+    def advance(self, event):
+        """
+        Moves the resume position past an event that is sent (or deliberately filtered out).
+        """
+        seq = event.get('seq')
+        if seq is not None and seq > self.seq:
+            self.seq = seq
+
+    def start(self, frame, seq):
+        """
+        Takes the position of the snapshot frame and drops what it doesn't match.
+        """
+        self.epoch = frame['token'].rpartition('.')[0]
+        self.seq = self.snapshot_seq = seq
+        frame['greenhouse'] = self.greenhouse_id
+        if self.filtered:
+            frame['sensors'] = [message for message in frame['sensors'] if self.matches(message)]
+            frame['alerts'] = [alert for alert in frame['alerts'] if self.matches(alert)]
+        return frame
+
+    def token(self):
+        return make_token(self.epoch, self.seq)
 
 
 class GreenhouseConsumer(AsyncWebsocketConsumer): # <-- Switched to AsyncWebsocketConsumer
+    """
+    Live feed of one greenhouse: ws/greenhouses/<id>/data/?tick_ms=<250..5000>&resume=<token>
+
+    The first frame is a snapshot of the current state (dashboard/live_state.py):
+        {"type": "snapshot", "mode": "full"|"delta", "greenhouse": <id>, "token": ..., "sensors": [...], "actuators": [...], "alerts": [...]}
+    'delta' (only the sensors that changed) when the resume token of a previous connection is still valid.
+    Sensor updates are coalesced per sensor (latest wins) and sent as one frame per tick:
+        {"type": "sensor_updates", "greenhouse": <id>, "token": ..., "updates": [<sensor update>, ...]}
+    so server CPU and client render cost follow the tick rate, not the ingest rate.
+    Every frame carries the token to resume from after a reconnect.
+    Clients that offer the 'greengrow.updates.v1' sub-protocol get sensor_updates as compact
+    binary frames instead (see dashboard/frames.py); all other frames stay JSON.
+    Alerts opening / resolving and actuator status changes are sent at once as
+    "alert_opened", "alert_resolved" and "actuator_status" frames.
+    The client can change its tick at any time with {"action": "set_tick", "tick_ms": 500};
+    the server answers {"type": "tick", "tick_ms": <value actually used>}.
+
+    Slow clients: frames go through a per-socket send queue written by its own task, so
+    channel layer messages keep being consumed while a client doesn't read. Past
+    MAX_SEND_QUEUE frames the socket's policy (?on_slow=, default SLOW_POLICY) applies:
+    'drop_oldest' drops the oldest queued sensor_updates frame (other frames are never dropped:
+    the socket is disconnected if only those are queued), 'coalesce' also keeps sensor updates in the
+    per-sensor buffer (latest wins) while frames are still queued, 'disconnect' closes the
+    socket with code 4008 (the client resumes with its last token). The queue holds what the
+    ASGI server has not taken yet. Servers whose send waits for the client (uvicorn, hypercorn)
+    fill it by themselves; Daphne's send never waits, so under Daphne the writer waits instead
+    while the connection's transport buffer is full (TransportFlowMiddleware, dashboard/middleware.py),
+    which is what a client that stops reading causes.
+    Metrics: ws_sockets_connected, ws_group_sockets{group}, ws_send_queued{group} (gauges),
+    ws_dropped_frames{group,reason}, ws_slow_disconnects{group} and ws_send_waits (counters).
+    """
     async def connect(self):
         # Get greenhouse_id from the URL route
         # url_route is in self.scope['url_route']['kwargs']
         self.greenhouse_id = self.scope['url_route']['kwargs']['greenhouse_id']
-        # Define the channel group name based on the greenhouse ID
-        self.greenhouse_group_name = f'greenhouse_{self.greenhouse_id}' # <-- Get greenhouse ID and define group name
+        self.subscriptions = {} # {group name: Subscription}
+        if not self.greenhouse_id.isdigit():
+            await self.close()
+            return
+        self.setup_feed()
 
         print(f"WebSocket Connected for Greenhouse ID: {self.greenhouse_id}")
 
-        # Join the greenhouse group. Add the channel to the group.
-        await self.channel_layer.group_add( # <-- Join the group
-            self.greenhouse_group_name,
-            self.channel_name
-        )
-        print(f"WebSocket joining group: {self.greenhouse_group_name}")
+        # Accept the WebSocket connection (with the binary sub-protocol if the client offered it)
+        await self.accept(self.subprotocol)
+        print(f"WebSocket connection accepted.")
 
+        # Join the greenhouse group and send the initial state
+        await self.subscribe(Subscription(int(self.greenhouse_id)), self.query_param('resume'))
 
-        # Accept the WebSocket connection
-        await self.accept()
-        print(f"WebSocket connection accepted.")
+    def setup_feed(self):
+        # Let the fan-out dispatcher send on this event loop (required by InMemoryChannelLayer)
+        dispatcher = get_dispatcher()
+        if dispatcher is not None:
+            dispatcher.bind_loop(asyncio.get_running_loop())
+
+        self.flush_task = None
+        self.last_flush = 0.0
+        self.outbox = deque() # (group, text_data, bytes_data, droppable) waiting for the writer task
+        self.writer = None
+        self.closing = False
+        self.slow_policy = self.query_param('on_slow')
+        if self.slow_policy not in SLOW_POLICIES:
+            self.slow_policy = push_setting('SLOW_POLICY')
+        metrics.add_gauge('ws_sockets_connected', 1)
+        self.subprotocol = PUSH_SUBPROTOCOL if PUSH_SUBPROTOCOL in self.scope.get('subprotocols', []) else None
+        self.sensor_index = {} # sensor_id -> index in the binary frames (sent in sensor_dictionary frames)
+        try:
+            self.tick = clamp_tick(self.query_param('tick_ms')) / 1000.0
+        except (TypeError, ValueError):
+            self.tick = push_setting('DEFAULT_TICK_MS') / 1000.0
 
+    def query_param(self, name):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        return query.get(name, [None])[0]
+
+    async def subscribe(self, subscription, resume=None):
+        """
+        Joins the subscription's group, then sends its snapshot (joined first: nothing is missed).
+        The snapshot comes from the cached snapshot and journal, not from per-connection queries.
+        """
+        await self.channel_layer.group_add(subscription.group, self.channel_name)
+        print(f"WebSocket joining group: {subscription.group}")
+        self.subscriptions[subscription.group] = subscription
+        metrics.add_gauge(group_metric('ws_group_sockets', subscription.group), 1)
+        frame, seq = await database_sync_to_async(connect_frame)(subscription.greenhouse_id, subscription.group, resume)
+        await self.send_json(subscription.start(frame, seq), subscription.group)
+
+    async def unsubscribe(self, subscription):
+        if self.subscriptions.pop(subscription.group, None) is not None:
+            metrics.add_gauge(group_metric('ws_group_sockets', subscription.group), -1)
+        await self.channel_layer.group_discard(subscription.group, self.channel_name)
+        print(f"WebSocket left group: {subscription.group}")
 
     async def disconnect(self, close_code):
         print(f"WebSocket Disconnected for Greenhouse ID: {self.greenhouse_id} with code: {close_code}")
+        await self.stop_feed()
+
+    async def stop_feed(self):
+        if getattr(self, 'flush_task', None) is not None:
+            self.flush_task.cancel()
+        for subscription in list(getattr(self, 'subscriptions', {}).values()):
+            await self.unsubscribe(subscription)
+        if getattr(self, 'outbox', None) is not None: # Set up by setup_feed (not on rejected connects)
+            if self.writer is not None:
+                self.writer.cancel()
+            self.clear_outbox()
+            metrics.add_gauge('ws_sockets_connected', -1)
+            self.outbox = None
+
+    async def send_json(self, content, group=None):
+        await self.queue_frame(group, text_data=json.dumps(content))
+
+    async def queue_frame(self, group, text_data=None, bytes_data=None, droppable=False):
+        """
+        Puts a frame in the send queue (never waits for the client), applying the slow-client
+        policy when the queue is full, and starts the writer task if it isn't running.
+        Only droppable frames (sensor_updates, JSON or binary) are ever evicted by the policy:
+        snapshots, sensor dictionaries, alerts and actuator frames are not, and a full queue
+        with nothing droppable left disconnects the socket whatever its policy.
+        """
+        if self.closing or self.outbox is None:
+            return
+        if len(self.outbox) >= push_setting('MAX_SEND_QUEUE'):
+            if self.slow_policy == 'disconnect' or not self.evict_frame():
+                print(f"WebSocket: slow client, {len(self.outbox)} frames queued, disconnecting")
+                metrics.incr(group_metric('ws_slow_disconnects', group))
+                self.closing = True
+                self.clear_outbox('disconnect')
+                await self.close(code=SLOW_CLOSE_CODE)
+                return
+        self.outbox.append((group, text_data, bytes_data, droppable))
+        metrics.add_gauge(group_metric('ws_send_queued', group), 1)
+        if self.writer is None:
+            self.writer = asyncio.get_running_loop().create_task(self.write_frames())
+
+    def evict_frame(self):
+        """
+        Drops the oldest droppable frame of the queue. Returns False if there is none.
+        """
+        for position, (group, _, _, droppable) in enumerate(self.outbox):
+            if droppable:
+                del self.outbox[position]
+                metrics.add_gauge(group_metric('ws_send_queued', group), -1)
+                metrics.incr(group_metric('ws_dropped_frames', group, reason=self.slow_policy))
+                return True
+        return False
+
+    async def write_frames(self):
+        """
+        Writer task: hands queued frames to the ASGI server one at a time. Under Daphne it
+        first waits while the connection's send buffer is full (scope['transport_flow']), so
+        frames the client isn't reading stay in the outbox.
+        """
+        flow = self.scope.get('transport_flow')
+        try:
+            while self.outbox:
+                if flow is not None and not flow.writable.is_set():
+                    metrics.incr('ws_send_waits')
+                    await flow.writable.wait()
+                    continue # The outbox may have been cleared or trimmed meanwhile
+                group, text_data, bytes_data, _ = self.outbox.popleft()
+                metrics.add_gauge(group_metric('ws_send_queued', group), -1)
+                await self.send(text_data=text_data, bytes_data=bytes_data)
+        except Exception as e:
+            print(f"WebSocket: ERROR sending frame: {e}")
+        finally:
+            self.writer = None # Even if a send failed or the task was cancelled: the next frame starts a new one
 
-        # Leave the greenhouse group. Remove the channel from the group.
-        await self.channel_layer.group_discard( # <-- Leave the group
-            self.greenhouse_group_name,
-            self.channel_name
-        )
-        print(f"WebSocket left group: {self.greenhouse_group_name}")
+    def clear_outbox(self, reason=None):
+        while self.outbox:
+            group, _, _, _ = self.outbox.popleft()
+            metrics.add_gauge(group_metric('ws_send_queued', group), -1)
+            if reason is not None:
+                metrics.incr(group_metric('ws_dropped_frames', group, reason=reason))
 
+    async def send_error(self, error):
+        await self.send_json({'type': 'error', 'error': error})
 
     # Handler for receiving messages from the WebSocket (client to server)
-    # We might not need this for just pushing data, but keep it for potential future use
     async def receive(self, text_data):
-        # Example: Process messages sent from the frontend
-        print(f"Received message from WebSocket on group {self.greenhouse_group_name}: {text_data}")
-        # If the frontend sent data, you would process it here.
-        # e.g., command = json.loads(text_data).get('command')
-        # if command == 'request_initial_data':
-        #     await self.send_initial_data() # Example: send initial data after connection
+        """
+        Client commands, as JSON objects with an 'action', handled by the command_<action> methods.
+        """
+        try:
+            command = json.loads(text_data)
+            action = command['action']
+        except (ValueError, TypeError, KeyError):
+            await self.send_error("Expected a JSON object with an 'action'.")
+            return
+
+        handler = getattr(self, f'command_{action}', None) if isinstance(action, str) else None
+        if handler is None:
+            await self.send_error(f"Unknown action '{action}'.")
+            return
+        await handler(command)
+
+    async def command_set_tick(self, command):
+        """
+        {"action": "set_tick", "tick_ms": <250..5000>}
+        """
+        try:
+            tick_ms = clamp_tick(command['tick_ms'])
+        except (KeyError, ValueError, TypeError):
+            await self.send_error("'tick_ms' must be a number of milliseconds.")
+            return
+        self.tick = tick_ms / 1000.0
+        await self.send_json({'type': 'tick', 'tick_ms': tick_ms})
+
+    def subscription_for(self, event):
+        """
+        The subscription an event from the channel layer belongs to (the dispatcher tags events
+        with their group), or None if it was unsubscribed in the meantime.
+        """
+        return self.subscriptions.get(event.get('group'))
+
+    def queue_update(self, subscription, message):
+        """
+        Puts a sensor update in the coalescing buffer (replacing an unsent older one for the
+        same sensor) and schedules a flush at the next tick if none is pending.
+        """
+        if message['sensor_id'] in subscription.pending:
+            metrics.incr('ws_push_coalesced')
+        subscription.pending[message['sensor_id']] = message
+        if self.flush_task is None:
+            loop = asyncio.get_running_loop()
+            delay = max(0.0, self.last_flush + self.tick - loop.time())
+            self.flush_task = loop.create_task(self.flush_updates(delay))
+
+    async def flush_updates(self, delay):
+        await asyncio.sleep(delay)
+        loop = asyncio.get_running_loop()
+        if self.slow_policy == 'coalesce' and self.outbox:
+            # Client still reading older frames: keep coalescing and try again next tick
+            metrics.incr('ws_push_deferred')
+            self.flush_task = loop.create_task(self.flush_updates(self.tick))
+            return
+        self.flush_task = None
+        self.last_flush = loop.time()
+        for subscription in list(self.subscriptions.values()):
+            await self.flush_subscription(subscription)
+
+    async def flush_subscription(self, subscription):
+        if not subscription.pending:
+            return
+        updates = list(subscription.pending.values())
+        subscription.pending.clear()
+        metrics.incr('ws_push_frames')
+        metrics.incr('ws_push_updates', len(updates))
+        if self.subprotocol == PUSH_SUBPROTOCOL and await self.send_binary_updates(subscription, updates):
+            return
+        text = json.dumps({
+            'type': 'sensor_updates', 'greenhouse': subscription.greenhouse_id,
+            'token': subscription.token(), 'updates': updates,
+        })
+        metrics.incr('ws_push_bytes', len(text))
+        await self.queue_frame(subscription.group, text_data=text, droppable=True)
+
+    async def send_binary_updates(self, subscription, updates):
+        """
+        Sends updates as a binary frame, preceded by a sensor_dictionary frame for sensors
+        this socket has not seen yet. Returns False (nothing sent) if they can't be encoded.
+        """
+        new_sensors = {}
+        records = []
+        for message in updates:
+            index = self.sensor_index.get(message['sensor_id'], new_sensors.get(message['sensor_id'], {}).get('index'))
+            if index is None:
+                index = len(self.sensor_index) + len(new_sensors)
+                if index > MAX_PUSH_INDEX:
+                    return False
+                new_sensors[message['sensor_id']] = {
+                    'index': index, 'sensor_id': message['sensor_id'],
+                    'sensor_type': message['sensor_type'], 'sensor_name': message['sensor_name'],
+                }
+            reading = message['latest_reading']
+            timestamp_ms = int(datetime.fromisoformat(reading['timestamp']).timestamp() * 1000)
+            records.append((index, timestamp_ms, reading['value']))
+        try:
+            frame = encode_updates(subscription.greenhouse_id, subscription.seq, records)
+        except FrameError:
+            return False
+
+        if new_sensors:
+            # Never evicted from the send queue (see queue_frame), so the index always matches what the client got
+            for sensor_id, entry in new_sensors.items():
+                self.sensor_index[sensor_id] = entry['index']
+            await self.send_json({'type': 'sensor_dictionary', 'sensors': list(new_sensors.values())}, subscription.group)
+        metrics.incr('ws_push_bytes', len(frame))
+        await self.queue_frame(subscription.group, bytes_data=frame, droppable=True)
+        return True
+
+    async def send_event(self, event, payload_key, filter_sensor=True):
+        """
+        Sends a discrete event (alert, actuator status) at once, not coalesced. Updates
+        already waiting for the tick go out first, so frames stay in order and tokens exact.
+        """
+        subscription = self.subscription_for(event)
+        if subscription is None or subscription.is_stale(event):
+            return
+        payload = event[payload_key]
+        if filter_sensor and not subscription.matches(payload):
+            subscription.advance(event)
+            return
+        await self.flush_subscription(subscription)
+        subscription.advance(event)
+        await self.send_json({
+            'type': event['type'], 'greenhouse': subscription.greenhouse_id,
+            'token': subscription.token(), payload_key: payload,
+        }, subscription.group)
 
     # Handler for receiving messages from the channel layer (server to server/group)
     # This method name ('sensor_data_update') corresponds to the 'type' in group_send/group_receive
-    async def sensor_data_update(self, event): # <-- THIS METHOD IS NOW UNCOMMENTED AND ASYNC
+    async def sensor_data_update(self, event):
         """
-        Receives sensor data updates from the channel layer and sends them to the WebSocket.
+        Receives one sensor update from the channel layer; sent with the next tick's frame.
+        Updates the subscription doesn't match are dropped here, before any serialization.
         """
-        message = event['message']
-        print(f"Consumer received 'sensor_data_update' message for group {self.greenhouse_group_name}: {message}") # <-- Debug print here
+        subscription = self.subscription_for(event)
+        if subscription is None or subscription.is_stale(event):
+            return
+        subscription.advance(event)
+        if subscription.matches(event['message']):
+            self.queue_update(subscription, event['message'])
+
+    async def sensor_data_batch(self, event):
+        """
+        Receives one group_send per ingested batch (dashboard.ingest.process_batch),
+        one update per sensor; sent with the next tick's frame.
+        """
+        subscription = self.subscription_for(event)
+        if subscription is None or subscription.is_stale(event):
+            return
+        subscription.advance(event)
+        for message in event['messages']:
+            if subscription.matches(message):
+                self.queue_update(subscription, message)
+
+    async def dispatch_batch(self, event):
+        """
+        Receives several events for this group sent in one group_send by the fan-out
+        dispatcher (dashboard/dispatch.py) and handles each in order with its own handler.
+        """
+        for inner in event['events']:
+            handler = getattr(self, inner['type'].replace('.', '_'), None)
+            if handler is not None:
+                await handler(inner)
+
+    async def alert_opened(self, event):
+        """
+        An alert opened (dashboard.alerting): {"type": "alert_opened", "greenhouse", "token", "alert": {...}}.
+        alert.open_key identifies it until the matching alert_resolved.
+        """
+        await self.send_event(event, 'alert')
+
+    async def alert_resolved(self, event):
+        await self.send_event(event, 'alert')
+
+    async def actuator_status(self, event):
+        """
+        A new actuator status (ActuatorStatus saved): {"type": "actuator_status", "greenhouse", "token", "actuator": {...}}.
+        Not subject to sensor filters.
+        """
+        await self.send_event(event, 'actuator', filter_sensor=False)
+
+
+class MultiGreenhouseConsumer(GreenhouseConsumer):
+    """
+    One authenticated socket for several greenhouses: ws/greenhouses/?token=<JWT access token>&tick_ms=<250..5000>
+    (the token of the REST API, see dashboard/middleware.py; sockets without a valid user are closed with 4401).
+
+    Nothing is sent until the client subscribes:
+        {"action": "subscribe", "greenhouse": 3, "sensors": [15, 16], "sensor_types": ["TEMP"], "resume": <token>}
+    'sensors' and 'sensor_types' are optional filters (an update passes if it matches either);
+    without them every sensor of the greenhouse is sent. The answer is the greenhouse's snapshot
+    frame; subscribing again to the same greenhouse replaces its filters and sends a new snapshot.
+        {"action": "unsubscribe", "greenhouse": 3}   ->  {"type": "unsubscribed", "greenhouse": 3}
+    Frames are those of GreenhouseConsumer, each tagged with its "greenhouse".
+    """
+    async def connect(self):
+        self.greenhouse_id = None
+        self.subscriptions = {}
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.setup_feed()
+        await self.accept(self.subprotocol)
+        print(f"WebSocket Connected (multiplexed) for user {self.user.pk}")
+
+    async def disconnect(self, close_code):
+        print(f"WebSocket Disconnected (multiplexed) with code: {close_code}")
+        await self.stop_feed()
+
+    async def command_subscribe(self, command):
+        try:
+            greenhouse_id = int(command['greenhouse'])
+            sensors = command.get('sensors')
+            sensor_types = command.get('sensor_types')
+            sensors = None if sensors is None else {int(sensor_id) for sensor_id in sensors}
+            sensor_types = None if sensor_types is None else {str(sensor_type).upper() for sensor_type in sensor_types}
+        except (KeyError, ValueError, TypeError):
+            await self.send_error("Expected 'greenhouse' (ID) and optional 'sensors' (IDs) and 'sensor_types' lists.")
+            return
+
+        group = greenhouse_group(greenhouse_id)
+        if group not in self.subscriptions and len(self.subscriptions) >= push_setting('MAX_SUBSCRIPTIONS'):
+            await self.send_error(f"At most {push_setting('MAX_SUBSCRIPTIONS')} greenhouses per connection.")
+            return
+        if not await database_sync_to_async(self.owns_greenhouse)(greenhouse_id):
+            await self.send_error(f"Greenhouse {greenhouse_id} not found.")
+            return
+
+        previous = self.subscriptions.get(group)
+        subscription = Subscription(greenhouse_id, sensors, sensor_types)
+        if previous is not None:
+            self.subscriptions[group] = subscription # Same group: new filters, full snapshot below
+            frame, seq = await database_sync_to_async(connect_frame)(greenhouse_id, group)
+            await self.send_json(subscription.start(frame, seq), group)
+        else:
+            await self.subscribe(subscription, command.get('resume'))
 
-        # Send the message directly back to the WebSocket to the frontend
-        await self.send(text_data=json.dumps(message))
+    async def command_unsubscribe(self, command):
+        try:
+            group = greenhouse_group(int(command['greenhouse']))
+        except (KeyError, ValueError, TypeError):
+            await self.send_error("Expected 'greenhouse' (ID).")
+            return
+        subscription = self.subscriptions.get(group)
+        if subscription is not None:
+            await self.unsubscribe(subscription)
+        await self.send_json({'type': 'unsubscribed', 'greenhouse': int(command['greenhouse'])})
 
-    # Add other handler methods here if the signal sends messages with different 'type' values
-    # Example: async def alert_created(self, event): ...
\ No newline at end of file
+    def owns_greenhouse(self, greenhouse_id):
+        return Greenhouse.objects.filter(pk=greenhouse_id, user=self.user).exists()
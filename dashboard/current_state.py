@@ -0,0 +1,75 @@
+# dashboard/current_state.py
+"""
+Keeps SensorState / ActuatorState (the "current state" tables) up to date.
+
+Each write is a single conditional UPDATE that only applies when the new
+timestamp is not older than the stored one, so out-of-order or concurrent
+writers can never move a sensor back in time. The row is inserted on first use.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import SensorData, SensorState, ActuatorState
+
+
+def _upsert_latest(model, key, timestamp, fields):
+    """
+    Stores fields for key if timestamp is the newest seen. Returns True if the state changed.
+    """
+    if model.objects.filter(timestamp__lte=timestamp, **key).update(timestamp=timestamp, **fields):
+        return True
+    try:
+        with transaction.atomic(): # Savepoint: the row may already exist with a newer timestamp
+            model.objects.create(timestamp=timestamp, **key, **fields)
+        return True
+    except IntegrityError:
+        # Either a newer state is stored (nothing to do) or a concurrent insert won the race
+        return bool(model.objects.filter(timestamp__lte=timestamp, **key).update(timestamp=timestamp, **fields))
+
+
+def record_sensor_reading(reading):
+    """
+    Records a SensorData instance as its sensor's current state if it is the newest reading.
+    """
+    return _upsert_latest(
+        SensorState, {'sensor_id': reading.sensor_id}, reading.timestamp,
+        {'reading_id': reading.pk, 'value': reading.value, 'notes': reading.notes},
+    )
+
+
+def record_sensor_readings(latest_readings):
+    """
+    Batch variant: expects at most one reading per sensor (the newest of the batch).
+    """
+    latest_readings = list(latest_readings)
+    resolve_reading_ids([reading for reading in latest_readings if reading.pk is None])
+    for reading in latest_readings:
+        record_sensor_reading(reading)
+
+
+def resolve_reading_ids(readings):
+    """
+    Sets the pk of bulk-inserted readings on backends where bulk_create can't return it
+    (MySQL), with one query matching (sensor, timestamp). If a sensor has several rows
+    with that timestamp, the last inserted one is taken.
+    """
+    if not readings:
+        return
+    condition = Q()
+    for reading in readings:
+        condition |= Q(sensor_id=reading.sensor_id, timestamp=reading.timestamp)
+    ids = {}
+    for pk, sensor_id, timestamp in SensorData.objects.filter(condition).values_list('id', 'sensor_id', 'timestamp'):
+        ids[sensor_id, timestamp] = max(pk, ids.get((sensor_id, timestamp), pk))
+    for reading in readings:
+        reading.pk = ids.get((reading.sensor_id, reading.timestamp))
+
+
+def record_actuator_status(status):
+    """
+    Records an ActuatorStatus instance as its actuator's current state if it is the newest status.
+    """
+    return _upsert_latest(
+        ActuatorState, {'actuator_id': status.actuator_id}, status.timestamp,
+        {'status_id': status.pk, 'status_value': status.status_value},
+    )
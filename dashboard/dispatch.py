@@ -0,0 +1,262 @@
+# dashboard/dispatch.py
+"""
+WebSocket fan-out dispatcher.
+
+Events for the greenhouse groups are published after the transaction that produced
+them commits (transaction.on_commit), so clients are never told about rows that
+roll back, and publishing only appends to a bounded in-process queue: the request
+or ingestion thread never waits for the channel layer.
+
+A background thread drains the queue every FLUSH_INTERVAL_MS (or as soon as
+MAX_BATCH events are waiting) and sends one group_send per group per flush:
+a single event as is, several as a 'dispatch_batch' event that the consumer
+unpacks in order. All groups of a flush are sent concurrently in one event-loop hop.
+
+Sends run on the ASGI server's event loop when a consumer has registered it
+(InMemoryChannelLayer's queues belong to that loop), otherwise on the thread's own loop.
+When the queue is full the oldest event is dropped, so a stalled channel layer
+costs stale updates rather than memory. Before sending, events get a sequence number for
+resume tokens; they are journaled for resuming clients (dashboard/live_state.py) only once
+their group_send succeeded. Metrics (dashboard/metrics.py):
+    ws_dispatch_queued              gauge, events waiting
+    ws_dispatch_sent                counter, events handed to the channel layer
+    ws_dispatch_dropped{reason=...} counter, 'overflow' (queue full) or 'error' (send failed)
+    ws_dispatch_lag_ms              histogram, commit -> group_send done, per event
+    ws_dispatch_flush_ms            histogram, duration of one flush
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import threading
+import time
+from collections import deque
+from functools import partial
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from . import metrics
+from .live_state import reserve_sequence, write_journal
+
+
+DISPATCH_DEFAULTS = {
+    'CAPACITY': 10000, # Events queued before the oldest are dropped
+    'FLUSH_INTERVAL_MS': 25,
+    'MAX_BATCH': 500, # Events taken per flush
+    'SEND_TIMEOUT_S': 5.0,
+}
+
+
+def dispatch_setting(name):
+    """
+    Reads a value from settings.WS_DISPATCH, falling back to DISPATCH_DEFAULTS.
+    """
+    return getattr(settings, 'WS_DISPATCH', {}).get(name, DISPATCH_DEFAULTS[name])
+
+
+def greenhouse_group(greenhouse_id):
+    return f'greenhouse_{greenhouse_id}'
+
+
+def publish_to_greenhouse(greenhouse_id, event):
+    """
+    Publishes an event to a greenhouse's sockets after commit.
+    Returns False when no channel layer is configured.
+    """
+    dispatcher = get_dispatcher()
+    if dispatcher is None:
+        return False
+    dispatcher.publish(greenhouse_group(greenhouse_id), event)
+    return True
+
+
+class FanoutDispatcher:
+    def __init__(self, channel_layer, capacity, flush_interval_ms, max_batch, send_timeout):
+        self.channel_layer = channel_layer
+        self.capacity = capacity
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch = max_batch
+        self.send_timeout = send_timeout
+        self._entries = deque() # (queued_at, group, event)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._own_loop = None
+        self.server_loop = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='ws-fanout-dispatcher', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def bind_loop(self, loop):
+        """
+        Registers the event loop the consumers run on; sends are scheduled on it from then on.
+        """
+        self.server_loop = loop
+
+    def enqueue(self, group, event):
+        """
+        Queues one event for a group. Never blocks; drops the oldest event when full.
+        """
+        with self._lock:
+            if self._stopping:
+                metrics.incr(metrics.metric_name('ws_dispatch_dropped', reason='shutdown'))
+                return
+            if len(self._entries) >= self.capacity:
+                self._entries.popleft()
+                metrics.incr(metrics.metric_name('ws_dispatch_dropped', reason='overflow'))
+            self._entries.append((time.monotonic(), group, event))
+            depth = len(self._entries)
+        metrics.set_gauge('ws_dispatch_queued', depth)
+        if depth >= self.max_batch:
+            self._wakeup.set()
+
+    def publish(self, group, event):
+        """
+        Queues the event once the current transaction commits (immediately in autocommit).
+        """
+        transaction.on_commit(partial(self.enqueue, group, event))
+
+    def _take_batch(self):
+        with self._lock:
+            count = min(len(self._entries), self.max_batch)
+            batch = [self._entries.popleft() for _ in range(count)]
+            metrics.set_gauge('ws_dispatch_queued', len(self._entries))
+        return batch
+
+    def flush(self):
+        """
+        Sends everything currently queued, MAX_BATCH events at a time.
+        """
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._send(batch)
+
+    def _send(self, batch):
+        by_group = {} # group -> [(queued_at, event)], in publication order
+        for queued_at, group, event in batch:
+            by_group.setdefault(group, []).append((queued_at, event))
+
+        started = time.monotonic()
+        epochs = {} # group -> journal epoch of its sequence numbers
+        for group, entries in by_group.items():
+            for _, event in entries:
+                event['group'] = group # Lets sockets subscribed to several groups route the event
+            try:
+                epochs[group] = reserve_sequence(group, [event for _, event in entries]) # Sets event['seq'] for resume tokens
+            except Exception as e:
+                print(f"FanoutDispatcher: ERROR numbering events for group {group}: {e}")
+        try:
+            failed = self._run_coroutine(self._send_groups(by_group))
+        except Exception as e:
+            print(f"FanoutDispatcher: ERROR sending {len(batch)} events: {e}")
+            failed = set(by_group)
+        finished = time.monotonic()
+
+        sent = 0
+        for group, entries in by_group.items():
+            if group in failed:
+                # Not journaled: resuming clients must not be replayed what live clients never got
+                metrics.incr(metrics.metric_name('ws_dispatch_dropped', reason='error'), len(entries))
+                continue
+            if group in epochs:
+                try:
+                    write_journal(group, epochs[group], [event for _, event in entries])
+                except Exception as e:
+                    print(f"FanoutDispatcher: ERROR journaling events for group {group}: {e}")
+            sent += len(entries)
+            for queued_at, _ in entries:
+                metrics.observe('ws_dispatch_lag_ms', (finished - queued_at) * 1000)
+        metrics.incr('ws_dispatch_sent', sent)
+        metrics.observe('ws_dispatch_flush_ms', (finished - started) * 1000)
+
+    async def _send_groups(self, by_group):
+        """
+        One group_send per group, all groups concurrently. Returns the groups whose send failed.
+        """
+        groups = list(by_group)
+        results = await asyncio.gather(
+            *(self.channel_layer.group_send(group, self.batch_event(by_group[group])) for group in groups),
+            return_exceptions=True,
+        )
+        failed = set()
+        for group, result in zip(groups, results):
+            if isinstance(result, Exception):
+                print(f"FanoutDispatcher: ERROR sending to channel layer group {group}: {result}")
+                failed.add(group)
+        return failed
+
+    def batch_event(self, entries):
+        if len(entries) == 1:
+            return entries[0][1]
+        return {
+            'type': 'dispatch_batch', # Handled by GreenhouseConsumer.dispatch_batch
+            'group': entries[0][1]['group'],
+            'events': [event for _, event in entries],
+        }
+
+    def _run_coroutine(self, coroutine):
+        loop = self.server_loop
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+            try:
+                return future.result(self.send_timeout)
+            except concurrent.futures.TimeoutError:
+                future.cancel() # Otherwise the sends stay pending on a stalled channel layer
+                raise
+        if self._own_loop is None:
+            self._own_loop = asyncio.new_event_loop()
+        return self._own_loop.run_until_complete(asyncio.wait_for(coroutine, self.send_timeout))
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        """
+        Stops the dispatcher thread and sends whatever is still queued.
+        """
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """
+    Returns the process-wide dispatcher, starting its thread on first use.
+    None when no channel layer is configured.
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            channel_layer = get_channel_layer()
+            if channel_layer is None:
+                return None
+            _dispatcher = FanoutDispatcher(
+                channel_layer,
+                capacity=dispatch_setting('CAPACITY'),
+                flush_interval_ms=dispatch_setting('FLUSH_INTERVAL_MS'),
+                max_batch=dispatch_setting('MAX_BATCH'),
+                send_timeout=dispatch_setting('SEND_TIMEOUT_S'),
+            )
+            _dispatcher.start()
+        return _dispatcher
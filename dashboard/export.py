@@ -0,0 +1,114 @@
+# dashboard/export.py
+"""
+Streaming export of sensor history as CSV or NDJSON, optionally gzipped.
+
+Everything here is a generator: rows come from archive.sensor_readings (keyset
+chunks of the live table merged with the cold-storage archive) and are encoded
+into ~64 KB blocks, so memory use is constant whatever the size of the export.
+Under ASGI the blocks must come from an async iterator (aexport_stream): Django's
+ASGI handler reads a sync iterator to the end before sending its first byte.
+"""
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+
+from .archive import sensor_readings
+
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+CSV_HEADER = ['sensor_id', 'sensor_name', 'sensor_type', 'timestamp', 'value']
+BLOCK_SIZE = 64 * 1024
+
+
+def export_rows(sensors, since, until, chunk_size=5000):
+    """
+    Yields (sensor, timestamp, value) for each sensor in turn, oldest reading first.
+    """
+    for sensor in sensors:
+        for timestamp, value in sensor_readings(sensor, since, until, chunk_size=chunk_size):
+            yield sensor, timestamp, value
+
+
+def _blocks(lines):
+    """
+    Groups small encoded lines into blocks of about BLOCK_SIZE bytes.
+    """
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= BLOCK_SIZE:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def csv_lines(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(CSV_HEADER)
+    for sensor, timestamp, value in rows:
+        writer.writerow([sensor.id, sensor.name, sensor.type, timestamp.isoformat(), value])
+        yield out.getvalue().encode('utf-8')
+        out.seek(0)
+        out.truncate()
+    if out.getvalue(): # Header only, if there were no rows
+        yield out.getvalue().encode('utf-8')
+
+
+def ndjson_lines(rows):
+    for sensor, timestamp, value in rows:
+        yield (json.dumps({
+            'sensor_id': sensor.id,
+            'sensor_type': sensor.type,
+            'timestamp': timestamp.isoformat(),
+            'value': value,
+        }, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def gzip_stream(blocks, level=6):
+    """
+    Compresses a stream of byte blocks into a gzip stream, block by block.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # wbits=31: gzip container
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(sensors, since, until, output='csv', compress=False):
+    """
+    Returns an iterator of byte blocks for StreamingHttpResponse.
+    """
+    rows = export_rows(sensors, since, until)
+    lines = csv_lines(rows) if output == 'csv' else ndjson_lines(rows)
+    blocks = _blocks(lines)
+    return gzip_stream(blocks) if compress else blocks
+
+
+async def aexport_stream(sensors, since, until, output='csv', compress=False):
+    """
+    Async iterator over the blocks of export_stream(), for StreamingHttpResponse under ASGI.
+    Each block, and the keyset chunk behind it, is read in the request's sync thread
+    (where its database connection lives) and sent before the next one is read.
+    """
+    blocks = export_stream(sensors, since, until, output=output, compress=compress)
+    next_block = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            block = await next_block(blocks, None)
+            if block is None:
+                return
+            yield block
+    finally:
+        # Client gone or export done: release the generator's cursor in that thread too
+        await sync_to_async(blocks.close, thread_sensitive=True)()
@@ -0,0 +1,175 @@
+# dashboard/ingest.py
+"""
+Batch ingestion of sensor readings for one greenhouse.
+
+Rows are written with bulk_create (which does not send post_save), then alert
+evaluation (vectorized) and the WebSocket push run once per batch in process_batch().
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import SensorData
+from .rollups import update_rollups
+from .current_state import record_sensor_readings
+from .serializers import SensorReadingIngestSerializer
+from .signals import build_sensor_update, push_to_greenhouse
+from .alerting import alert_engine
+from .archive import to_micros
+from .frames import MAX_TIMESTAMP_MS
+
+
+INGEST_DEFAULTS = {
+    'MAX_BATCH_SIZE': 5000, # Items accepted in one request
+    'BULK_CREATE_BATCH_SIZE': 1000, # Rows per INSERT statement
+    'MODE': 'sync', # 'sync': commit before responding, 'buffered': write-behind (dashboard/buffer.py)
+    'BUFFER_CAPACITY': 50000, # Readings queued before the API answers 429
+    'FLUSH_INTERVAL_MS': 200,
+    'FLUSH_BATCH_SIZE': 2000,
+}
+
+
+def ingest_setting(name):
+    """
+    Reads a value from settings.SENSOR_INGEST, falling back to INGEST_DEFAULTS.
+    """
+    return getattr(settings, 'SENSOR_INGEST', {}).get(name, INGEST_DEFAULTS[name])
+
+
+def validate_readings(greenhouse, items):
+    """
+    Validates raw items against the greenhouse's sensors.
+    Returns (readings, errors): unsaved SensorData instances and a list of
+    {'index': ..., 'errors': ...} for the items that were rejected.
+    """
+    sensors = {sensor.id: sensor for sensor in greenhouse.sensors.all()}
+    received_at = timezone.now()
+    readings, errors = [], []
+
+    for index, item in enumerate(items):
+        serializer = SensorReadingIngestSerializer(data=item, context={'sensors': sensors})
+        if not serializer.is_valid():
+            errors.append({'index': index, 'errors': serializer.errors})
+            continue
+        data = serializer.validated_data
+        readings.append(SensorData(
+            sensor=data['sensor'],
+            value=data['value'],
+            timestamp=data.get('timestamp') or received_at,
+            notes=data['notes'],
+        ))
+    return readings, errors
+
+
+def validate_frame(greenhouse, frame):
+    """
+    Validates a decoded binary ReadingFrame (vectorized: unknown sensors, non-finite
+    values and timestamps past year 9999 are found with numpy masks, not per-record checks).
+    Returns (readings, errors) like validate_readings.
+    """
+    sensors = {sensor.id: sensor for sensor in greenhouse.sensors.all()}
+    known = np.isin(frame.sensor_ids, np.fromiter(sensors, dtype=np.int64, count=len(sensors)))
+    finite = np.isfinite(frame.values)
+    in_range = frame.timestamps_ms <= MAX_TIMESTAMP_MS # decode_frame bounds base_ms, offsets can still overflow it
+
+    errors = [{'index': int(i), 'errors': {'sensor': ["Unknown sensor for this greenhouse."]}} for i in np.flatnonzero(~known)]
+    errors += [{'index': int(i), 'errors': {'value': ["Value must be a finite number."]}} for i in np.flatnonzero(known & ~finite)]
+    errors += [{'index': int(i), 'errors': {'timestamp': ["Timestamp is out of range."]}} for i in np.flatnonzero(known & finite & ~in_range)]
+    errors.sort(key=lambda error: error['index'])
+
+    valid = known & finite & in_range
+    epoch = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    readings = [
+        SensorData(sensor=sensors[sensor_id], value=value, timestamp=epoch + timedelta(milliseconds=timestamp_ms))
+        for sensor_id, value, timestamp_ms in zip(
+            frame.sensor_ids[valid].tolist(), frame.values[valid].tolist(), frame.timestamps_ms[valid].tolist()
+        )
+    ]
+    return readings, errors
+
+
+def persist_readings(greenhouse, readings):
+    """
+    Inserts the readings with bulk INSERTs, folds them into the rollups and the
+    current-state table in the same transaction and schedules process_batch()
+    once it commits. Returns the list of saved readings.
+    """
+    if not readings:
+        return []
+    with transaction.atomic():
+        created = SensorData.objects.bulk_create(readings, batch_size=ingest_setting('BULK_CREATE_BATCH_SIZE'))
+        update_rollups(created)
+        record_sensor_readings(latest_per_sensor(created).values())
+        transaction.on_commit(lambda: process_batch(greenhouse, created))
+    return created
+
+
+def latest_per_sensor(readings):
+    """
+    Returns {sensor_id: reading} keeping the newest reading of each sensor in the batch.
+    """
+    latest = {}
+    for reading in readings:
+        current = latest.get(reading.sensor_id)
+        if current is None or reading.timestamp >= current.timestamp:
+            latest[reading.sensor_id] = reading
+    return latest
+
+
+def evaluate_batch_alerts(readings):
+    """
+    Runs the batch's readings through the alert engine as columns (vectorized, see alerting.evaluate_batch).
+    """
+    count = len(readings)
+    sensors = {reading.sensor_id: reading.sensor for reading in readings}
+    try:
+        alert_engine.evaluate_batch(
+            sensors,
+            np.fromiter((reading.sensor_id for reading in readings), dtype=np.int64, count=count),
+            np.fromiter((to_micros(reading.timestamp) for reading in readings), dtype=np.int64, count=count),
+            np.fromiter((reading.value for reading in readings), dtype=np.float64, count=count),
+        )
+    except Exception as e:
+        print(f"evaluate_batch_alerts: ERROR evaluating alerts for {count} readings: {e}")
+
+
+def process_batch(greenhouse, readings):
+    """
+    Post-insert work for a batch: alert evaluation over all readings at once,
+    then a single group_send carrying the newest update of each sensor.
+    """
+    evaluate_batch_alerts(readings)
+
+    latest = latest_per_sensor(readings)
+    updates = []
+    for reading in latest.values():
+        updates.append(build_sensor_update(reading.sensor, reading.value, reading.timestamp))
+
+    if updates:
+        push_to_greenhouse(greenhouse.id, {
+            'type': 'sensor_data_batch', # Handled by GreenhouseConsumer.sensor_data_batch
+            'messages': updates,
+        })
+
+
+def ingest_readings(greenhouse, items):
+    """
+    Validates and stores a batch of raw items for one greenhouse.
+    Invalid items are reported, valid ones are still saved.
+    Returns (created_readings, errors).
+    """
+    readings, errors = validate_readings(greenhouse, items)
+    created = persist_readings(greenhouse, readings)
+    return created, errors
+
+
+def ingest_frame(greenhouse, frame):
+    """
+    Same as ingest_readings, for a decoded binary ReadingFrame.
+    """
+    readings, errors = validate_frame(greenhouse, frame)
+    created = persist_readings(greenhouse, readings)
+    return created, errors
@@ -0,0 +1,279 @@
+# dashboard/live_state.py
+"""
+Connect-time state for the live feed: a cached snapshot plus a short journal of
+recent events, so (re)connecting sockets are painted without per-connection ORM queries.
+
+Every event the fan-out dispatcher sends to a greenhouse group gets a per-group sequence
+number before the send, and is journaled in Django's cache once the send succeeded (one
+incr + one set_many per group and flush, in the dispatcher thread): events live clients
+never got leave a gap, and a client resuming across it gets a full snapshot instead.
+Events carry their 'seq', and the consumer hands the client a resume token "<epoch>.<seq>"
+with every frame.
+
+On connect the consumer sends one 'snapshot' frame:
+- with a valid ?resume= token, the journal entries after it, folded per sensor and
+  actuator, with the alerts opened and resolved since (mode 'delta'), when they are all
+  still in the journal;
+- otherwise the cached greenhouse snapshot (current state tables + open alerts, built
+  at most once per SNAPSHOT_TTL_S per greenhouse and process) with the journal entries
+  written since it was built folded in (mode 'full').
+Both carry the token to resume from. The epoch changes whenever the sequence counter
+is lost (cache cleared or evicted), which invalidates older tokens.
+
+The cache must be shared (CACHE_URL) for tokens to work across processes.
+"""
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Alert, ActuatorState, SensorState
+
+
+LIVE_STATE_DEFAULTS = {
+    'SNAPSHOT_TTL_S': 30, # Cached snapshot lifetime; the journal covers what happened since
+    'JOURNAL_TTL_S': 300, # How long a disconnected client can resume with a delta
+    'MAX_REPLAY': 1000, # Journal entries folded into one frame before falling back to a new snapshot
+    'SNAPSHOT_ALERTS': 100, # Newest open alerts included
+}
+
+
+def live_state_setting(name):
+    """
+    Reads a value from settings.LIVE_STATE, falling back to LIVE_STATE_DEFAULTS.
+    """
+    return getattr(settings, 'LIVE_STATE', {}).get(name, LIVE_STATE_DEFAULTS[name])
+
+
+def _seq_key(group):
+    return f'live_seq:{group}'
+
+
+def _epoch_key(group):
+    return f'live_epoch:{group}'
+
+
+def _journal_key(group, epoch, seq):
+    return f'live_journal:{group}:{epoch}:{seq}'
+
+
+def _snapshot_key(group):
+    return f'live_snapshot:{group}'
+
+
+def make_token(epoch, seq):
+    return f'{epoch}.{seq}'
+
+
+def parse_token(token):
+    """
+    Returns (epoch, seq) from a resume token, or None if it is malformed.
+    """
+    epoch, _, seq = (token or '').rpartition('.')
+    if not epoch or not seq.isdigit():
+        return None
+    return epoch, int(seq)
+
+
+def current_position(group):
+    """
+    Returns (epoch, seq) of the last journaled event of the group, starting a new epoch if needed.
+    """
+    epoch = cache.get(_epoch_key(group))
+    seq = cache.get(_seq_key(group))
+    if epoch is None or seq is None:
+        return _new_epoch(group)
+    return epoch, seq
+
+
+def _new_epoch(group):
+    epoch = uuid.uuid4().hex[:12]
+    cache.set(_epoch_key(group), epoch, timeout=None)
+    cache.set(_seq_key(group), 0, timeout=None)
+    return epoch, 0
+
+
+def reserve_sequence(group, events):
+    """
+    Assigns consecutive sequence numbers to events (sets event['seq']) without journaling
+    them yet. Returns the epoch they belong to.
+    """
+    epoch = cache.get(_epoch_key(group))
+    try:
+        if epoch is None:
+            raise ValueError
+        last = cache.incr(_seq_key(group), len(events))
+    except ValueError: # Counter lost: tokens of the old epoch can no longer be trusted
+        epoch, _ = _new_epoch(group)
+        last = cache.incr(_seq_key(group), len(events))
+
+    for seq, event in enumerate(events, start=last - len(events) + 1):
+        event['seq'] = seq
+    return epoch
+
+
+def write_journal(group, epoch, events):
+    """
+    Keeps events numbered by reserve_sequence() in the journal for JOURNAL_TTL_S.
+    Events never written leave a gap that replay() treats as expired.
+    """
+    cache.set_many(
+        {_journal_key(group, epoch, event['seq']): event for event in events},
+        timeout=live_state_setting('JOURNAL_TTL_S'),
+    )
+
+
+def journal_events(group, events):
+    """
+    reserve_sequence() and write_journal() in one go. Returns the epoch.
+    """
+    epoch = reserve_sequence(group, events)
+    write_journal(group, epoch, events)
+    return epoch
+
+
+def replay(group, epoch, after, until):
+    """
+    Journal events with after < seq <= until, or None if any of them has expired.
+    """
+    if until - after > live_state_setting('MAX_REPLAY'):
+        return None
+    if until <= after:
+        return []
+    keys = [_journal_key(group, epoch, seq) for seq in range(after + 1, until + 1)]
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return [found[key] for key in keys]
+
+
+def alert_key(alert):
+    return alert.get('open_key') or f"id:{alert.get('id')}"
+
+
+def new_state(base=None):
+    """
+    Mutable state events are folded into: sensors by ID, actuators by ID, open alerts by key.
+    """
+    base = base or {'sensors': {}, 'actuators': [], 'alerts': []}
+    return {
+        'sensors': dict(base['sensors']),
+        'actuators': {actuator['actuator_id']: actuator for actuator in base['actuators']},
+        'alerts': {alert_key(alert): alert for alert in base['alerts']},
+        'resolved': set(),
+    }
+
+
+def fold_events(state, events):
+    """
+    Applies journaled events to a state from new_state() (latest wins per sensor and actuator).
+    """
+    for event in events:
+        if event['type'] == 'sensor_data_update':
+            state['sensors'][event['message']['sensor_id']] = event['message']
+        elif event['type'] == 'sensor_data_batch':
+            for message in event['messages']:
+                state['sensors'][message['sensor_id']] = message
+        elif event['type'] == 'actuator_status':
+            state['actuators'][event['actuator']['actuator_id']] = event['actuator']
+        elif event['type'] == 'alert_opened':
+            key = alert_key(event['alert'])
+            state['alerts'][key] = event['alert']
+            state['resolved'].discard(key)
+        elif event['type'] == 'alert_resolved':
+            key = alert_key(event['alert'])
+            if state['alerts'].pop(key, None) is None:
+                state['resolved'].add(key)
+    return state
+
+
+def build_snapshot(greenhouse_id):
+    """
+    Current state of a greenhouse from the current-state tables (three queries).
+    Sensor entries have the same shape as live sensor updates.
+    """
+    sensors = {}
+    for sensor_id, value, timestamp, sensor_type, name in SensorState.objects.filter(
+            sensor__greenhouse_id=greenhouse_id).values_list('sensor_id', 'value', 'timestamp', 'sensor__type', 'sensor__name'):
+        sensors[sensor_id] = {
+            'sensor_id': sensor_id,
+            'latest_reading': {'value': value, 'timestamp': timestamp.isoformat()},
+            'sensor_type': sensor_type,
+            'sensor_name': name,
+        }
+
+    actuators = [
+        {'actuator_id': actuator_id, 'status_value': status_value, 'timestamp': timestamp.isoformat(),
+         'actuator_type': actuator_type, 'name': name}
+        for actuator_id, status_value, timestamp, actuator_type, name in ActuatorState.objects.filter(
+            actuator__greenhouse_id=greenhouse_id).values_list('actuator_id', 'status_value', 'timestamp', 'actuator__actuator_type', 'actuator__name')
+    ]
+
+    alerts = [
+        {'id': alert_id, 'open_key': open_key, 'sensor_id': sensor_id, 'sensor_type': sensor_type, 'rule_key': rule_key,
+         'severity': severity, 'message': message, 'created_at': created_at.isoformat(), 'peak_value': peak_value}
+        for alert_id, open_key, sensor_id, sensor_type, rule_key, severity, message, created_at, peak_value in Alert.objects.filter(
+            greenhouse_id=greenhouse_id, is_resolved=False).order_by('-created_at').values_list(
+            'id', 'open_key', 'sensor_id', 'sensor__type', 'rule_key', 'severity', 'message', 'created_at', 'peak_value',
+        )[:live_state_setting('SNAPSHOT_ALERTS')]
+    ]
+    return {'sensors': sensors, 'actuators': actuators, 'alerts': alerts}
+
+
+_build_locks = {}
+_build_locks_lock = threading.Lock()
+
+
+def cached_snapshot(greenhouse_id, group):
+    """
+    Returns (epoch, seq, state) from the cache, building it at most once per TTL per process
+    so a reconnect storm costs one set of queries per greenhouse, not one per socket.
+    """
+    key = _snapshot_key(group)
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        return snapshot
+    with _build_locks_lock:
+        lock = _build_locks.setdefault(group, threading.Lock())
+    with lock:
+        snapshot = cache.get(key)
+        if snapshot is None:
+            # Position first: events journaled while querying are replayed on top (idempotent)
+            epoch, seq = current_position(group)
+            snapshot = (epoch, seq, build_snapshot(greenhouse_id))
+            cache.set(key, snapshot, timeout=live_state_setting('SNAPSHOT_TTL_S'))
+    return snapshot
+
+
+def connect_frame(greenhouse_id, group, token=None):
+    """
+    The 'snapshot' frame sent on connect (see module docstring). Returns (frame, seq).
+    """
+    epoch, seq = current_position(group)
+    resume = parse_token(token)
+    if resume is not None and resume[0] == epoch and resume[1] <= seq:
+        events = replay(group, epoch, resume[1], seq)
+        if events is not None:
+            state = fold_events(new_state(), events)
+            return {
+                'type': 'snapshot', 'mode': 'delta', 'token': make_token(epoch, seq),
+                'sensors': list(state['sensors'].values()),
+                'actuators': list(state['actuators'].values()),
+                'alerts': list(state['alerts'].values()), # Opened since the token
+                'resolved_alerts': sorted(state['resolved']), # Keys of alerts resolved since the token
+            }, seq
+
+    snapshot_epoch, snapshot_seq, base = cached_snapshot(greenhouse_id, group)
+    events = replay(group, epoch, snapshot_seq, seq) if snapshot_epoch == epoch else None
+    if events is None: # Snapshot too old for the journal (or from an older epoch): rebuild
+        cache.delete(_snapshot_key(group))
+        snapshot_epoch, snapshot_seq, base = cached_snapshot(greenhouse_id, group)
+        epoch, seq, events = snapshot_epoch, snapshot_seq, []
+    state = fold_events(new_state(base), events)
+    return {
+        'type': 'snapshot', 'mode': 'full', 'token': make_token(epoch, seq),
+        'sensors': list(state['sensors'].values()),
+        'actuators': list(state['actuators'].values()),
+        'alerts': list(state['alerts'].values()),
+    }, seq
@@ -0,0 +1,80 @@
+# dashboard/management/commands/archive_sensordata.py
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from dashboard.archive import archive_setting, iter_hot_rows, month_key, to_micros, write_month
+from dashboard.models import Sensor, SensorData
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves SensorData rows older than --older-than-days out of the database into per-sensor, "
+        "per-month column files (see dashboard/archive.py). Rollups are kept, and the history "
+        "endpoints read archived and live rows as one series."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help="Minimum age of archived readings (default: SENSOR_ARCHIVE['MIN_AGE_DAYS'])")
+        parser.add_argument('--sensor', type=int, action='append', help="Sensor ID (repeatable). Default: all sensors")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows fetched / deleted per query")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be archived")
+
+    def handle(self, *args, **options):
+        days = options['older_than_days'] or archive_setting('MIN_AGE_DAYS')
+        cutoff = timezone.now() - timedelta(days=days)
+        self.chunk_size = options['chunk_size']
+        self.dry_run = options['dry_run']
+
+        sensors = Sensor.objects.all()
+        if options['sensor']:
+            sensors = sensors.filter(pk__in=options['sensor'])
+
+        total = 0
+        for sensor in sensors.iterator():
+            archived = self.archive_sensor(sensor, cutoff)
+            if archived:
+                self.stdout.write(f"Sensor {sensor.id} ({sensor.name}): {archived} readings {'to archive' if self.dry_run else 'archived'}")
+            total += archived
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} readings older than {cutoff:%Y-%m-%d %H:%M} {'would be' if self.dry_run else 'were'} archived."
+        ))
+
+    def archive_sensor(self, sensor, cutoff):
+        """
+        Streams the sensor's old readings in timestamp order (keyset chunks on
+        (timestamp, id), so memory stays bounded on MySQL) and writes them out one month at a time.
+        """
+        since = datetime.min.replace(tzinfo=dt_timezone.utc)
+        readings = iter_hot_rows(sensor, since, cutoff - timedelta(microseconds=1), chunk_size=self.chunk_size)
+
+        archived = 0
+        current_key, ids, rows = None, [], []
+        for timestamp, value, reading_id in readings:
+            key = month_key(timestamp)
+            if key != current_key and ids:
+                archived += self.flush_month(sensor, current_key, ids, rows)
+                ids, rows = [], []
+            current_key = key
+            ids.append(reading_id)
+            rows.append((to_micros(timestamp), value))
+        if ids:
+            archived += self.flush_month(sensor, current_key, ids, rows)
+        return archived
+
+    def flush_month(self, sensor, key, ids, rows):
+        """
+        Writes one month to disk first, then deletes exactly the rows that were written.
+        A crash in between leaves rows in both places; write_month ignores those duplicates on re-run.
+        """
+        if self.dry_run:
+            return len(ids)
+        write_month(sensor.id, key, rows)
+        for offset in range(0, len(ids), self.chunk_size):
+            with transaction.atomic():
+                SensorData.objects.filter(pk__in=ids[offset:offset + self.chunk_size]).delete()
+        return len(ids)
@@ -0,0 +1,75 @@
+# dashboard/management/commands/backtest_alerts.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from dashboard.alerting import alert_engine
+from dashboard.backtest import Backtest, candidate_rules
+from dashboard.models import Sensor
+from dashboard.serializers import CandidateRuleSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays historical readings (archive + SensorData, streamed in chunks) through the current alert rules "
+        "and optionally a candidate rule set, and reports alert counts, durations and time-to-detect. "
+        "No Alert rows are written. Example candidate file: "
+        '[{"sensor_type": "TEMP", "condition": "greater_than", "threshold": 32, "hysteresis": 1, "min_consecutive": 3}]'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', required=True, help="ISO 8601 start of the replayed range")
+        parser.add_argument('--until', help="ISO 8601 end of the range. Default: now")
+        parser.add_argument('--greenhouse', type=int, action='append', help="Greenhouse ID (repeatable). Default: all")
+        parser.add_argument('--sensor', type=int, action='append', help="Sensor ID (repeatable)")
+        parser.add_argument('--rules', help="JSON file with a list of candidate rules")
+        parser.add_argument('--chunk-size', type=int, default=50000, help="Readings per chunk")
+        parser.add_argument('--json', action='store_true', help="Print the full report as JSON")
+
+    def handle(self, *args, **options):
+        since = self.parse_time(options['since'], '--since')
+        until = self.parse_time(options['until'], '--until') if options['until'] else timezone.now()
+
+        sensors = Sensor.objects.order_by('id')
+        if options['greenhouse']:
+            sensors = sensors.filter(greenhouse_id__in=options['greenhouse'])
+        if options['sensor']:
+            sensors = sensors.filter(pk__in=options['sensor'])
+
+        rule_sets = {'current': alert_engine.rules}
+        if options['rules']:
+            with open(options['rules']) as f:
+                serializer = CandidateRuleSerializer(data=json.load(f), many=True)
+            if not serializer.is_valid():
+                raise CommandError(f"Invalid candidate rules: {serializer.errors}")
+            rule_sets['candidate'] = candidate_rules(serializer.validated_data)
+
+        report = Backtest(rule_sets, chunk_size=options['chunk_size']).run(sensors.iterator(), since, until)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, cls=DjangoJSONEncoder))
+            return
+        self.stdout.write(f"{report['readings']} readings of {report['sensors']} sensors, {since:%Y-%m-%d %H:%M} to {until:%Y-%m-%d %H:%M}")
+        for name, rules in report['rule_sets'].items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name} rules"))
+            for rule in rules:
+                duration, detect = rule['duration_s'], rule['time_to_detect_s']
+                self.stdout.write(
+                    f"  {rule['rule_key']:<22} threshold {rule['threshold']:<8g} "
+                    f"alerts {rule['alerts']:>6} (resolved {rule['resolved']}, open {rule['open_at_end']}, "
+                    f"{rule['sensors_alerted']} sensors)  "
+                    f"duration mean {self.seconds(duration['mean'])} max {self.seconds(duration['max'])}  "
+                    f"time-to-detect mean {self.seconds(detect['mean'])}"
+                )
+
+    def parse_time(self, value, option):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f"{option}: expected an ISO 8601 datetime.")
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+    def seconds(self, value):
+        return '-' if value is None else f"{value:.0f}s"
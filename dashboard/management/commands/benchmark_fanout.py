@@ -0,0 +1,194 @@
+# dashboard/management/commands/benchmark_fanout.py
+import asyncio
+import json
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+GROUP = 'benchmark_fanout'
+LATENCY_SAMPLE = 50000 # Latencies sent back per worker for the percentiles
+
+
+async def receive_messages(layer, channel, messages, timeout):
+    """
+    Receives up to `messages` benchmark messages on one channel.
+    Returns (latencies in seconds, time of the last message).
+    """
+    latencies = []
+    last = 0.0
+    for _ in range(messages):
+        try:
+            message = await asyncio.wait_for(layer.receive(channel), timeout)
+        except asyncio.TimeoutError:
+            break
+        last = time.time()
+        latencies.append(last - message['sent_at'])
+    return latencies, last
+
+
+async def join_sockets(layer, sockets):
+    # One channel per simulated socket, as a consumer gets on connect
+    channels = [await layer.new_channel() for _ in range(sockets)]
+    for channel in channels:
+        await layer.group_add(GROUP, channel)
+    return channels
+
+
+async def receive_all(layer, channels, messages, timeout):
+    results = await asyncio.gather(*(receive_messages(layer, channel, messages, timeout) for channel in channels))
+    for channel in channels:
+        await layer.group_discard(GROUP, channel)
+    latencies = np.fromiter((latency for channel_latencies, _ in results for latency in channel_latencies), dtype=np.float64)
+    return latencies, max((last for _, last in results), default=0.0)
+
+
+def sample(latencies):
+    if len(latencies) > LATENCY_SAMPLE:
+        return np.random.default_rng().choice(latencies, LATENCY_SAMPLE, replace=False)
+    return latencies
+
+
+def fanout_worker(index, sockets, messages, timeout, ready, results):
+    """
+    Worker process: joins `sockets` channels to the benchmark group and receives on all of them.
+    """
+    import django
+    django.setup()
+
+    async def run():
+        layer = get_channel_layer()
+        channels = await join_sockets(layer, sockets)
+        ready.put(index)
+        latencies, last = await receive_all(layer, channels, messages, timeout)
+        results.put((index, len(latencies), last, sample(latencies)))
+
+    asyncio.run(run())
+
+
+async def publish(layer, messages, rate):
+    """
+    Sends `messages` group_sends at `rate` per second. Returns the time of the first send.
+    """
+    first = time.time()
+    for seq in range(messages):
+        await layer.group_send(GROUP, {'type': 'benchmark.message', 'seq': seq, 'sent_at': time.time()})
+        await asyncio.sleep(max(0.0, first + (seq + 1) / rate - time.time()))
+    return first
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures channel layer fan-out: one publisher does group_send at a fixed rate to a group joined by "
+        "N simulated sockets spread over W worker processes, and reports delivered messages per second and "
+        "end-to-end latency (group_send -> receive). Needs a multi-process layer (CHANNEL_LAYER_URL, e.g. a "
+        "local Redis); with the in-memory layer only an in-process baseline is run (its cost grows with the "
+        "square of the socket count, keep it to a few thousand sockets)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16], help="Worker process counts")
+        parser.add_argument('--sockets', type=int, nargs='+', default=[1000, 10000], help="Total sockets per run")
+        parser.add_argument('--messages', type=int, default=100, help="group_sends per run")
+        parser.add_argument('--rate', type=float, default=20.0, help="group_sends per second")
+        parser.add_argument('--timeout', type=float, default=10.0, help="Seconds a socket waits for its next message")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        layer = get_channel_layer()
+        if layer is None:
+            raise CommandError("No channel layer configured.")
+        in_memory = isinstance(layer, InMemoryChannelLayer)
+        backend = settings.CHANNEL_LAYERS['default']['BACKEND']
+        if in_memory:
+            self.stderr.write(
+                "In-memory channel layer: it does not cross processes, running an in-process baseline only. "
+                "Set CHANNEL_LAYER_URL=redis://127.0.0.1:6379/0 to benchmark worker processes."
+            )
+
+        results = []
+        for sockets in options['sockets']:
+            for workers in ([0] if in_memory else options['workers']):
+                result = self.run_scenario(workers, sockets, options)
+                results.append(result)
+                if not options['json']:
+                    self.print_result(result)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'backend': backend, 'results': results}, indent=2))
+
+    def run_scenario(self, workers, sockets, options):
+        messages, rate, timeout = options['messages'], options['rate'], options['timeout']
+        if workers == 0:
+            count, first, last, latencies = asyncio.run(self.run_in_process(sockets, messages, rate, timeout))
+        else:
+            count, first, last, latencies = self.run_processes(workers, sockets, messages, rate, timeout)
+
+        expected = sockets * messages
+        elapsed = last - first if count else 0.0
+
+        def percentile(q):
+            return round(float(np.percentile(latencies, q)) * 1000, 2) if len(latencies) else None
+
+        return {
+            'workers': workers,
+            'sockets': sockets,
+            'group_sends': messages,
+            'delivered': count,
+            'lost': expected - count,
+            'messages_per_s': round(count / elapsed, 1) if elapsed > 0 else None,
+            'latency_ms': {'p50': percentile(50), 'p95': percentile(95), 'p99': percentile(99), 'max': percentile(100)},
+        }
+
+    async def run_in_process(self, sockets, messages, rate, timeout):
+        layer = get_channel_layer()
+        channels = await join_sockets(layer, sockets)
+        receiving = asyncio.ensure_future(receive_all(layer, channels, messages, timeout))
+        first = await publish(layer, messages, rate)
+        latencies, last = await receiving
+        return len(latencies), first, last, latencies
+
+    def run_processes(self, workers, sockets, messages, rate, timeout):
+        context = multiprocessing.get_context('spawn') # Fresh interpreters: no event loop or connection inherited
+        ready, results = context.Queue(), context.Queue()
+        share, extra = divmod(sockets, workers)
+        processes = [
+            context.Process(target=fanout_worker, args=(index, share + (index < extra), messages, timeout, ready, results))
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for _ in processes:
+                ready.get(timeout=300)
+        except queue.Empty:
+            for process in processes:
+                process.terminate()
+            raise CommandError("Worker processes did not join the group in time.")
+
+        first = asyncio.run(publish(get_channel_layer(), messages, rate))
+
+        count, last, samples = 0, 0.0, []
+        for _ in processes:
+            _, delivered, worker_last, latencies = results.get(timeout=messages / rate + timeout * 2 + 60)
+            count += delivered
+            last = max(last, worker_last)
+            samples.append(latencies)
+        for process in processes:
+            process.join()
+        return count, first, last, np.concatenate(samples)
+
+    def print_result(self, result):
+        latency = result['latency_ms']
+        workers = 'in-process' if result['workers'] == 0 else f"{result['workers']} worker(s)"
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{result['sockets']} sockets, {workers}"))
+        self.stdout.write(
+            f"  delivered {result['delivered']} of {result['sockets'] * result['group_sends']} "
+            f"({result['lost']} lost), {result['messages_per_s']} msg/s\n"
+            f"  latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}"
+        )
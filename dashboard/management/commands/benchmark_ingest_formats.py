@@ -0,0 +1,89 @@
+# dashboard/management/commands/benchmark_ingest_formats.py
+import gzip
+import io
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+
+from dashboard.frames import encode_frame
+from dashboard.ingest import validate_frame, validate_readings
+from dashboard.models import Greenhouse
+from dashboard.parsers import SensorFrameParser
+from dashboard.serializers import SensorDataSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares bytes on the wire and parse+validate time of the ingestion formats: "
+        "per-reading JSON through SensorDataSerializer, the bulk JSON array, and the binary frame. "
+        "Nothing is written to the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('greenhouse', type=int, help="Greenhouse whose sensors are used")
+        parser.add_argument('--readings', type=int, default=5000, help="Readings per batch")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per format")
+
+    def handle(self, *args, **options):
+        try:
+            greenhouse = Greenhouse.objects.get(pk=options['greenhouse'])
+        except Greenhouse.DoesNotExist:
+            raise CommandError("Greenhouse not found.")
+        sensor_ids = list(greenhouse.sensors.values_list('id', flat=True))
+        if not sensor_ids:
+            raise CommandError("Greenhouse has no sensors.")
+
+        start = timezone.now() - timedelta(hours=1)
+        samples = [
+            (random.choice(sensor_ids), start + timedelta(milliseconds=250 * i), round(random.uniform(0, 100), 2))
+            for i in range(options['readings'])
+        ]
+        items = [
+            {'sensor': sensor_id, 'value': value, 'timestamp': timestamp.isoformat(), 'notes': ''}
+            for sensor_id, timestamp, value in samples
+        ]
+        per_reading_bodies = [json.dumps(item).encode('utf-8') for item in items]
+        json_body = json.dumps(items).encode('utf-8')
+        frame_body = encode_frame(
+            (sensor_id, int(timestamp.timestamp() * 1000), value) for sensor_id, timestamp, value in samples
+        )
+
+        def per_reading_json():
+            # Current path: one POST per reading through SensorDataSerializer (one sensor lookup each)
+            for body in per_reading_bodies:
+                data = JSONParser().parse(io.BytesIO(body))
+                SensorDataSerializer(data=data).is_valid(raise_exception=True)
+
+        def bulk_json():
+            validate_readings(greenhouse, JSONParser().parse(io.BytesIO(json_body)))
+
+        def binary_frame():
+            validate_frame(greenhouse, SensorFrameParser().parse(io.BytesIO(frame_body)))
+
+        n = options['readings']
+        per_reading_bytes = sum(len(body) for body in per_reading_bodies)
+        formats = [
+            ('JSON per reading (SensorDataSerializer)', per_reading_json, per_reading_bytes, per_reading_bytes),
+            ('JSON bulk array', bulk_json, len(json_body), len(gzip.compress(json_body))),
+            ('Binary frame', binary_frame, len(frame_body), len(gzip.compress(frame_body))),
+        ]
+
+        self.stdout.write(f"{n} readings over {len(sensor_ids)} sensors, {options['repeat']} runs each\n")
+        for label, run, wire_bytes, gzip_bytes in formats:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - started)
+            median = statistics.median(timings)
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(
+                f"  bytes: {wire_bytes} ({wire_bytes / n:.1f}/reading), gzip: {gzip_bytes}\n"
+                f"  parse+validate: {median * 1000:.1f} ms median ({median / n * 1e6:.2f} us/reading)"
+            )
@@ -0,0 +1,122 @@
+# dashboard/management/commands/benchmark_queries.py
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from dashboard.models import User, Greenhouse, Sensor, SensorData, Actuator, ActuatorStatus, Alert
+
+
+BENCH_USERNAME = 'benchmark_queries'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a large dataset and reports the EXPLAIN plan and latency of the hot queries: "
+        "SensorSerializer.get_latest_reading, ActuatorSerializer.get_latest_status and the "
+        "alert lookups done by check_sensor_alert."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readings', type=int, default=2_000_000, help="SensorData rows to seed")
+        parser.add_argument('--statuses', type=int, default=500_000, help="ActuatorStatus rows to seed")
+        parser.add_argument('--alerts', type=int, default=200_000, help="Alert rows to seed (mostly resolved)")
+        parser.add_argument('--batch-size', type=int, default=10_000, help="Rows per bulk INSERT")
+        parser.add_argument('--repeat', type=int, default=50, help="Timed runs per query")
+        parser.add_argument('--skip-seed', action='store_true', help="Reuse the data seeded by a previous run")
+        parser.add_argument('--cleanup', action='store_true', help="Delete the benchmark user and its data, then exit")
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            deleted, _ = User.objects.filter(username=BENCH_USERNAME).delete()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} benchmark rows."))
+            return
+
+        greenhouse = self.get_greenhouse()
+        if not options['skip_seed']:
+            self.seed(greenhouse, options)
+
+        sensor = greenhouse.sensors.filter(type='TEMP').first() or greenhouse.sensors.first()
+        actuator = greenhouse.actuators.first()
+        if sensor is None or actuator is None:
+            raise CommandError("Benchmark greenhouse has no sensor or actuator.")
+
+        self.stdout.write(f"Database vendor: {connection.vendor}")
+        self.stdout.write(f"Rows: SensorData={SensorData.objects.count()}, ActuatorStatus={ActuatorStatus.objects.count()}, Alert={Alert.objects.count()}")
+
+        # Same querysets as the serializers and check_sensor_alert
+        queries = [
+            ('SensorSerializer.get_latest_reading', sensor.readings.order_by('-timestamp')[:1]),
+            ('ActuatorSerializer.get_latest_status', actuator.statuses.order_by('-timestamp')[:1]),
+            ('check_sensor_alert: open alerts for sensor', Alert.objects.filter(sensor=sensor, is_resolved=False)[:1]),
+            ('alert engine: upsert conflict target', Alert.objects.filter(open_key=Alert.make_open_key(sensor.id, 'TEMP:greater_than'))[:1]),
+            ('GreenhouseOverview: open alert messages', greenhouse.alerts.filter(is_resolved=False).values_list('message', flat=True)[:100]),
+        ]
+        for label, queryset in queries:
+            self.report(label, queryset, options['repeat'])
+
+    def get_greenhouse(self):
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        greenhouse = Greenhouse.objects.filter(user=user).first()
+        if greenhouse is None:
+            # post_save signals create the default sensors and actuators
+            greenhouse = Greenhouse.objects.create(user=user, name='Benchmark', location='benchmark')
+        return greenhouse
+
+    def seed(self, greenhouse, options):
+        batch_size = options['batch_size']
+        sensors = list(greenhouse.sensors.all())
+        actuators = list(greenhouse.actuators.all())
+        start = timezone.now() - timedelta(seconds=10 * options['readings'])
+
+        self.stdout.write(f"Seeding {options['readings']} readings over {len(sensors)} sensors...")
+        self.bulk_seed(SensorData, options['readings'], batch_size, lambda i: SensorData(
+            sensor=sensors[i % len(sensors)],
+            value=20.0 + (i % 150) / 10.0,
+            timestamp=start + timedelta(seconds=10 * i),
+        ))
+
+        self.stdout.write(f"Seeding {options['statuses']} actuator statuses over {len(actuators)} actuators...")
+        self.bulk_seed(ActuatorStatus, options['statuses'], batch_size, lambda i: ActuatorStatus(
+            actuator=actuators[i % len(actuators)],
+            status_value='on' if i % 2 else 'off',
+        ))
+
+        self.stdout.write(f"Seeding {options['alerts']} alerts...")
+        self.bulk_seed(Alert, options['alerts'], batch_size, lambda i: Alert(
+            greenhouse=greenhouse,
+            sensor=sensors[i % len(sensors)],
+            message=f"{sensors[i % len(sensors)].type} benchmark alert {i}",
+            severity='WARNING',
+            is_resolved=i % 100 != 0, # Keep ~1% open
+        ))
+
+    def bulk_seed(self, model, total, batch_size, make_row):
+        started = time.perf_counter()
+        for offset in range(0, total, batch_size):
+            rows = [make_row(i) for i in range(offset, min(offset + batch_size, total))]
+            model.objects.bulk_create(rows, batch_size=batch_size)
+        self.stdout.write(f"  {model.__name__}: {total} rows in {time.perf_counter() - started:.1f}s")
+
+    def report(self, label, queryset, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n{label}"))
+        self.stdout.write(str(queryset.query))
+
+        plan = queryset.explain()
+        self.stdout.write(plan)
+        if 'filesort' in plan.lower() or ' ALL ' in f" {plan} ":
+            self.stdout.write(self.style.WARNING("  Plan uses a full scan or filesort."))
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset._chain()) # Fresh clone each run so the result cache is not reused
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+        self.stdout.write(self.style.SUCCESS(
+            f"  median {statistics.median(timings):.3f} ms, p95 {p95:.3f} ms, max {timings[-1]:.3f} ms ({repeat} runs)"
+        ))
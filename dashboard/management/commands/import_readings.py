@@ -0,0 +1,76 @@
+# dashboard/management/commands/import_readings.py
+import csv
+import gzip
+import io
+import json
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.ingest import ingest_readings
+from dashboard.models import Greenhouse
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfills readings of one greenhouse from a CSV or NDJSON file (the export formats, optionally gzipped), "
+        "e.g. a day of readings kept by an offline gateway. Rows go through the bulk ingestion path in chunks: "
+        "bulk INSERTs, rollups, and vectorized alert evaluation per chunk. "
+        "Readings of each sensor must be in time order across the file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('greenhouse', type=int)
+        parser.add_argument('path', help="File with a .csv or .ndjson extension, optionally followed by .gz")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Readings per transaction")
+
+    def handle(self, *args, **options):
+        try:
+            greenhouse = Greenhouse.objects.get(pk=options['greenhouse'])
+        except Greenhouse.DoesNotExist:
+            raise CommandError("Greenhouse not found.")
+
+        path = options['path']
+        name = path[:-3] if path.endswith('.gz') else path
+        if name.endswith('.csv'):
+            parse = self.csv_items
+        elif name.endswith(('.ndjson', '.jsonl')):
+            parse = self.ndjson_items
+        else:
+            raise CommandError("Expected a .csv or .ndjson file.")
+
+        opener = gzip.open if path.endswith('.gz') else open
+        created = rejected = seen = 0
+        with opener(path, 'rb') as raw:
+            items = parse(io.TextIOWrapper(raw, encoding='utf-8', newline=''))
+            while True:
+                chunk = list(islice(items, options['chunk_size']))
+                if not chunk:
+                    break
+                saved, errors = ingest_readings(greenhouse, chunk)
+                created += len(saved)
+                rejected += len(errors)
+                for error in errors[:5]:
+                    self.stderr.write(f"  rejected item {seen + error['index']}: {error['errors']}")
+                seen += len(chunk)
+                self.stdout.write(f"{created} readings imported...")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} readings into {greenhouse.name}, {rejected} rejected."))
+
+    def csv_items(self, lines):
+        for row in csv.DictReader(lines):
+            yield {'sensor': row.get('sensor_id') or row.get('sensor'), 'timestamp': row['timestamp'], 'value': row['value']}
+
+    def ndjson_items(self, lines):
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield {} # Reported as an invalid item
+                continue
+            if 'sensor_id' in item:
+                item['sensor'] = item.pop('sensor_id')
+            item.pop('sensor_type', None)
+            yield item
@@ -0,0 +1,337 @@
+# dashboard/management/commands/loadtest_websockets.py
+import asyncio
+import contextlib
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from dashboard import metrics
+from dashboard.frames import PUSH_SUBPROTOCOL, decode_updates
+from dashboard.models import User, Greenhouse, Sensor, SensorData
+from dashboard.routing import websocket_urlpatterns
+
+
+LOADTEST_USERNAME = 'loadtest_websockets'
+RESULTS_FILE = 'loadtest_websockets.jsonl'
+CONNECT_BATCH = 200 # Sockets connected concurrently
+LATENCY_SAMPLE = 100000
+
+# Readings are drawn from ranges that cross the default alert thresholds, so alerts open and resolve
+VALUE_RANGES = {
+    'TEMP': (8.0, 32.0),
+    'AIR_HUM': (25.0, 85.0),
+    'CO2': (400.0, 1100.0),
+    'LIGHT': (150.0, 1200.0),
+}
+DEFAULT_RANGE = (0.0, 100.0)
+
+
+def timestamp_ms(timestamp):
+    return int(timestamp.timestamp() * 1000)
+
+
+class SimulatedIngest(threading.Thread):
+    """
+    Saves one SensorData row at a time at a fixed rate (so check_sensor_alert runs for each)
+    and records when each reading was saved, keyed by (sensor ID, timestamp in ms).
+    """
+    def __init__(self, sensors, rate, duration):
+        super().__init__(name='loadtest-ingest', daemon=True)
+        self.sensors = sensors
+        self.rate = rate
+        self.duration = duration
+        self.sent = {} # (sensor_id, timestamp_ms) -> time.monotonic() before the save
+        self.errors = 0
+
+    def run(self):
+        start = time.monotonic()
+        count = int(self.rate * self.duration)
+        timestamp = None
+        try:
+            for seq in range(count):
+                sensor = self.sensors[seq % len(self.sensors)]
+                low, high = VALUE_RANGES.get(sensor.type, DEFAULT_RANGE)
+                # Distinct millisecond timestamps, so each reading can be matched when it is pushed
+                now = timezone.now()
+                now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+                timestamp = now if timestamp is None or now > timestamp else timestamp + timedelta(milliseconds=1)
+                self.sent[(sensor.id, timestamp_ms(timestamp))] = time.monotonic()
+                try:
+                    SensorData.objects.create(sensor=sensor, value=round(random.uniform(low, high), 2), timestamp=timestamp)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"loadtest: ERROR saving reading for Sensor ID {sensor.id}: {e}")
+                time.sleep(max(0.0, start + (seq + 1) / self.rate - time.monotonic()))
+        finally:
+            close_old_connections()
+
+
+class SimulatedClient:
+    """
+    One dashboard connection: reads every frame the consumer sends and matches pushed
+    sensor updates with the ingest's send times.
+    """
+    def __init__(self, communicator, sent):
+        self.communicator = communicator
+        self.sent = sent
+        self.sensor_index = {} # Binary frames: index -> sensor_id
+        self.frames = 0
+        self.updates = 0
+        self.bytes = 0
+        self.closed = None
+        self.latencies = []
+
+    async def read(self):
+        # Read the output queue directly: receive_output() cancels the application on timeout
+        queue = self.communicator.output_queue
+        while True:
+            message = await queue.get()
+            if message['type'] == 'websocket.close':
+                self.closed = message.get('code')
+                return
+            received = time.monotonic()
+            self.frames += 1
+            if message.get('bytes') is not None:
+                self.bytes += len(message['bytes'])
+                self.binary_updates(message['bytes'], received)
+            else:
+                self.bytes += len(message['text'])
+                self.json_frame(json.loads(message['text']), received)
+
+    def json_frame(self, frame, received):
+        if frame['type'] == 'sensor_dictionary':
+            for entry in frame['sensors']:
+                self.sensor_index[entry['index']] = entry['sensor_id']
+        elif frame['type'] == 'sensor_updates':
+            for update in frame['updates']:
+                timestamp = datetime.fromisoformat(update['latest_reading']['timestamp'])
+                self.record(update['sensor_id'], timestamp_ms(timestamp), received)
+
+    def binary_updates(self, data, received):
+        _, _, base_ms, records = decode_updates(data)
+        for index, offset_ms in zip(records['index'].tolist(), records['offset_ms'].tolist()):
+            self.record(self.sensor_index.get(index), base_ms + offset_ms, received)
+
+    def record(self, sensor_id, reading_ms, received):
+        self.updates += 1
+        sent = self.sent.get((sensor_id, reading_ms))
+        if sent is not None:
+            self.latencies.append(received - sent)
+
+
+def setup_greenhouses(count):
+    """
+    Returns the sensors of `count` load test greenhouses, creating the missing ones
+    (post_save signals give each the default sensors and actuators).
+    """
+    user, _ = User.objects.get_or_create(username=LOADTEST_USERNAME)
+    existing = Greenhouse.objects.filter(user=user).count()
+    for index in range(existing, count):
+        Greenhouse.objects.create(user=user, name=f'Load test {index}', location='loadtest')
+    greenhouses = list(Greenhouse.objects.filter(user=user).order_by('id')[:count])
+    sensors = list(Sensor.objects.filter(greenhouse__in=greenhouses).select_related('greenhouse').order_by('id'))
+    return [greenhouse.id for greenhouse in greenhouses], sensors
+
+
+async def connect_clients(application, greenhouse_ids, connections, tick_ms, binary, sent):
+    subprotocols = [PUSH_SUBPROTOCOL] if binary else None
+    clients = []
+    for offset in range(0, connections, CONNECT_BATCH):
+        batch = [
+            SimulatedClient(WebsocketCommunicator(
+                application, f'/ws/greenhouses/{greenhouse_ids[index % len(greenhouse_ids)]}/data/?tick_ms={tick_ms}',
+                subprotocols=subprotocols,
+            ), sent)
+            for index in range(offset, min(offset + CONNECT_BATCH, connections))
+        ]
+        results = await asyncio.gather(*(client.communicator.connect(timeout=30) for client in batch))
+        if not all(connected for connected, _ in results):
+            raise CommandError("A WebSocket connection was refused.")
+        clients.extend(batch)
+    return clients
+
+
+async def run_load_test(greenhouses=50, connections=2000, rate=200.0, duration=20.0, tick_ms=250, binary=False, settle=2.0):
+    """
+    Runs one load test against the ASGI WebSocket application in this process and returns
+    its result dict. Usable from tests (async_to_sync(run_load_test)(connections=50, ...)).
+    """
+    greenhouse_ids, sensors = await sync_to_async(setup_greenhouses)(greenhouses)
+    application = URLRouter(websocket_urlpatterns)
+    ingest = SimulatedIngest(sensors, rate, duration)
+    metrics.reset()
+
+    # Memory per connection: Python allocations while the sockets connect and get their snapshot
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    clients = await connect_clients(application, greenhouse_ids, connections, tick_ms, binary, ingest.sent)
+    readers = [asyncio.ensure_future(client.read()) for client in clients]
+    await asyncio.sleep(settle) # Snapshots delivered
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    for client in clients:
+        client.frames = client.updates = client.bytes = 0
+
+    started = time.monotonic()
+    ingest.start()
+    await asyncio.to_thread(ingest.join)
+    await asyncio.sleep(settle + tick_ms / 1000.0) # Last tick flushed
+    elapsed = time.monotonic() - started
+
+    for reader in readers:
+        reader.cancel()
+    await asyncio.gather(*(client.communicator.disconnect() for client in clients if client.closed is None), return_exceptions=True)
+
+    latencies = np.fromiter((latency for client in clients for latency in client.latencies), dtype=np.float64)
+    if len(latencies) > LATENCY_SAMPLE:
+        latencies = np.random.default_rng().choice(latencies, LATENCY_SAMPLE, replace=False)
+
+    def percentile(q):
+        return round(float(np.percentile(latencies, q)) * 1000, 2) if len(latencies) else None
+
+    frames = sum(client.frames for client in clients)
+    counters = metrics.snapshot()['counters']
+    return {
+        'greenhouses': len(greenhouse_ids),
+        'connections': connections,
+        'rate': rate,
+        'duration_s': duration,
+        'tick_ms': tick_ms,
+        'binary': binary,
+        'readings': len(ingest.sent),
+        'ingest_errors': ingest.errors,
+        'frames': frames,
+        'updates': sum(client.updates for client in clients),
+        'messages_per_s': round(frames / elapsed, 1),
+        'bytes_per_s': round(sum(client.bytes for client in clients) / elapsed, 1),
+        'latency_ms': {'p50': percentile(50), 'p95': percentile(95), 'p99': percentile(99), 'max': percentile(100)},
+        'memory_per_connection_kib': round(memory / connections / 1024, 1),
+        'dropped_frames': sum(value for name, value in counters.items() if name.startswith('ws_dropped_frames')),
+        'dispatch_dropped': sum(value for name, value in counters.items() if name.startswith('ws_dispatch_dropped')),
+        'closed_sockets': sum(1 for client in clients if client.closed is not None),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests the live feed: opens N dashboard WebSocket connections (channels.testing.WebsocketCommunicator, "
+        "in process) spread over G greenhouses of a dedicated user while a thread saves readings at a fixed rate, "
+        "so check_sensor_alert, the alert engine, the fan-out dispatcher and the consumers all run. Reports push "
+        "latency (reading saved -> update received) percentiles, frames per second and memory per connection, and "
+        "appends the result with the current commit to loadtest_results/loadtest_websockets.jsonl; --compare prints "
+        "the change against the previous result with the same parameters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--greenhouses', type=int, default=50)
+        parser.add_argument('--connections', type=int, default=2000)
+        parser.add_argument('--rate', type=float, default=200.0, help="Readings saved per second (over all sensors)")
+        parser.add_argument('--duration', type=float, default=20.0, help="Seconds of ingest")
+        parser.add_argument('--tick-ms', type=int, default=250, help="Tick requested by the clients")
+        parser.add_argument('--binary', action='store_true', help="Negotiate the binary sub-protocol")
+        parser.add_argument('--output', default=os.path.join(settings.BASE_DIR, 'loadtest_results'), help="Results directory")
+        parser.add_argument('--label', default='', help="Free text stored with the result")
+        parser.add_argument('--compare', action='store_true', help="Compare with the previous result with the same parameters")
+        parser.add_argument('--no-save', action='store_true', help="Don't store the result")
+        parser.add_argument('--verbose', action='store_true', help="Keep the per-reading and per-connection log lines")
+        parser.add_argument('--json', action='store_true', help="Print the result as JSON")
+        parser.add_argument('--cleanup', action='store_true', help="Delete the load test user and its data, then exit")
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            deleted, _ = User.objects.filter(username=LOADTEST_USERNAME).delete()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} load test rows."))
+            return
+        if options['greenhouses'] < 1 or options['connections'] < 1 or options['rate'] <= 0:
+            raise CommandError("--greenhouses, --connections and --rate must be positive.")
+
+        # The signal receivers, dispatcher and consumers print a line per reading and connection
+        quiet = contextlib.nullcontext() if options['verbose'] else contextlib.redirect_stdout(open(os.devnull, 'w'))
+        with quiet:
+            result = asyncio.run(run_load_test(
+                greenhouses=options['greenhouses'], connections=options['connections'], rate=options['rate'],
+                duration=options['duration'], tick_ms=options['tick_ms'], binary=options['binary'],
+            ))
+        result.update({'commit': git_commit(), 'label': options['label'], 'run_at': timezone.now().isoformat()})
+
+        path = os.path.join(options['output'], RESULTS_FILE)
+        previous = self.previous_result(path, result) if options['compare'] else None
+        if not options['no_save']:
+            os.makedirs(options['output'], exist_ok=True)
+            with open(path, 'a') as results_file:
+                results_file.write(json.dumps(result) + '\n')
+
+        if options['json']:
+            self.stdout.write(json.dumps({'result': result, 'previous': previous}, indent=2))
+            return
+        self.print_result(result)
+        if options['compare']:
+            self.print_comparison(result, previous)
+
+    def previous_result(self, path, result):
+        keys = ('greenhouses', 'connections', 'rate', 'duration_s', 'tick_ms', 'binary')
+        previous = None
+        try:
+            with open(path) as results_file:
+                for line in results_file:
+                    entry = json.loads(line)
+                    if all(entry.get(key) == result[key] for key in keys):
+                        previous = entry
+        except FileNotFoundError:
+            pass
+        return previous
+
+    def print_result(self, result):
+        latency = result['latency_ms']
+        mode = 'binary' if result['binary'] else 'JSON'
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{result['connections']} connections over {result['greenhouses']} greenhouses, "
+            f"{result['rate']} readings/s for {result['duration_s']} s, tick {result['tick_ms']} ms, {mode} (commit {result['commit']})"
+        ))
+        self.stdout.write(
+            f"  readings {result['readings']} ({result['ingest_errors']} errors), frames {result['frames']}, updates {result['updates']}\n"
+            f"  {result['messages_per_s']} frames/s, {result['bytes_per_s']} bytes/s\n"
+            f"  push latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}\n"
+            f"  memory per connection: {result['memory_per_connection_kib']} KiB\n"
+            f"  dropped frames {result['dropped_frames']}, dispatcher drops {result['dispatch_dropped']}, closed sockets {result['closed_sockets']}"
+        )
+
+    def print_comparison(self, result, previous):
+        if previous is None:
+            self.stdout.write("No previous result with the same parameters.")
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Compared with commit {previous.get('commit')} ({previous.get('run_at')})"))
+        rows = [
+            ('frames/s', result['messages_per_s'], previous.get('messages_per_s')),
+            ('latency p50 ms', result['latency_ms']['p50'], previous.get('latency_ms', {}).get('p50')),
+            ('latency p95 ms', result['latency_ms']['p95'], previous.get('latency_ms', {}).get('p95')),
+            ('latency p99 ms', result['latency_ms']['p99'], previous.get('latency_ms', {}).get('p99')),
+            ('memory/connection KiB', result['memory_per_connection_kib'], previous.get('memory_per_connection_kib')),
+        ]
+        for label, value, before in rows:
+            change = f"{(value - before) / before * 100:+.1f}%" if value is not None and before else "n/a"
+            self.stdout.write(f"  {label}: {before} -> {value} ({change})")
@@ -0,0 +1,45 @@
+# dashboard/management/commands/rebuild_rollups.py
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dashboard.archive import from_micros, sensor_reading_chunks
+from dashboard.models import Sensor, SensorData, SensorRollup
+from dashboard.rollups import update_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes SensorRollup from the raw readings, archived (see archive_sensordata) and in SensorData. "
+        "Only needed to backfill rollups for readings stored before they existed; new readings are rolled up "
+        "incrementally on ingest."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sensor', type=int, action='append', help="Sensor ID (repeatable). Default: all sensors")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Readings folded per transaction")
+
+    def handle(self, *args, **options):
+        sensors = Sensor.objects.all()
+        if options['sensor']:
+            sensors = sensors.filter(pk__in=options['sensor'])
+        since = datetime.min.replace(tzinfo=dt_timezone.utc)
+        until = datetime.max.replace(tzinfo=dt_timezone.utc)
+
+        for sensor in sensors.iterator():
+            with transaction.atomic():
+                SensorRollup.objects.filter(sensor=sensor).delete()
+            total = 0
+            # Archive and hot table as one time-ordered series, in keyset chunks (bounded memory on MySQL)
+            for timestamps, values in sensor_reading_chunks(sensor, since, until, chunk_size=options['chunk_size']):
+                chunk = [
+                    SensorData(sensor_id=sensor.id, value=value, timestamp=from_micros(micros))
+                    for micros, value in zip(timestamps.tolist(), values.tolist())
+                ]
+                with transaction.atomic():
+                    update_rollups(chunk)
+                total += len(chunk)
+            self.stdout.write(f"Sensor {sensor.id} ({sensor.name}): {total} readings rolled up")
+
+        self.stdout.write(self.style.SUCCESS("Rollups rebuilt."))
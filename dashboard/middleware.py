@@ -0,0 +1,143 @@
+# dashboard/middleware.py
+"""
+ASGI middleware for the WebSocket routes (see greengrow/asgi.py).
+
+JWTAuthMiddleware authenticates sockets with the same simplejwt access tokens as the
+REST API. Browsers cannot set headers on a WebSocket handshake, so the token is read from
+the query string (ws/greenhouses/?token=<access token>); other clients may send the usual
+"Authorization: Bearer <access token>" header instead. A valid token sets scope['user'];
+an invalid or expired one sets an AnonymousUser, so the consumer refuses the socket
+(4401) rather than falling back to the session cookie. Without a token the user set
+by the session middleware (AuthMiddlewareStack) is kept.
+Access tokens are short-lived (SIMPLE_JWT['ACCESS_TOKEN_LIFETIME']), which limits what a
+token leaked through a logged URL is worth.
+
+TransportFlowMiddleware gives consumers the write-side flow control Daphne doesn't pass
+on: Daphne's send() copies every frame into the connection's Twisted transport at once,
+and only the transport knows when its buffer is over bufferSize (64 KiB) because the
+client stops reading. The transport then pauses its streaming producer, and resumes it
+once the buffer has drained. The middleware interposes a TransportFlow as that producer
+(forwarding to the one Daphne registered) and puts it in scope['transport_flow']; the
+consumer's writer waits for it before each send, so unsent frames stay in the consumer's
+own queue where its slow-client policy applies. On other servers (whose send already waits
+for the client) and in tests there is no Daphne transport and the scope has no flow.
+"""
+import asyncio
+import time
+from functools import partial
+from urllib.parse import parse_qs
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+
+def scope_token(scope):
+    """
+    Returns the raw access token of a WebSocket handshake (?token= or Bearer header), or None.
+    """
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+    if token:
+        return token
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            scheme, _, credentials = value.decode('latin1').partition(' ')
+            if scheme.lower() == 'bearer' and credentials.strip():
+                return credentials.strip()
+    return None
+
+
+@database_sync_to_async
+def user_for_token(token):
+    """
+    The active user of a simplejwt access token, or an AnonymousUser if it doesn't validate.
+    """
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(token.encode()))
+    except (InvalidToken, TokenError, AuthenticationFailed) as e:
+        print(f"JWTAuthMiddleware: WebSocket token rejected ({type(e).__name__})")
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        token = scope_token(scope)
+        if token is not None:
+            scope = dict(scope, user=await user_for_token(token))
+        return await super().__call__(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    """
+    Session authentication (channels' AuthMiddlewareStack), overridden by a JWT when one is given.
+    """
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
+
+
+class TransportFlow:
+    """
+    Push producer registered on a Daphne connection's transport in place of Daphne's own,
+    which it keeps driving. writable is cleared while the transport's send buffer is full.
+    """
+    def __init__(self, transport):
+        self.upstream = transport.producer # Daphne's HTTPChannel, still registered after the upgrade
+        self.writable = asyncio.Event()
+        self.writable.set()
+        self.paused_at = None
+        transport.producer = self
+        transport.streamingProducer = True
+
+    def pauseProducing(self):
+        if self.paused_at is None:
+            self.paused_at = time.monotonic()
+        self.writable.clear()
+        if self.upstream is not None:
+            self.upstream.pauseProducing()
+
+    def resumeProducing(self):
+        self.paused_at = None
+        self.writable.set()
+        if self.upstream is not None:
+            self.upstream.resumeProducing()
+
+    def stopProducing(self):
+        self.writable.set() # Connection lost: let waiting writers through, Daphne discards their frames
+        if self.upstream is not None:
+            self.upstream.stopProducing()
+
+    def stalled_for(self):
+        """
+        Seconds the client has not been reading, 0 while the transport accepts writes.
+        """
+        return 0.0 if self.paused_at is None else time.monotonic() - self.paused_at
+
+
+def transport_flow(send):
+    """
+    The TransportFlow of the Daphne connection behind an ASGI send callable, or None when
+    send isn't Daphne's (partial(Server.handle_reply, protocol)).
+    """
+    if not isinstance(send, partial) or not send.args:
+        return None
+    transport = getattr(send.args[0], 'transport', None)
+    # Under TLS the protocol's transport wraps the TCP connection, whose buffer is the one that fills
+    while transport is not None and not hasattr(transport, 'streamingProducer'):
+        transport = getattr(transport, 'transport', None)
+    if transport is None:
+        return None
+    if isinstance(transport.producer, TransportFlow):
+        return transport.producer
+    return TransportFlow(transport)
+
+
+class TransportFlowMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        flow = transport_flow(send)
+        if flow is not None:
+            scope = dict(scope, transport_flow=flow)
+        return await super().__call__(scope, receive, send)
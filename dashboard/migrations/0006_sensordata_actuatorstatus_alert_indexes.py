@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_alter_sensordata_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actuatorstatus',
+            index=models.Index(fields=['actuator', '-timestamp'], name='actstatus_actuator_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sensordata',
+            index=models.Index(fields=['sensor', '-timestamp'], name='sensordata_sensor_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['sensor', 'is_resolved'], name='alert_sensor_resolved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['greenhouse', 'is_resolved', '-created_at'], name='alert_gh_resolved_created_idx'),
+        ),
+    ]
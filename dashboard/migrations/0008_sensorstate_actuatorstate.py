@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-17 13:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_current_state(apps, schema_editor):
+    Sensor = apps.get_model('dashboard', 'Sensor')
+    SensorData = apps.get_model('dashboard', 'SensorData')
+    SensorState = apps.get_model('dashboard', 'SensorState')
+    Actuator = apps.get_model('dashboard', 'Actuator')
+    ActuatorStatus = apps.get_model('dashboard', 'ActuatorStatus')
+    ActuatorState = apps.get_model('dashboard', 'ActuatorState')
+
+    sensor_states = []
+    for sensor_id in Sensor.objects.values_list('id', flat=True):
+        latest = SensorData.objects.filter(sensor_id=sensor_id).order_by('-timestamp', '-id').first()
+        if latest:
+            sensor_states.append(SensorState(sensor_id=sensor_id, reading_id=latest.id, value=latest.value, timestamp=latest.timestamp))
+    SensorState.objects.bulk_create(sensor_states, batch_size=1000)
+
+    actuator_states = []
+    for actuator_id in Actuator.objects.values_list('id', flat=True):
+        latest = ActuatorStatus.objects.filter(actuator_id=actuator_id).order_by('-timestamp', '-id').first()
+        if latest:
+            actuator_states.append(ActuatorState(actuator_id=actuator_id, status_id=latest.id, status_value=latest.status_value, timestamp=latest.timestamp))
+    ActuatorState.objects.bulk_create(actuator_states, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_sensorrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActuatorState',
+            fields=[
+                ('actuator', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='current_state', serialize=False, to='dashboard.actuator')),
+                ('status_id', models.BigIntegerField(blank=True, help_text='ActuatorStatus id', null=True)),
+                ('status_value', models.CharField(max_length=255)),
+                ('timestamp', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SensorState',
+            fields=[
+                ('sensor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='current_state', serialize=False, to='dashboard.sensor')),
+                ('reading_id', models.BigIntegerField(blank=True, help_text='SensorData id (unknown for bulk inserts on MySQL)', null=True)),
+                ('value', models.FloatField()),
+                ('timestamp', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(backfill_current_state, migrations.RunPython.noop),
+    ]
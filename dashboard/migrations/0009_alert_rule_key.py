@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0008_sensorstate_actuatorstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='rule_key',
+            field=models.CharField(blank=True, help_text="Rule that opened the alert, e.g. 'TEMP:greater_than'", max_length=64),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-17 16:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copy of constants.ALERT_THRESHOLDS at the time of this migration, seeded as global rules
+INITIAL_RULES = [
+    ('TEMP', 'greater_than', 30.0, 'High Temperature Alert: Temperature is {{ value }}°C'),
+    ('TEMP', 'less_than', 10.0, 'Low Temperature Alert: Temperature is {{ value }}°C'),
+    ('AIR_HUM', 'greater_than', 80.0, 'High Humidity Alert: Humidity is {{ value }}%'),
+    ('AIR_HUM', 'less_than', 30.0, 'Low Humidity Alert: Humidity is {{ value }}%'),
+    ('CO2', 'greater_than', 1000.0, 'High CO2 Level Alert: CO2 is {{ value }} ppm'),
+    ('LIGHT', 'less_than', 200.0, 'Low Light Level Alert: Light is {{ value }} lux'),
+]
+
+
+def seed_global_rules(apps, schema_editor):
+    AlertRule = apps.get_model('dashboard', 'AlertRule')
+    AlertRule.objects.bulk_create([
+        AlertRule(sensor_type=sensor_type, condition=condition, threshold=threshold, message=message, severity='WARNING')
+        for sensor_type, condition, threshold, message in INITIAL_RULES
+    ])
+
+
+def remove_global_rules(apps, schema_editor):
+    AlertRule = apps.get_model('dashboard', 'AlertRule')
+    AlertRule.objects.filter(greenhouse=None, sensor=None).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_alert_rule_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_type', models.CharField(choices=[('TEMP', 'Air Temperature (°C)'), ('AIR_HUM', 'Air Humidity (% RH)'), ('CO2', 'CO2 Level(ppm)'), ('LIGHT', 'Light Intensity(Lux)'), ('SOIL_MOIST', 'Soil Moisture (% VWC)'), ('SOIL_TEMP', 'Soil Temperature (°C)'), ('WATER_LVL', 'Water Tank Level (L)'), ('SOLAR_VOLT', 'Solar Voltage (V)')], max_length=15)),
+                ('condition', models.CharField(choices=[('greater_than', 'Greater than'), ('less_than', 'Less than')], max_length=20)),
+                ('threshold', models.FloatField()),
+                ('message', models.CharField(help_text='Alert message, {{ value }} is replaced by the reading', max_length=200)),
+                ('severity', models.CharField(choices=[('INFO', 'Info'), ('WARNING', 'Warning'), ('CRITICAL', 'Critical')], default='WARNING', max_length=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('greenhouse', models.ForeignKey(blank=True, help_text='Leave empty for a global rule', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='dashboard.greenhouse')),
+                ('sensor', models.ForeignKey(blank=True, help_text='Set to scope the rule to a single sensor', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='dashboard.sensor')),
+            ],
+            options={
+                'ordering': ['sensor_type', 'condition'],
+            },
+        ),
+        migrations.RunPython(seed_global_rules, remove_global_rules),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2 on 2026-10-17 16:40
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0010_alertrule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='last_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='peak_value',
+            field=models.FloatField(blank=True, help_text='Worst value of the excursion', null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='reading_count',
+            field=models.PositiveIntegerField(default=0, help_text='Readings since the breach started'),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='resolved_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alertrule',
+            name='hysteresis',
+            field=models.FloatField(default=0, help_text='Clearing band: an open alert resolves only once the value is this far back past the threshold', validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='alertrule',
+            name='min_consecutive',
+            field=models.PositiveIntegerField(default=1, help_text='Consecutive breaching readings needed to open an alert', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='alertrule',
+            name='min_duration',
+            field=models.PositiveIntegerField(default=0, help_text='Seconds the breach must last before an alert opens'),
+        ),
+    ]
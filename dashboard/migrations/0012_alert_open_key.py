@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-17 17:20
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def assign_open_keys(apps, schema_editor):
+    """
+    Gives the newest open alert of each (sensor, rule) its open_key and resolves the
+    older duplicates left by concurrent workers, so the unique index can hold.
+    """
+    Alert = apps.get_model('dashboard', 'Alert')
+    open_alerts = Alert.objects.filter(is_resolved=False, sensor__isnull=False).exclude(rule_key='')
+    seen = set()
+    duplicates = []
+    for alert_id, sensor_id, rule_key in open_alerts.order_by('-created_at', '-id').values_list('id', 'sensor_id', 'rule_key').iterator():
+        open_key = f'{sensor_id}:{rule_key}'
+        if open_key in seen:
+            duplicates.append(alert_id)
+        else:
+            seen.add(open_key)
+            Alert.objects.filter(pk=alert_id).update(open_key=open_key)
+    for offset in range(0, len(duplicates), 1000):
+        Alert.objects.filter(pk__in=duplicates[offset:offset + 1000]).update(is_resolved=True, resolved_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0011_alert_excursion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='open_key',
+            field=models.CharField(blank=True, editable=False, max_length=80, null=True, unique=True),
+        ),
+        migrations.RunPython(assign_open_keys, migrations.RunPython.noop),
+    ]
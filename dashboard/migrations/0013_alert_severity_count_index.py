@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0012_alert_open_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['greenhouse', 'is_resolved', 'severity'], name='alert_gh_resolved_sev_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 18:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0013_alert_severity_count_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alert',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When the alert opened (time of the reading that opened it)'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+
+def backfill_latest_reading(apps, schema_editor):
+    # States written by bulk ingestion on MySQL have no reading_id, and none has notes yet
+    SensorData = apps.get_model('dashboard', 'SensorData')
+    SensorState = apps.get_model('dashboard', 'SensorState')
+    for state in SensorState.objects.iterator():
+        readings = SensorData.objects.filter(sensor_id=state.sensor_id)
+        reading = (readings.filter(timestamp=state.timestamp).order_by('-id').first()
+                   or readings.order_by('-timestamp', '-id').first()) # The stored reading was deleted
+        if reading is not None:
+            SensorState.objects.filter(pk=state.pk).update(
+                reading_id=reading.id, value=reading.value, timestamp=reading.timestamp, notes=reading.notes,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0014_alert_created_at_reading_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensorstate',
+            name='notes',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='sensorstate',
+            name='reading_id',
+            field=models.BigIntegerField(blank=True, help_text='SensorData id of the reading', null=True),
+        ),
+        migrations.RunPython(backfill_latest_reading, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-17 21:40
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_rules(apps, schema_editor):
+    # Duplicates could be created through the admin before the constraint existed; which one
+    # the engine applied was arbitrary, so leave the choice to an admin instead of guessing
+    AlertRule = apps.get_model('dashboard', 'AlertRule')
+    duplicates = list(AlertRule.objects.values('greenhouse_id', 'sensor_id', 'sensor_type', 'condition').annotate(
+        count=Count('id')).filter(count__gt=1))
+    if duplicates:
+        scopes = '; '.join(
+            f"{row['sensor_type']} {row['condition']} (greenhouse={row['greenhouse_id']}, sensor={row['sensor_id']}): {row['count']} rules"
+            for row in duplicates
+        )
+        raise RuntimeError(f"Delete or merge the duplicate alert rules before migrating: {scopes}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0015_sensorstate_notes'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_rules, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='alertrule',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('greenhouse', 0, output_field=models.IntegerField()), django.db.models.functions.comparison.Coalesce('sensor', 0, output_field=models.IntegerField()), models.F('sensor_type'), models.F('condition'), name='alertrule_scope_uniq', violation_error_message='A rule for this sensor type and condition already exists in this scope.'),
+        ),
+    ]
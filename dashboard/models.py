@@ -3,7 +3,10 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.contrib.auth.models import AbstractUser
 from django.dispatch import receiver
-from .constants import ACTUATOR_TYPES # We'll define this constant
+from django.utils import timezone
+from django.core.validators import MinValueValidator
+from django.db.models.functions import Coalesce
+from .constants import ACTUATOR_TYPES, ALERT_CONDITIONS, ALERT_SEVERITIES # We'll define this constant
 
 
 class User(AbstractUser):
@@ -53,6 +56,10 @@ class ActuatorStatus(models.Model):
 
      class Meta:
          ordering = ['-timestamp'] # Order by latest status first
+         indexes = [
+             # "Latest status" and history pages: WHERE actuator_id = ? ORDER BY timestamp DESC
+             models.Index(fields=['actuator', '-timestamp'], name='actstatus_actuator_ts_idx'),
+         ]
 
      def __str__(self):
          return f"{self.actuator.name} status at {self.timestamp}: {self.status_value}"
@@ -84,26 +91,181 @@ class Sensor(models.Model):
 class SensorData(models.Model):
     sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='readings')
     value = models.FloatField(help_text="Raw sensor value")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # default instead of auto_now_add so gateways can send the device timestamp (bulk ingestion)
+    timestamp = models.DateTimeField(default=timezone.now)
     notes = models.TextField(blank=True, help_text="Optional calibration notes")
 
     class Meta:
         ordering = ['-timestamp']  # Newest first
+        indexes = [
+            # "Latest reading" and history pages: WHERE sensor_id = ? ORDER BY timestamp DESC.
+            # InnoDB appends the primary key, so this also serves (sensor, timestamp, id) ranges.
+            models.Index(fields=['sensor', '-timestamp'], name='sensordata_sensor_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sensor.name}: {self.value} at {self.timestamp}"
     
+class SensorState(models.Model):
+    """
+    Latest reading of each sensor, denormalized so listings don't query SensorData.
+    Written by dashboard.current_state on every ingest path.
+    """
+    sensor = models.OneToOneField(Sensor, on_delete=models.CASCADE, primary_key=True, related_name='current_state')
+    reading_id = models.BigIntegerField(null=True, blank=True, help_text="SensorData id of the reading")
+    value = models.FloatField()
+    timestamp = models.DateTimeField()
+    notes = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.sensor.name}: {self.value} at {self.timestamp}"
+
+
+class ActuatorState(models.Model):
+    """
+    Latest status of each actuator, denormalized so listings don't query ActuatorStatus.
+    """
+    actuator = models.OneToOneField(Actuator, on_delete=models.CASCADE, primary_key=True, related_name='current_state')
+    status_id = models.BigIntegerField(null=True, blank=True, help_text="ActuatorStatus id")
+    status_value = models.CharField(max_length=255)
+    timestamp = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.actuator.name}: {self.status_value} at {self.timestamp}"
+
+
+class SensorRollup(models.Model):
+    """
+    Aggregate of one sensor's readings over one time bucket (minute, hour or day).
+    Maintained incrementally by dashboard.rollups.update_rollups as readings are ingested.
+    """
+    RESOLUTION_CHOICES = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='rollups')
+    resolution = models.CharField(max_length=6, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField(help_text="Start of the bucket (UTC)")
+    count = models.PositiveIntegerField(default=0)
+    value_sum = models.FloatField(default=0.0, help_text="Sum of values, mean = value_sum / count")
+    value_min = models.FloatField()
+    value_max = models.FloatField()
+    last_value = models.FloatField()
+    last_timestamp = models.DateTimeField()
+
+    class Meta:
+        ordering = ['bucket_start']
+        constraints = [
+            # Also the index for range reads: WHERE sensor_id = ? AND resolution = ? AND bucket_start BETWEEN ...
+            models.UniqueConstraint(fields=['sensor', 'resolution', 'bucket_start'], name='sensorrollup_bucket_uniq'),
+        ]
+
+    @property
+    def mean(self):
+        return self.value_sum / self.count if self.count else None
+
+    def __str__(self):
+        return f"{self.sensor.name} {self.resolution} {self.bucket_start}: {self.count} readings"
+
+class AlertRule(models.Model):
+    """
+    Threshold rule for one sensor type, scoped globally, to a greenhouse or to a single sensor.
+    For each (sensor type, condition) the most specific rule applies: sensor, then greenhouse,
+    then global. An inactive rule still takes precedence, which disables that condition for its scope.
+    """
+    sensor_type = models.CharField(max_length=15, choices=Sensor.SENSOR_TYPES)
+    condition = models.CharField(max_length=20, choices=ALERT_CONDITIONS)
+    threshold = models.FloatField()
+    message = models.CharField(max_length=200, help_text="Alert message, {{ value }} is replaced by the reading")
+    severity = models.CharField(max_length=10, choices=ALERT_SEVERITIES, default='WARNING')
+    greenhouse = models.ForeignKey(Greenhouse, on_delete=models.CASCADE, null=True, blank=True, related_name='alert_rules',
+                                   help_text="Leave empty for a global rule")
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, null=True, blank=True, related_name='alert_rules',
+                               help_text="Set to scope the rule to a single sensor")
+    hysteresis = models.FloatField(default=0, validators=[MinValueValidator(0)],
+                                   help_text="Clearing band: an open alert resolves only once the value is this far back past the threshold")
+    min_consecutive = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)],
+                                                  help_text="Consecutive breaching readings needed to open an alert")
+    min_duration = models.PositiveIntegerField(default=0, help_text="Seconds the breach must last before an alert opens")
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['sensor_type', 'condition']
+        constraints = [
+            # One rule per (sensor type, condition) and scope, otherwise which one applies is arbitrary.
+            # NULL scopes are coalesced to 0 because unique indexes let NULLs repeat; a functional
+            # index rather than conditional ones, which MySQL does not support.
+            models.UniqueConstraint(
+                Coalesce('greenhouse', 0, output_field=models.IntegerField()),
+                Coalesce('sensor', 0, output_field=models.IntegerField()),
+                'sensor_type', 'condition',
+                name='alertrule_scope_uniq',
+                violation_error_message="A rule for this sensor type and condition already exists in this scope.",
+            ),
+        ]
+
+    @property
+    def scope(self):
+        if self.sensor_id:
+            return 'sensor'
+        if self.greenhouse_id:
+            return 'greenhouse'
+        return 'global'
+
+    def clean(self):
+        if self.sensor_id:
+            self.greenhouse_id = self.sensor.greenhouse_id # Before validate_constraints() checks the scope
+
+    def save(self, *args, **kwargs):
+        if self.sensor_id:
+            self.greenhouse_id = self.sensor.greenhouse_id # A sensor rule always belongs to the sensor's greenhouse
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.sensor_type} {self.condition} {self.threshold} ({self.scope})"
+
+
 class Alert(models.Model):
     greenhouse = models.ForeignKey(Greenhouse, on_delete=models.CASCADE, related_name='alerts')
     sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, null=True, blank=True, related_name='alerts')
     message = models.CharField(max_length=255, help_text="Alert message")
-    severity = models.CharField(max_length=10, choices=[('INFO', 'Info'), ('WARNING', 'Warning'), ('CRITICAL', 'Critical')])
-    created_at = models.DateTimeField(auto_now_add=True)
+    rule_key = models.CharField(max_length=64, blank=True, help_text="Rule that opened the alert, e.g. 'TEMP:greater_than'")
+    # '<sensor_id>:<rule_key>' while the alert is open, NULL once resolved. The unique index
+    # allows many NULLs but a single open alert per (sensor, rule), and is the conflict target
+    # of the alert engine's upsert.
+    open_key = models.CharField(max_length=80, null=True, blank=True, unique=True, editable=False)
+    severity = models.CharField(max_length=10, choices=ALERT_SEVERITIES)
+    created_at = models.DateTimeField(default=timezone.now, help_text="When the alert opened (time of the reading that opened it)")
     is_resolved = models.BooleanField(default=False, help_text="Indicates if the alert has been resolved")
+    # Excursion summary, updated in place by the alert engine while the alert is open
+    last_value = models.FloatField(null=True, blank=True)
+    peak_value = models.FloatField(null=True, blank=True, help_text="Worst value of the excursion")
+    reading_count = models.PositiveIntegerField(default=0, help_text="Readings since the breach started")
+    updated_at = models.DateTimeField(null=True, blank=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    @staticmethod
+    def make_open_key(sensor_id, rule_key):
+        return f'{sensor_id}:{rule_key}'
+
+    def save(self, *args, **kwargs):
+        if self.is_resolved:
+            self.open_key = None # Frees the (sensor, rule) slot for the next excursion
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Alert for {self.greenhouse.name}: {self.message} ({'Resolved' if self.is_resolved else 'Active'})"
 
     class Meta:
         ordering = ['-created_at'] # Order by newest alerts first
+        indexes = [
+            # Alert resolution in check_sensor_alert: WHERE sensor_id = ? AND is_resolved = 0
+            models.Index(fields=['sensor', 'is_resolved'], name='alert_sensor_resolved_idx'),
+            # Open alerts of a greenhouse (overview), newest first
+            models.Index(fields=['greenhouse', 'is_resolved', '-created_at'], name='alert_gh_resolved_created_idx'),
+            # AlertViewSet.counts: GROUP BY severity answered from the index alone
+            models.Index(fields=['greenhouse', 'is_resolved', 'severity'], name='alert_gh_resolved_sev_idx'),
+        ]
 
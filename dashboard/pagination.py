@@ -0,0 +1,38 @@
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    DRF cursor pagination on (timestamp, id), newest first.
+
+    Each page is "WHERE timestamp < :position ORDER BY timestamp DESC, id DESC LIMIT n", plus a
+    small OFFSET past the rows that share the position's timestamp: an index range scan on
+    (<fk>, timestamp) whose cost does not depend on how deep the client pages, unlike OFFSET
+    paging. The response is {"next": <url or null>, "previous": <url or null>, "results": [...]}.
+    """
+    ordering = ('-timestamp', '-id')
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        # DRF hands the position to the queryset filter as is: one that isn't a
+        # timestamp gets the same "Invalid cursor" answer as a malformed cursor
+        if cursor is not None and cursor.position is not None:
+            try:
+                valid = parse_datetime(cursor.position) is not None
+            except ValueError:
+                valid = False
+            if not valid:
+                raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+
+class AlertPagination(KeysetPagination):
+    """
+    Same cursor pagination for alerts, newest first on (created_at, id).
+    """
+    ordering = ('-created_at', '-id')
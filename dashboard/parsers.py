@@ -0,0 +1,49 @@
+# dashboard/parsers.py
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .frames import FRAME_MEDIA_TYPE, FrameError, decode_frame
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON (one reading per line) into a list.
+    A line that is not valid JSON is kept as its raw string, so the ingestion
+    serializer reports it as an error for that item instead of failing the whole batch.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        try:
+            text = stream.read().decode(encoding)
+        except UnicodeDecodeError as e:
+            raise ParseError(f"NDJSON parse error - {e}")
+
+        items = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue # Skip blank lines (e.g. trailing newline)
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(line)
+        return items
+
+
+class SensorFrameParser(BaseParser):
+    """
+    Parses the compact binary reading frame (see dashboard/frames.py) into a ReadingFrame.
+    The records stay a numpy view over the request body until they are validated.
+    """
+    media_type = FRAME_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return decode_frame(stream.read())
+        except FrameError as e:
+            raise ParseError(f"Frame parse error - {e}")
@@ -0,0 +1,133 @@
+# dashboard/rollups.py
+"""
+Incremental minute/hour/day rollups of sensor readings (SensorRollup).
+
+update_rollups() folds a batch of new readings into the existing buckets with one
+UPDATE per touched bucket (min/max/sum/count/last merged in SQL), creating the
+bucket row when it does not exist yet. Nothing is ever recomputed from raw rows,
+except by the rebuild_rollups management command.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DateTimeField, F, FloatField, Value, When
+from django.db.models.functions import Greatest, Least
+
+from .archive import count_range
+from .models import SensorRollup
+
+
+# Finest to coarsest
+RESOLUTIONS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+RAW = 'raw'
+
+
+def bucket_start(timestamp, resolution):
+    """
+    Truncates an aware datetime to the start of its bucket, in UTC.
+    """
+    timestamp = timestamp.astimezone(dt_timezone.utc)
+    if resolution == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup resolution: {resolution}")
+
+
+def aggregate_readings(readings):
+    """
+    Aggregates readings in memory.
+    Returns {(sensor_id, resolution, bucket_start): [count, sum, min, max, last_timestamp, last_value]}.
+    """
+    buckets = {}
+    for reading in readings:
+        for resolution in RESOLUTIONS:
+            key = (reading.sensor_id, resolution, bucket_start(reading.timestamp, resolution))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [1, reading.value, reading.value, reading.value, reading.timestamp, reading.value]
+                continue
+            bucket[0] += 1
+            bucket[1] += reading.value
+            bucket[2] = min(bucket[2], reading.value)
+            bucket[3] = max(bucket[3], reading.value)
+            if reading.timestamp >= bucket[4]:
+                bucket[4], bucket[5] = reading.timestamp, reading.value
+    return buckets
+
+
+def merge_bucket(sensor_id, resolution, start, bucket):
+    """
+    Merges one in-memory aggregate into its SensorRollup row.
+    """
+    count, total, value_min, value_max, last_timestamp, last_value = bucket
+    rows = SensorRollup.objects.filter(sensor_id=sensor_id, resolution=resolution, bucket_start=start)
+    # MySQL evaluates SET assignments left to right, so last_value must be
+    # computed before last_timestamp is overwritten.
+    merge = {
+        'count': F('count') + count,
+        'value_sum': F('value_sum') + total,
+        'value_min': Least('value_min', Value(value_min, output_field=FloatField())),
+        'value_max': Greatest('value_max', Value(value_max, output_field=FloatField())),
+        'last_value': Case(
+            When(last_timestamp__lte=last_timestamp, then=Value(last_value, output_field=FloatField())),
+            default=F('last_value'),
+        ),
+        'last_timestamp': Greatest('last_timestamp', Value(last_timestamp, output_field=DateTimeField())),
+    }
+    if rows.update(**merge):
+        return
+    try:
+        with transaction.atomic(): # Savepoint, so a lost insert race does not break the outer transaction
+            SensorRollup.objects.create(
+                sensor_id=sensor_id, resolution=resolution, bucket_start=start,
+                count=count, value_sum=total, value_min=value_min, value_max=value_max,
+                last_value=last_value, last_timestamp=last_timestamp,
+            )
+    except IntegrityError:
+        # Another worker created the bucket between our UPDATE and INSERT
+        rows.update(**merge)
+
+
+def update_rollups(readings):
+    """
+    Folds newly inserted readings into the minute/hour/day rollups.
+    Call it once per batch, in the same transaction as the insert.
+    """
+    for (sensor_id, resolution, start), bucket in aggregate_readings(readings).items():
+        merge_bucket(sensor_id, resolution, start, bucket)
+
+
+def choose_resolution(sensor, since, until, max_points):
+    """
+    Picks the finest resolution whose number of points in [since, until]
+    fits within max_points: raw readings first, then minute, hour, day.
+    Raw readings include the ones moved to the archive.
+    """
+    # Bounded index range scan: never counts more than max_points + 1 rows
+    raw_rows = sensor.readings.filter(timestamp__gte=since, timestamp__lte=until).order_by()[:max_points + 1]
+    if raw_rows.count() + count_range(sensor.id, since, until) <= max_points:
+        return RAW
+    span = until - since
+    for resolution, step in RESOLUTIONS.items():
+        if span / step <= max_points:
+            return resolution
+    return 'day'
+
+
+def rollup_history(sensor, resolution, since, until):
+    """
+    Returns the SensorRollup rows of one resolution covering [since, until].
+    """
+    return SensorRollup.objects.filter(
+        sensor=sensor,
+        resolution=resolution,
+        bucket_start__gte=bucket_start(since, resolution),
+        bucket_start__lte=until,
+    ).order_by('bucket_start')
@@ -8,4 +8,6 @@ websocket_urlpatterns = [
     # We'll define a URL pattern for connecting to the greenhouse data feed
     # This is just a placeholder for now, we'll refine it later
     re_path(r'ws/greenhouses/(?P<greenhouse_id>\w+)/data/$', consumers.GreenhouseConsumer.as_asgi()),
+    # One authenticated socket, several greenhouses and sensor filters chosen with subscribe/unsubscribe commands
+    re_path(r'ws/greenhouses/$', consumers.MultiGreenhouseConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -1,6 +1,8 @@
 #dashboard/serializers.py
+import math
 from rest_framework import serializers
-from .models import SensorData, Sensor, Greenhouse, Actuator, ActuatorStatus
+from .constants import ALERT_CONDITIONS, ALERT_SEVERITIES
+from .models import SensorData, Sensor, Greenhouse, Actuator, ActuatorStatus, SensorRollup, SensorState, ActuatorState, AlertRule, Alert
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 
@@ -10,6 +12,14 @@ class ActuatorStatusSerializer(serializers.ModelSerializer):
          fields = ['id', 'actuator', 'timestamp', 'status_value']
          read_only_fields = ['timestamp'] # Timestamp is auto-added
 
+class ActuatorStateSerializer(serializers.ModelSerializer):
+     # Same keys as ActuatorStatusSerializer, read from the current-state table
+     id = serializers.IntegerField(source='status_id', read_only=True)
+
+     class Meta:
+         model = ActuatorState
+         fields = ['id', 'actuator', 'timestamp', 'status_value']
+
 class ActuatorSerializer(serializers.ModelSerializer):
      # Add a field to get the latest status
      latest_status = serializers.SerializerMethodField()
@@ -21,16 +31,13 @@ class ActuatorSerializer(serializers.ModelSerializer):
 
      def get_latest_status(self, obj):
          """
-         Gets the latest status for this actuator.
-         obj is the current Actuator instance.
+         Gets the latest status for this actuator from the current-state table.
+         obj is the current Actuator instance. Querysets should use select_related('current_state')
+         so listing actuators costs no extra query per actuator.
          """
          try:
-             # We used related_name='statuses' in the ActuatorStatus model
-             # Order by timestamp descending and get the first one
-             latest_status = obj.statuses.latest('timestamp')
-             # Serialize the latest status using the ActuatorStatusSerializer
-             return ActuatorStatusSerializer(latest_status).data
-         except ActuatorStatus.DoesNotExist:
+             return ActuatorStateSerializer(obj.current_state).data
+         except ActuatorState.DoesNotExist:
              # Return None or a specific value if no status exists
              return None
 
@@ -42,6 +49,112 @@ class SensorDataSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['timestamp']
 
+class SensorStateSerializer(serializers.ModelSerializer):
+    # Same keys as SensorDataSerializer, read from the current-state table
+    id = serializers.IntegerField(source='reading_id', read_only=True)
+
+    class Meta:
+        model = SensorState
+        fields = ['id', 'sensor', 'value', 'timestamp', 'notes']
+
+
+class SensorRollupSerializer(serializers.ModelSerializer):
+    mean = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SensorRollup
+        fields = ['bucket_start', 'count', 'value_min', 'value_max', 'mean', 'last_value', 'last_timestamp']
+
+
+class SensorReadingIngestSerializer(serializers.Serializer):
+    """
+    Validates one item of a bulk ingestion batch.
+    Plain Serializer (not ModelSerializer) so validating an item never queries the database:
+    the greenhouse's sensors are passed in context['sensors'] as a {id: Sensor} dict.
+    """
+    sensor = serializers.IntegerField()
+    value = serializers.FloatField()
+    timestamp = serializers.DateTimeField(required=False) # Device timestamp, defaults to reception time
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate_sensor(self, value):
+        sensor = self.context['sensors'].get(value)
+        if sensor is None:
+            raise serializers.ValidationError("Unknown sensor for this greenhouse.")
+        return sensor
+
+    def validate_value(self, value):
+        if not math.isfinite(value):
+            raise serializers.ValidationError("Value must be a finite number.")
+        return value
+
+
+class AlertRuleSerializer(serializers.ModelSerializer):
+    scope = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = AlertRule
+        fields = ['id', 'sensor_type', 'condition', 'threshold', 'hysteresis', 'min_consecutive', 'min_duration',
+                  'message', 'severity', 'greenhouse', 'sensor', 'is_active', 'scope', 'updated_at']
+        read_only_fields = ['greenhouse', 'updated_at'] # Set from the URL (or the sensor) by the view
+
+    def validate_sensor(self, value):
+        greenhouse = self.context.get('greenhouse')
+        if value is not None and (greenhouse is None or value.greenhouse_id != greenhouse.id):
+            raise serializers.ValidationError("Sensor does not belong to this greenhouse.")
+        return value
+
+    def validate(self, attrs):
+        sensor = attrs.get('sensor', getattr(self.instance, 'sensor', None))
+        sensor_type = attrs.get('sensor_type', getattr(self.instance, 'sensor_type', None))
+        if sensor is not None and sensor.type != sensor_type:
+            raise serializers.ValidationError({'sensor_type': f"Sensor {sensor.id} is of type {sensor.type}."})
+
+        # One rule per (sensor type, condition) and scope, otherwise which one applies is arbitrary
+        condition = attrs.get('condition', getattr(self.instance, 'condition', None))
+        duplicates = AlertRule.objects.filter(sensor_type=sensor_type, condition=condition, sensor=sensor)
+        if sensor is None:
+            duplicates = duplicates.filter(greenhouse=self.context.get('greenhouse'))
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError("A rule for this sensor type and condition already exists in this scope.")
+        return attrs
+
+
+class AlertSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Alert
+        fields = ['id', 'greenhouse', 'sensor', 'rule_key', 'severity', 'message', 'is_resolved', 'created_at', 'updated_at',
+                  'resolved_at', 'last_value', 'peak_value', 'reading_count']
+        read_only_fields = fields
+
+
+class CandidateRuleSerializer(serializers.Serializer):
+    """
+    One rule of a backtest's candidate rule set (same settings as AlertRule, not saved).
+    """
+    sensor_type = serializers.ChoiceField(choices=Sensor.SENSOR_TYPES)
+    condition = serializers.ChoiceField(choices=ALERT_CONDITIONS)
+    threshold = serializers.FloatField()
+    hysteresis = serializers.FloatField(min_value=0, default=0.0)
+    min_consecutive = serializers.IntegerField(min_value=1, default=1)
+    min_duration = serializers.IntegerField(min_value=0, default=0)
+    severity = serializers.ChoiceField(choices=ALERT_SEVERITIES, default='WARNING')
+
+
+class BacktestSerializer(serializers.Serializer):
+    since = serializers.DateTimeField()
+    until = serializers.DateTimeField()
+    sensors = serializers.ListField(child=serializers.IntegerField(), required=False, help_text="Default: all sensors of the greenhouse")
+    rules = CandidateRuleSerializer(many=True, required=False, help_text="Candidate rules; omit to replay the current rules only")
+
+    def validate(self, attrs):
+        if attrs['since'] >= attrs['until']:
+            raise serializers.ValidationError({'until': "Must be after 'since'."})
+        return attrs
+
+
 class SensorSerializer(serializers.ModelSerializer):
     # Add a field to include the latest sensor reading
     latest_reading = serializers.SerializerMethodField()
@@ -52,12 +165,11 @@ class SensorSerializer(serializers.ModelSerializer):
 
     # Method to get the latest sensor data for a sensor instance
     def get_latest_reading(self, obj):
-        # Fetch the single latest SensorData entry for this sensor
-        latest_data = obj.readings.order_by('-timestamp').first()
-        if latest_data:
-            # Use the SensorDataSerializer to serialize the latest reading
-            return SensorDataSerializer(latest_data).data
-        return None # Return None if no data found
+        # Read from the current-state table; querysets should use select_related('current_state')
+        try:
+            return SensorStateSerializer(obj.current_state).data
+        except SensorState.DoesNotExist:
+            return None # Return None if no data found
 
 
 
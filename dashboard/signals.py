@@ -1,26 +1,15 @@
 # dashboard/signals.py
 
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone
-from .models import SensorData, Alert, Greenhouse, Sensor, Actuator, ActuatorStatus
-from .constants import DEFAULT_GREENHOUSE_ACTUATORS, ALERT_THRESHOLDS
+from .models import SensorData, Alert, AlertRule, Greenhouse, Sensor, Actuator, ActuatorStatus
+from .constants import DEFAULT_GREENHOUSE_ACTUATORS
+from .alerting import alert_engine
+from .rollups import update_rollups
+from .current_state import record_sensor_reading, record_actuator_status
 
-# Import necessary modules for Channels integration
-from channels.layers import get_channel_layer # To get the channel layer instance
-from asgiref.sync import async_to_sync # Helper to call async channel layer methods from sync signal
-import json # Import json to serialize message data
-
-
-# --- Get the Channel Layer ---
-# Get the channel layer instance once when the signals file is loaded
-# We use a try-except block because get_channel_layer will fail if Channels is not configured
-try:
-    channel_layer = get_channel_layer()
-    print("Signals: Successfully got channel layer.")
-except Exception as e:
-    channel_layer = None
-    print(f"Signals: Could not get channel layer: {e}. WebSocket push will not work.")
+from .dispatch import publish_to_greenhouse # WebSocket fan-out after commit
 
 
 # --- Your existing signal receivers ---
@@ -75,8 +64,63 @@ def create_initial_actuatorstatus(sender, instance, created, **kwargs):
         # print(f"create_initial_actuatorstatus: Actuator {instance.name} (ID: {instance.id}) was updated, not creating initial status.")
 
 
+# --- Alert evaluation helpers ---
+# Shared by the post_save receiver below and by the bulk ingestion path (dashboard/ingest.py),
+# which calls them once per sensor per batch instead of once per row.
+def evaluate_sensor_alerts(sensor, data_value, timestamp=None):
+    """
+    Feeds a reading to the alert engine (dashboard/alerting.py), which opens, updates and resolves alerts.
+    Only queries the database when an alert opens or resolves, or its summary is due to be written.
+    """
+    try:
+        alert_engine.evaluate(sensor, data_value, timestamp)
+    except Exception as e:
+        print(f"evaluate_sensor_alerts: ERROR evaluating alerts for Sensor ID {sensor.id}: {e}")
+
+
+def build_sensor_update(sensor, value, timestamp):
+    """
+    Builds the payload the frontend expects for one sensor update.
+    """
+    return {
+        'sensor_id': sensor.id, # Include sensor ID so frontend knows which sensor to update
+        # Pass the entire latest_reading object structure expected by the frontend state update logic
+        'latest_reading': {
+            'value': value, # Include the latest value
+            'timestamp': timestamp.isoformat() # Send timestamp as ISO format string
+        },
+        'sensor_type': sensor.type, # Include type for frontend unit display (used in SensorValueDisplay)
+        'sensor_name': sensor.name, # Include name for frontend if needed
+    }
+
+
+def build_actuator_update(actuator, status):
+    """
+    Builds the payload for one actuator status change (same shape as the connect snapshot's actuators).
+    """
+    return {
+        'actuator_id': actuator.id,
+        'status_value': status.status_value,
+        'timestamp': status.timestamp.isoformat(),
+        'actuator_type': actuator.actuator_type,
+        'name': actuator.name,
+    }
+
+
+def push_to_greenhouse(greenhouse_id, event):
+    """
+    Publishes one event to the greenhouse group once the current transaction commits.
+    Non-blocking: the event is queued and sent by the fan-out dispatcher (dashboard/dispatch.py).
+    'type' in the event must EXACTLY match a handler method name in GreenhouseConsumer.
+    """
+    if not publish_to_greenhouse(greenhouse_id, event): # No channel layer configured
+        print("push_to_greenhouse: Channel layer not configured. Cannot send WebSocket push.")
+
+
 # --- The check_sensor_alert signal receiver (Crucial for WebSocket Push) ---
 # This receiver checks sensor data against thresholds and pushes updates via WebSocket.
+# Note: bulk_create() does not send post_save, so readings from the bulk ingestion
+# endpoint are handled by dashboard.ingest.process_batch instead.
 @receiver(post_save, sender=SensorData)
 def check_sensor_alert(sender, instance, created, **kwargs):
     """
@@ -87,115 +131,60 @@ def check_sensor_alert(sender, instance, created, **kwargs):
     sensor_data = instance
     sensor = sensor_data.sensor
     greenhouse = sensor.greenhouse
-    sensor_type = sensor.type
-    data_value = sensor_data.value
-
-    print(f"check_sensor_alert: Processing {sensor_type} data: {data_value} in Greenhouse: {greenhouse.name} (ID: {greenhouse.id}) - {'Created' if created else 'Updated'}")
-
-    # --- Alert Logic (Ensure your alert creation/resolution logic is here) ---
-    # (Based on the code you provided previously, this part seems correct)
-    alert_triggered_by_this_data = False # Flag to see if *this* data point triggers *any* alert
-
-    if sensor_type in ALERT_THRESHOLDS:
-        thresholds = ALERT_THRESHOLDS[sensor_type]
-        # print(f"check_sensor_alert: Thresholds found for {sensor_type}: {thresholds}") # Can uncomment for more debug
-
-        for condition_type, condition_details in thresholds.items():
-            threshold_value = condition_details['threshold']
-            alert_message_template = condition_details['message']
-            full_alert_message = f"{sensor_type} {alert_message_template.replace('{{ value }}', str(data_value))}"
-
-            is_alert_condition_met = False
-            if condition_type == 'greater_than' and data_value > threshold_value:
-                is_alert_condition_met = True
-            elif condition_type == 'less_than' and data_value < threshold_value:
-                is_alert_condition_met = True
-            # Add other condition types here if needed
-
-            # --- Create/Update Alert if condition is met ---
-            if is_alert_condition_met:
-                alert_triggered_by_this_data = True
-                print(f"check_sensor_alert: Alert condition met, attempting to get_or_create Alert: {full_alert_message}")
-                try:
-                    alert, created_alert_obj = Alert.objects.get_or_create(
-                        greenhouse=greenhouse,
-                        message=full_alert_message,
-                        is_resolved=False,
-                        defaults={
-                            'severity': 'high',
-                            'sensor': sensor,
-                        }
-                    )
-                    if created_alert_obj:
-                        print(f"check_sensor_alert: !!! New Alert Triggered and Created: Alert ID {alert.id}, Message: {alert.message}")
-                    # else: # Can uncomment for debug
-                    #     print(f"check_sensor_alert: --- Existing Active Alert Found: Alert ID {alert.id}")
-
-                except Exception as e:
-                    print(f"check_sensor_alert: ERROR during Alert.objects.get_or_create: {e}")
-
-        # --- Resolve Alerts if *no* alert condition is met by this data point ---
-        # Check if this data point resolves any active alerts for *this specific sensor*.
-        if not alert_triggered_by_this_data:
-            # print(f"check_sensor_alert: No alert condition met by this data point ({data_value}). Checking for resolution for sensor ID {sensor.id}.") # Can uncomment
-            # Find any active alerts linked to this specific sensor
-            # Using the 'sensor' ForeignKey on the Alert model
-            active_alerts_for_sensor = Alert.objects.filter(
-                sensor=sensor, # Filter by the specific sensor
-                is_resolved=False
-            )
-            if active_alerts_for_sensor.exists():
-                # print(f"check_sensor_alert: Found active alerts for sensor ID {sensor.id} to resolve ({active_alerts_for_sensor.count()}).") # Can uncomment
-                for alert_to_resolve in active_alerts_for_sensor:
-                    # print(f"check_sensor_alert: Attempting to resolve Alert ID {alert_to_resolve.id}: {alert_to_resolve.message}") # Can uncomment
-                    alert_to_resolve.is_resolved = True
-                    alert_to_resolve.save(update_fields=['is_resolved']) # Use update_fields for efficiency
-                    print(f"check_sensor_alert: ^^^ Alert Resolved: Alert ID {alert_to_resolve.id}")
-            # else: # Can uncomment for debug
-                # print("check_sensor_alert: No active alerts for this sensor to resolve.")
-        # else: # Can uncomment for debug
-            # print("check_sensor_alert: At least one alert was triggered by this data point, not checking for resolution based on this data.")
 
+    print(f"check_sensor_alert: Processing {sensor.type} data: {sensor_data.value} in Greenhouse: {greenhouse.name} (ID: {greenhouse.id}) - {'Created' if created else 'Updated'}")
 
-    # else: # Can uncomment for debug
-        # print(f"check_sensor_alert: No alert thresholds defined for sensor type: {sensor_type}")
-
-
-    # --- Push Sensor Data Update to WebSocket Channel Layer ---
-    # This is the code that sends the message to the consumer via the channel layer.
-    if channel_layer: # Check if channel layer is configured and available
-        group_name = f'greenhouse_{greenhouse.id}' # Define the group name based on the greenhouse ID
-        # Create a dictionary with the data needed by the frontend
-        # This structure should match what the frontend's onmessage handler expects.
-        sensor_data_message = {
-            'type': 'sensor_data_update', # This must EXACTLY match the handler method name in the consumer (sensor_data_update)
-            'message': { # The payload of the message
-                'sensor_id': sensor.id, # Include sensor ID so frontend knows which sensor to update
-                # Pass the entire latest_reading object structure expected by the frontend state update logic
-                'latest_reading': {
-                    'value': sensor_data.value, # Include the latest value
-                    'timestamp': sensor_data.timestamp.isoformat() # Send timestamp as ISO format string
-                },
-                'sensor_type': sensor.type, # Include type for frontend unit display (used in SensorValueDisplay)
-                'sensor_name': sensor.name, # Include name for frontend if needed
-            }
-        }
-        print(f"check_sensor_alert: Sending sensor update message to group {group_name} with type '{sensor_data_message['type']}'")
+    evaluate_sensor_alerts(sensor, sensor_data.value, sensor_data.timestamp)
+
+    # --- Push Sensor Data Update to WebSocket Channel Layer (after commit, see dashboard/dispatch.py) ---
+    push_to_greenhouse(greenhouse.id, {
+        'type': 'sensor_data_update', # Handled by GreenhouseConsumer.sensor_data_update
+        'message': build_sensor_update(sensor, sensor_data.value, sensor_data.timestamp),
+    })
+
+
+# This receiver folds each new reading into the minute/hour/day rollups.
+# Updates of an existing reading are not re-applied (the old value is already counted).
+@receiver(post_save, sender=SensorData)
+def update_sensor_rollups(sender, instance, created, **kwargs):
+    """
+    Signal receiver to keep SensorRollup up to date for single-reading saves.
+    """
+    if created:
         try:
-             # Use async_to_sync because signals are synchronous and channel_layer.group_send is asynchronous
-             async_to_sync(channel_layer.group_send)(
-                 group_name, # Send the message to the specific greenhouse group
-                 sensor_data_message # The message dictionary containing type and data
-             )
-             print(f"check_sensor_alert: Message sent successfully to group {group_name}")
+            update_rollups([instance])
         except Exception as e:
-             print(f"check_sensor_alert: ERROR sending message to channel layer group {group_name}: {e}")
+            print(f"update_sensor_rollups: ERROR updating rollups for Sensor ID {instance.sensor_id}: {e}")
+
 
-    else:
-        print("check_sensor_alert: Channel layer not configured. Cannot send WebSocket push.")
+# These receivers keep the current-state tables (SensorState / ActuatorState) in sync
+# with single-row saves. The bulk ingestion path updates SensorState itself.
+@receiver(post_save, sender=SensorData)
+def update_sensor_state(sender, instance, **kwargs):
+    """
+    Signal receiver to record a saved reading as the sensor's current state if it is the newest.
+    """
+    try:
+        record_sensor_reading(instance)
+    except Exception as e:
+        print(f"update_sensor_state: ERROR updating state for Sensor ID {instance.sensor_id}: {e}")
 
 
-    print("check_sensor_alert: Signal finished.")
+@receiver(post_save, sender=ActuatorStatus)
+def update_actuator_state(sender, instance, **kwargs):
+    """
+    Signal receiver to record a saved status as the actuator's current state if it is the newest,
+    and push it to the greenhouse's sockets (after commit) when it is.
+    """
+    try:
+        if record_actuator_status(instance):
+            actuator = instance.actuator
+            push_to_greenhouse(actuator.greenhouse_id, {
+                'type': 'actuator_status', # Handled by GreenhouseConsumer.actuator_status
+                'actuator': build_actuator_update(actuator, instance),
+            })
+    except Exception as e:
+        print(f"update_actuator_state: ERROR updating state for Actuator ID {instance.actuator_id}: {e}")
 
 
 # --- Other signal receivers below ---
@@ -206,19 +195,31 @@ def resolve_alerts_on_sensor_delete(sender, instance, **kwargs):
     Signal receiver to resolve active alerts when a Sensor is deleted.
     """
     print(f"resolve_alerts_on_sensor_delete: Sensor {instance.name} (ID: {instance.id}) is being deleted. Resolving related alerts.")
-    # Find any active alerts linked to this sensor
-    # Using the 'alerts' related_name on the Sensor model
-    active_alerts_to_resolve = instance.alerts.filter(is_resolved=False)
-
-    if active_alerts_to_resolve.exists():
-        print(f"resolve_alerts_on_sensor_delete: Found active alerts ({active_alerts_to_resolve.count()}) for sensor ID {instance.id} to resolve.")
-        for alert_to_resolve in active_alerts_to_resolve:
-            print(f"resolve_alerts_on_sensor_delete: Resolving Alert ID {alert_to_resolve.id}: {alert_to_resolve.message}")
-            alert_to_resolve.is_resolved = True
-            alert_to_resolve.save(update_fields=['is_resolved']) # Use update_fields for efficiency
-        print(f"resolve_alerts_on_sensor_delete: All active alerts for sensor ID {instance.id} marked as resolved.")
-    else:
-        print(f"resolve_alerts_on_sensor_delete: No active alerts found for sensor ID {instance.id} to resolve.")
+    # Using the 'alerts' related_name on the Sensor model, one UPDATE for all of them
+    resolved = instance.alerts.filter(is_resolved=False).update(is_resolved=True, open_key=None, resolved_at=timezone.now())
+    alert_engine.forget(instance.id)
+    print(f"resolve_alerts_on_sensor_delete: {resolved} active alert(s) for sensor ID {instance.id} marked as resolved.")
+
+
+# This receiver keeps the alert engine's open-alert cache in sync with alerts
+# edited outside the engine (admin, API).
+@receiver(post_save, sender=Alert)
+def forget_cached_alert_state(sender, instance, **kwargs):
+    """
+    Signal receiver to drop the cached open-alert state of the alert's sensor.
+    """
+    if instance.sensor_id: # The engine itself writes with bulk_create/update, which send no post_save
+        alert_engine.forget(instance.sensor_id)
+
+
+# This receiver invalidates the compiled alert rules whenever a rule changes.
+@receiver(post_save, sender=AlertRule)
+@receiver(post_delete, sender=AlertRule)
+def invalidate_alert_rules(sender, instance, **kwargs):
+    """
+    Signal receiver to bump the alert rules cache version (dashboard/alerting.py).
+    """
+    alert_engine.rules.invalidate()
 
 
 # This receiver creates default sensors and initial data when a new Greenhouse is created.
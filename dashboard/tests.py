@@ -1,3 +1,1300 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import random
+import tempfile
+from base64 import b64encode
+from unittest import mock
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from twisted.internet.abstract import FileDescriptor
+from rest_framework_simplejwt.tokens import AccessToken
+from greengrow.asgi import application as asgi_application
+
+from .alerting import AlertEngine, DatabaseRules, StaticRules, alert_engine
+from .archive import (
+    EPOCH, ArchiveError, archived_months, count_range, legacy_column_paths, month_bounds, month_key, month_path,
+    read_range, sensor_dir, sensor_reading_chunks, sensor_readings, to_micros, write_month,
+)
+from .backtest import Backtest
+from .buffer import IngestBuffer
+from .consumers import SLOW_CLOSE_CODE, GreenhouseConsumer, Subscription
+from .frames import FRAME_MAGIC, FRAME_MEDIA_TYPE, HEADER, MAX_TIMESTAMP_MS, PUSH_SUBPROTOCOL, RECORD_DTYPE, decode_updates
+from .ingest import persist_readings
+from .middleware import transport_flow
+from .dispatch import FanoutDispatcher, get_dispatcher
+from .live_state import alert_key, connect_frame, current_position, fold_events, journal_events, new_state, replay
+from .management.commands.loadtest_websockets import run_load_test
+from .models import User, Greenhouse, Sensor, SensorData, SensorRollup, Alert, AlertRule
+from .rollups import RESOLUTIONS, bucket_start
+from .routing import websocket_urlpatterns
+from .serializers import SensorDataSerializer
+
+
+def make_greenhouse(username):
+    # post_save signals give the greenhouse its default sensors and actuators
+    user = User.objects.create_user(username=username, password='x')
+    greenhouse = Greenhouse.objects.create(user=user, name=f'{username} greenhouse', location='test')
+    return user, greenhouse
+
+
+class BulkIngestTests(TestCase):
+    def setUp(self):
+        self.user, self.greenhouse = make_greenhouse('ingest')
+        self.sensor = self.greenhouse.sensors.get(type='TEMP')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/greenhouses/{self.greenhouse.id}/readings/bulk/'
+
+    def test_json_reports_invalid_items_and_stores_the_rest(self):
+        response = self.client.post(self.url, [
+            {'sensor': self.sensor.id, 'value': 21.5},
+            {'sensor': 999999, 'value': 1.0},
+            {'sensor': self.sensor.id, 'value': 'warm'},
+            {'sensor': self.sensor.id, 'value': 22.0},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('sensor', response.data['errors'][0]['errors'])
+        self.assertIn('value', response.data['errors'][1]['errors'])
+
+    def test_ndjson_reports_unparsable_lines_as_items(self):
+        body = '\n'.join([
+            json.dumps({'sensor': self.sensor.id, 'value': 20.0}),
+            '{not json',
+            json.dumps({'sensor': self.sensor.id, 'value': 20.5}),
+        ]) + '\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['received'], 3)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+
+    def post_frame(self, base_ms, records):
+        body = HEADER.pack(FRAME_MAGIC, base_ms) + np.array(records, dtype=RECORD_DTYPE).tobytes()
+        return self.client.post(self.url, body, content_type=FRAME_MEDIA_TYPE)
+
+    def test_frame_reports_invalid_records(self):
+        base_ms = MAX_TIMESTAMP_MS - 1000
+        response = self.post_frame(base_ms, [
+            (self.sensor.id, 0, 21.0),
+            (999999, 0, 1.0), # Unknown sensor
+            (self.sensor.id, 10, float('nan')), # Non-finite value
+            (self.sensor.id, 5000, 22.0), # Past year 9999
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        errors = {error['index']: set(error['errors']) for error in response.data['errors']}
+        self.assertEqual(errors, {1: {'sensor'}, 2: {'value'}, 3: {'timestamp'}})
+
+    def test_frame_with_out_of_range_base_is_rejected(self):
+        response = self.post_frame(2 ** 62, [(self.sensor.id, 0, 21.0)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SensorData.objects.filter(sensor=self.sensor, value=21.0).exists())
+
+
+@override_settings(SENSOR_INGEST={'MODE': 'buffered', 'FLUSH_INTERVAL_MS': 2000})
+class BufferedIngestTests(TestCase):
+    def setUp(self):
+        self.user, self.greenhouse = make_greenhouse('buffered')
+        self.sensor = self.greenhouse.sensors.get(type='TEMP')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Not started: the test flushes it by hand
+        self.buffer = IngestBuffer(capacity=4, flush_interval_ms=2000, flush_batch_size=100)
+        patcher = mock.patch('dashboard.views.get_ingest_buffer', return_value=self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bulk_url = f'/api/greenhouses/{self.greenhouse.id}/readings/bulk/'
+        self.data_url = f'/api/greenhouses/{self.greenhouse.id}/sensors/{self.sensor.id}/data/'
+
+    def test_bulk_is_acknowledged_then_written_by_the_flush(self):
+        response = self.client.post(self.bulk_url, [
+            {'sensor': self.sensor.id, 'value': 30.5}, {'sensor': 999999, 'value': 1.0}, {'sensor': self.sensor.id, 'value': 31.5},
+        ], format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.data['accepted'], [error['index'] for error in response.data['errors']]), (2, [1]))
+        self.assertFalse(SensorData.objects.filter(sensor=self.sensor, value__in=[30.5, 31.5]).exists())
+        self.buffer.flush()
+        self.assertEqual(SensorData.objects.filter(sensor=self.sensor, value__in=[30.5, 31.5]).count(), 2)
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_full_buffer_answers_429_and_queues_nothing(self):
+        self.assertEqual(self.client.post(self.bulk_url, [{'sensor': self.sensor.id, 'value': v} for v in (1.0, 2.0, 3.0)], format='json').status_code, 202)
+        response = self.client.post(self.bulk_url, [{'sensor': self.sensor.id, 'value': v} for v in (4.0, 5.0)], format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(len(self.buffer), 3) # All or nothing
+        response = self.client.post(self.data_url, {'sensor': self.sensor.id, 'value': 6.0}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.post(self.data_url, {'sensor': self.sensor.id, 'value': 7.0}, format='json').status_code, 429)
+
+    def test_single_reading_goes_to_the_sensor_in_the_url(self):
+        other_user, other_greenhouse = make_greenhouse('buffered-other')
+        other_sensor = other_greenhouse.sensors.get(type='TEMP')
+        response = self.client.post(self.data_url, {'sensor': other_sensor.id, 'value': 42.5}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.buffer.flush()
+        self.assertTrue(SensorData.objects.filter(sensor=self.sensor, value=42.5).exists())
+        self.assertFalse(SensorData.objects.filter(sensor=other_sensor, value=42.5).exists())
+
+        foreign_url = f'/api/greenhouses/{other_greenhouse.id}/sensors/{other_sensor.id}/data/'
+        self.assertEqual(self.client.post(foreign_url, {'sensor': other_sensor.id, 'value': 1.0}, format='json').status_code, 404)
+        self.assertEqual(len(self.buffer), 0)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user, self.greenhouse = make_greenhouse('rollups')
+        self.sensor = Sensor.objects.create(greenhouse=self.greenhouse, type='TEMP', name='rollups')
+        self.start = datetime(2025, 5, 10, 11, 58, tzinfo=dt_timezone.utc)
+
+    def readings(self, values, step=timedelta(seconds=20), offset=timedelta()):
+        return [SensorData(sensor=self.sensor, value=value, timestamp=self.start + offset + i * step) for i, value in enumerate(values)]
+
+    def expected(self, resolution):
+        buckets = {}
+        for timestamp, value in SensorData.objects.filter(sensor=self.sensor).order_by('timestamp', 'id').values_list('timestamp', 'value'):
+            bucket = buckets.setdefault(bucket_start(timestamp, resolution), [0, 0.0, value, value, None, None])
+            bucket[0] += 1
+            bucket[1] += value
+            bucket[2], bucket[3] = min(bucket[2], value), max(bucket[3], value)
+            bucket[4], bucket[5] = value, timestamp
+        return {start: (count, round(total, 6), low, high, last, at) for start, (count, total, low, high, last, at) in buckets.items()}
+
+    def stored(self, resolution):
+        return {
+            row.bucket_start: (row.count, round(row.value_sum, 6), row.value_min, row.value_max, row.last_value, row.last_timestamp)
+            for row in SensorRollup.objects.filter(sensor=self.sensor, resolution=resolution)
+        }
+
+    def test_incremental_rollups_match_raw_readings(self):
+        rng = random.Random(3)
+        persist_readings(self.greenhouse, self.readings([rng.uniform(15, 30) for _ in range(400)]))
+        # A late batch landing in buckets that already exist, with older timestamps than their last reading
+        persist_readings(self.greenhouse, self.readings([rng.uniform(15, 30) for _ in range(50)], offset=timedelta(seconds=7)))
+        SensorData.objects.create(sensor=self.sensor, value=40.0, timestamp=self.start + timedelta(hours=3)) # post_save path
+        for resolution in RESOLUTIONS:
+            with self.subTest(resolution=resolution):
+                self.assertEqual(self.stored(resolution), self.expected(resolution))
+
+    def test_rebuild_matches_incremental(self):
+        persist_readings(self.greenhouse, self.readings([float(i % 17) for i in range(300)]))
+        incremental = {resolution: self.stored(resolution) for resolution in RESOLUTIONS}
+        SensorRollup.objects.filter(sensor=self.sensor).update(count=0)
+        call_command('rebuild_rollups', sensor=[self.sensor.id], chunk_size=64, stdout=io.StringIO())
+        self.assertEqual({resolution: self.stored(resolution) for resolution in RESOLUTIONS}, incremental)
+
+    def test_history_picks_the_finest_resolution_that_fits(self):
+        persist_readings(self.greenhouse, self.readings([20.0 + i % 5 for i in range(600)], step=timedelta(seconds=30)))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/greenhouses/{self.greenhouse.id}/sensors/{self.sensor.id}/history/'
+        params = {'since': self.start.isoformat(), 'until': (self.start + timedelta(hours=5)).isoformat()}
+        for points, resolution, count in ((1000, 'raw', 600), (400, 'minute', 300), (10, 'hour', 6)):
+            with self.subTest(points=points):
+                response = client.get(url, {**params, 'points': points})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['resolution'], resolution)
+                self.assertEqual(len(response.data['points']), count)
+        response = client.get(url, {**params, 'resolution': 'hour'})
+        self.assertEqual(sum(point['count'] for point in response.data['points']), 600)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        settings_override = override_settings(SENSOR_ARCHIVE={'ROOT': self.root.name, 'MIN_AGE_DAYS': 90})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(self.root.cleanup)
+        self.user, self.greenhouse = make_greenhouse('archive')
+        self.sensor = Sensor.objects.create(greenhouse=self.greenhouse, type='TEMP', name='archive')
+        self.now = timezone.now().replace(microsecond=0)
+        # Four months of old readings (archived) and a week of recent ones (kept)
+        old = [self.now - timedelta(days=200) + timedelta(hours=7 * i) for i in range(400)]
+        recent = [self.now - timedelta(days=7) + timedelta(hours=i) for i in range(100)]
+        persist_readings(self.greenhouse, [
+            SensorData(sensor=self.sensor, value=float(i % 50), timestamp=timestamp) for i, timestamp in enumerate(old + recent)
+        ])
+        self.series = list(SensorData.objects.filter(sensor=self.sensor).order_by('timestamp', 'id').values_list('timestamp', 'value'))
+
+    def archive(self):
+        call_command('archive_sensordata', sensor=[self.sensor.id], chunk_size=64, stdout=io.StringIO())
+
+    def everything(self):
+        return list(sensor_readings(self.sensor, EPOCH, self.now + timedelta(days=1), chunk_size=64))
+
+    def test_archived_and_hot_readings_read_as_one_series(self):
+        self.archive()
+        cutoff = self.now - timedelta(days=90)
+        self.assertEqual(SensorData.objects.filter(sensor=self.sensor, timestamp__lt=cutoff).count(), 0)
+        self.assertEqual(self.everything(), self.series)
+        self.assertEqual(count_range(self.sensor.id, EPOCH, self.now), len([1 for timestamp, _ in self.series if timestamp < cutoff]))
+        chunks = list(sensor_reading_chunks(self.sensor, EPOCH, self.now + timedelta(days=1), chunk_size=64))
+        self.assertEqual([micros for timestamps, _ in chunks for micros in timestamps.tolist()], [to_micros(t) for t, _ in self.series])
+
+    def test_rearchiving_a_month_keeps_one_copy(self):
+        self.archive()
+        key = sorted(archived_months(self.sensor.id, EPOCH, self.now))[0]
+        rows = [(to_micros(timestamp), value) for timestamp, value in read_range(self.sensor.id, *month_bounds(key))]
+        self.assertEqual(write_month(self.sensor.id, key, rows), len(rows))
+        self.assertEqual(self.everything(), self.series)
+
+    def test_a_month_is_a_single_file(self):
+        self.archive()
+        files = sorted(path.name for path in sensor_dir(self.sensor.id).iterdir())
+        self.assertTrue(files)
+        self.assertTrue(all(name.endswith('.col') for name in files), files)
+
+    def test_mismatched_columns_raise(self):
+        self.archive()
+        key = archived_months(self.sensor.id, EPOCH, self.now)[0]
+        path = month_path(self.sensor.id, key)
+        with open(path, 'r+b') as f:
+            f.truncate(path.stat().st_size - 4) # One value short
+        with self.assertRaises(ArchiveError):
+            list(read_range(self.sensor.id, EPOCH, self.now))
+
+    def test_legacy_months_are_read_and_converted(self):
+        key = month_key(self.now - timedelta(days=400))
+        ts_path, val_path = legacy_column_paths(self.sensor.id, key)
+        ts_path.parent.mkdir(parents=True)
+        start = to_micros(month_bounds(key)[0])
+        ts_path.write_bytes(np.array([start, start + 1], dtype='<i8').tobytes())
+        val_path.write_bytes(np.array([1.5, 2.5], dtype='<f4').tobytes())
+        self.assertEqual([value for _, value in read_range(self.sensor.id, *month_bounds(key))], [1.5, 2.5])
+
+        write_month(self.sensor.id, key, [(start + 2, 3.5)])
+        self.assertFalse(ts_path.exists() or val_path.exists())
+        self.assertEqual([value for _, value in read_range(self.sensor.id, *month_bounds(key))], [1.5, 2.5, 3.5])
+
+        ts_path.write_bytes(np.array([start], dtype='<i8').tobytes())
+        val_path.write_bytes(np.array([1.5, 2.5], dtype='<f4').tobytes())
+        month_path(self.sensor.id, key).unlink()
+        with self.assertRaises(ArchiveError):
+            list(read_range(self.sensor.id, *month_bounds(key)))
+
+    def test_rebuild_rollups_keeps_archived_readings(self):
+        self.archive()
+        before = list(SensorRollup.objects.filter(sensor=self.sensor).order_by('resolution', 'bucket_start').values_list(
+            'resolution', 'bucket_start', 'count', 'value_sum'))
+        call_command('rebuild_rollups', sensor=[self.sensor.id], stdout=io.StringIO())
+        after = list(SensorRollup.objects.filter(sensor=self.sensor).order_by('resolution', 'bucket_start').values_list(
+            'resolution', 'bucket_start', 'count', 'value_sum'))
+        self.assertEqual(after, before)
+
+    def test_listing_refuses_archived_ranges(self):
+        self.archive()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/greenhouses/{self.greenhouse.id}/sensors/{self.sensor.id}/data/'
+        response = client.get(url, {'since': (self.now - timedelta(days=150)).isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.data)
+        self.assertEqual(client.get(url, {'until': (self.now - timedelta(days=1)).isoformat()}).status_code, 400)
+        response = client.get(url, {'since': (self.now - timedelta(days=30)).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 100)
+
+        history = client.get(f'/api/greenhouses/{self.greenhouse.id}/sensors/{self.sensor.id}/history/', {
+            'since': EPOCH.isoformat(), 'until': self.now.isoformat(), 'points': 1000, 'resolution': 'raw',
+        })
+        self.assertEqual(len(history.data['points']), len([1 for timestamp, _ in self.series if timestamp <= self.now]))
+
+
+class CurrentStateTests(TestCase):
+    def setUp(self):
+        self.user, self.greenhouse = make_greenhouse('state')
+        self.sensor = Sensor.objects.create(greenhouse=self.greenhouse, type='TEMP', name='state')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def latest_reading(self):
+        response = self.client.get(f'/api/greenhouses/{self.greenhouse.id}/sensors/{self.sensor.id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['latest_reading']
+
+    def expected(self):
+        return dict(SensorDataSerializer(SensorData.objects.filter(sensor=self.sensor).order_by('-timestamp', '-id').first()).data)
+
+    def test_latest_reading_keeps_the_reading_shape(self):
+        SensorData.objects.create(sensor=self.sensor, value=21.0, notes='calibrated')
+        self.assertEqual(self.latest_reading(), self.expected())
+        self.assertEqual(self.latest_reading()['notes'], 'calibrated')
+
+    def test_bulk_ingest_without_returned_ids(self):
+        now = timezone.now()
+        readings = [SensorData(sensor=self.sensor, value=float(i), timestamp=now + timedelta(seconds=i), notes=f'n{i}') for i in range(5)]
+        # MySQL: bulk_create leaves pk unset
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            persist_readings(self.greenhouse, readings)
+        latest = self.latest_reading()
+        self.assertIsNotNone(latest['id'])
+        self.assertEqual(latest, self.expected())
+        self.assertEqual(latest['notes'], 'n4')
+
+    def test_older_reading_does_not_replace_the_state(self):
+        now = timezone.now()
+        SensorData.objects.create(sensor=self.sensor, value=21.0, timestamp=now)
+        persist_readings(self.greenhouse, [SensorData(sensor=self.sensor, value=5.0, timestamp=now - timedelta(hours=1))])
+        self.assertEqual(self.latest_reading()['value'], 21.0)
+
+
+class ExportTests(TransactionTestCase):
+    rows = 20000
+
+    def setUp(self):
+        self.user, self.greenhouse = make_greenhouse('export')
+        self.sensor = Sensor.objects.create(greenhouse=self.greenhouse, type='TEMP', name='export')
+        start = timezone.now() - timedelta(days=10)
+        SensorData.objects.bulk_create([
+            SensorData(sensor=self.sensor, value=i / 10, timestamp=start + timedelta(seconds=i)) for i in range(self.rows)
+        ], batch_size=2000)
+        self.url = f'/api/greenhouses/{self.greenhouse.id}/sensors/{self.sensor.id}/export/'
+
+    def test_csv_ndjson_and_gzip(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        csv_body = b''.join(client.get(self.url).streaming_content)
+        lines = csv_body.decode().splitlines()
+        self.assertEqual(lines[0], 'sensor_id,sensor_name,sensor_type,timestamp,value')
+        self.assertEqual(len(lines), self.rows + 2) # Header and the reading the new sensor starts with
+        ndjson_body = b''.join(client.get(self.url, {'output': 'ndjson'}).streaming_content)
+        self.assertEqual(len(ndjson_body.splitlines()), self.rows + 1)
+        self.assertEqual(json.loads(ndjson_body.splitlines()[0])['sensor_id'], self.sensor.id)
+        response = client.get(self.url, {'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), csv_body)
+
+    def test_asgi_export_is_streamed(self):
+        """
+        Under the ASGI handler the first block must go out long before the last row is read.
+        """
+        rows_read = [0]
+        sent = [] # (rows read when the body message was sent, body)
+
+        def counting_readings(*args, **kwargs):
+            for row in sensor_readings(*args, **kwargs):
+                rows_read[0] += 1
+                yield row
+
+        requested = []
+
+        async def receive():
+            if not requested:
+                requested.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await asyncio.Event().wait() # The client stays connected
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                self.assertEqual(message['status'], 200)
+            elif message['type'] == 'http.response.body' and message.get('body'):
+                sent.append((rows_read[0], message['body']))
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': self.url, 'raw_path': self.url.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {AccessToken.for_user(self.user)}'.encode())],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+        with mock.patch('dashboard.export.sensor_readings', counting_readings):
+            async_to_sync(ASGIHandler())(scope, receive, send)
+
+        self.assertGreater(len(sent), 5)
+        self.assertLess(sent[0][0], self.rows // 4)
+        self.assertEqual(len(b''.join(body for _, body in sent).splitlines()), self.rows + 2)
+
+
+class AlertRuleTests(TestCase):
+    """
+    Global rules come from the 0010 migration: TEMP greater_than 30, less_than 10.
+    """
+    def setUp(self):
+        self.user, self.greenhouse = make_greenhouse('rules')
+        self.sensor = self.greenhouse.sensors.get(type='TEMP')
+        self.neighbour = Sensor.objects.create(greenhouse=self.greenhouse, type='TEMP', name='neighbour')
+        _, other_greenhouse = make_greenhouse('rules-other')
+        self.elsewhere = other_greenhouse.sensors.get(type='TEMP')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/greenhouses/{self.greenhouse.id}/alert-rules/'
+        alert_engine.rules.invalidate()
+
+    def thresholds(self, sensor, rules=None):
+        rules = rules or alert_engine.rules
+        return {rule.condition: rule.threshold for rule in rules.rules_for(sensor)}
+
+    def rule(self, **fields):
+        return {'sensor_type': 'TEMP', 'condition': 'greater_than', 'threshold': 28.0, 'message': 'Hot {{ value }}', **fields}
+
+    def test_most_specific_scope_applies(self):
+        self.assertEqual(self.client.post(self.url, self.rule(), format='json').status_code, 201)
+        self.assertEqual(self.client.post(self.url, self.rule(sensor=self.sensor.id, threshold=25.0), format='json').status_code, 201)
+        # An inactive rule masks the global one for its scope
+        self.assertEqual(self.client.post(self.url, self.rule(sensor=self.sensor.id, condition='less_than', threshold=0.0, is_active=False), format='json').status_code, 201)
+        self.assertEqual(self.thresholds(self.sensor), {'greater_than': 25.0})
+        self.assertEqual(self.thresholds(self.neighbour), {'greater_than': 28.0, 'less_than': 10.0})
+        self.assertEqual(self.thresholds(self.elsewhere), {'greater_than': 30.0, 'less_than': 10.0})
+
+    def test_rule_changes_reach_the_cache(self):
+        other_process = DatabaseRules()
+        self.assertEqual(self.thresholds(self.sensor, other_process)['greater_than'], 30.0)
+        response = self.client.post(self.url, self.rule(), format='json')
+        self.assertEqual(self.thresholds(self.sensor)['greater_than'], 28.0) # This process: at once
+        with mock.patch('dashboard.alerting.RULES_VERSION_CHECK_INTERVAL', 0): # Others: at their next version check
+            self.assertEqual(self.thresholds(self.sensor, other_process)['greater_than'], 28.0)
+            self.client.patch(f"{self.url}{response.data['id']}/", {'threshold': 27.0}, format='json')
+            self.assertEqual(self.thresholds(self.sensor, other_process)['greater_than'], 27.0)
+            self.client.delete(f"{self.url}{response.data['id']}/")
+            self.assertEqual(self.thresholds(self.sensor, other_process)['greater_than'], 30.0)
+
+    def test_one_rule_per_scope(self):
+        self.assertEqual(self.client.post(self.url, self.rule(), format='json').status_code, 201)
+        self.assertEqual(self.client.post(self.url, self.rule(threshold=35.0), format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, self.rule(sensor=self.sensor.id), format='json').status_code, 201)
+        self.assertEqual(self.client.post(self.url, self.rule(sensor=self.sensor.id), format='json').status_code, 400)
+
+        # Admin forms validate the model's constraints; a sensor rule takes its sensor's greenhouse first
+        duplicate = AlertRule(sensor_type='TEMP', condition='greater_than', threshold=1.0, message='x', sensor=self.sensor)
+        with self.assertRaises(ValidationError):
+            duplicate.full_clean()
+        # Direct ORM writes hit the database constraint, in every scope
+        for fields in ({'greenhouse': self.greenhouse}, {'sensor': self.sensor}, {}):
+            with self.subTest(scope=fields), self.assertRaises(IntegrityError), transaction.atomic():
+                AlertRule.objects.create(sensor_type='TEMP', condition='greater_than', threshold=1.0, message='x', **fields)
+        AlertRule.objects.create(sensor_type='TEMP', condition='greater_than', threshold=1.0, message='x', sensor=self.neighbour)
+
+
+class AlertRaceTests(TestCase):
+    """
+    Two workers, each with its own in-memory state, seeing readings of the same sensor.
+    """
+    rules = {'TEMP': {'greater_than': {'threshold': 30.0, 'message': 'High {{ value }}', 'min_consecutive': 2}}}
+
+    def setUp(self):
+        _, self.greenhouse = make_greenhouse('alert-race')
+        self.sensor = Sensor.objects.create(greenhouse=self.greenhouse, type='TEMP', name='raced')
+        Alert.objects.filter(greenhouse=self.greenhouse).delete() # Opened by the sensors' initial 0.0 readings
+        self.start = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        self.first, self.second = AlertEngine(StaticRules(self.rules)), AlertEngine(StaticRules(self.rules))
+        # Both load the sensor's (empty) open-alert state before either opens the alert
+        self.first.sensor_state(self.sensor)
+        self.second.sensor_state(self.sensor)
+        publisher = mock.patch('dashboard.alerting.publish_alert')
+        self.published = publisher.start()
+        self.addCleanup(publisher.stop)
+
+    def feed(self, engine, values, offset):
+        for i, value in enumerate(values):
+            engine.evaluate(self.sensor, value, self.start + timedelta(seconds=offset + i))
+
+    def events(self, event_type):
+        return [call for call in self.published.call_args_list if call.args[0] == event_type]
+
+    def test_second_opener_merges_into_the_open_alert(self):
+        self.feed(self.first, [31.0, 35.0, 32.0], 0)
+        self.feed(self.second, [33.0, 34.0], 10)
+        alert = Alert.objects.get(sensor=self.sensor)
+        # 2 readings written when the first worker opened it (32.0 waits for write_summaries), plus the second's 2
+        self.assertEqual((alert.reading_count, alert.peak_value, alert.last_value), (4, 35.0, 34.0))
+        self.assertEqual(len(self.events('alert_opened')), 1)
+        # The merged summary is the second worker's state from now on
+        self.assertEqual(self.second.sensor_state(self.sensor).rules['TEMP:greater_than'].reading_count, 4)
+
+    def test_lost_insert_race_merges_instead_of_failing(self):
+        self.feed(self.first, [31.0, 36.0], 0)
+        merge = AlertEngine.merge_open_alert
+        calls = []
+
+        def merge_after_race(engine, rule, rule_state):
+            calls.append(rule_state.open_key)
+            # The first lookup runs before the other worker's INSERT commits
+            return len(calls) > 1 and merge(engine, rule, rule_state)
+
+        with mock.patch.object(AlertEngine, 'merge_open_alert', merge_after_race):
+            self.feed(self.second, [32.0, 33.0], 10)
+        self.assertEqual(len(calls), 2)
+        alert = Alert.objects.get(sensor=self.sensor)
+        self.assertEqual((alert.reading_count, alert.peak_value, alert.last_value), (4, 36.0, 33.0))
+        self.assertEqual(len(self.events('alert_opened')), 1)
+
+    def test_resolved_is_published_once(self):
+        self.feed(self.first, [31.0, 32.0], 0)
+        self.feed(self.second, [33.0, 34.0], 10)
+        self.feed(self.first, [20.0], 20)
+        self.feed(self.second, [21.0], 21)
+        self.assertTrue(Alert.objects.get(sensor=self.sensor).is_resolved)
+        self.assertEqual(len(self.events('alert_resolved')), 1)
+
+        self.feed(self.first, [31.0, 32.0], 30) # The next excursion opens a new alert
+        self.assertEqual(Alert.objects.filter(sensor=self.sensor, is_resolved=False).count(), 1)
+        self.assertEqual(len(self.events('alert_opened')), 2)
+
+
+class AlertListTests(TestCase):
+    def setUp(self):
+        self.user, self.greenhouse = make_greenhouse('alert-list')
+        Alert.objects.filter(greenhouse=self.greenhouse).delete() # Opened by the sensors' initial 0.0 readings
+        self.sensors = list(self.greenhouse.sensors.all()[:2])
+        self.start = timezone.now().replace(microsecond=0) - timedelta(days=10)
+        rng = random.Random(16)
+        alerts = []
+        for i in range(60):
+            resolved = rng.random() < 0.5
+            # Pairs of alerts share created_at, so pages must break ties on id
+            created_at = self.start + timedelta(hours=i // 2)
+            alerts.append(Alert(
+                greenhouse=self.greenhouse, sensor=self.sensors[i % 2], rule_key='TEMP:greater_than',
+                severity=rng.choice(['INFO', 'WARNING', 'CRITICAL']), message=f'alert {i}',
+                is_resolved=resolved, resolved_at=created_at + timedelta(minutes=5) if resolved else None,
+                created_at=created_at,
+            ))
+        Alert.objects.bulk_create(alerts)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/greenhouses/{self.greenhouse.id}/alerts/'
+
+    def walk(self, params):
+        ids, url = [], self.url
+        response = self.client.get(url, {**params, 'page_size': 7})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [alert['id'] for alert in response.data['results']]
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def expected(self, queryset):
+        return list(queryset.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_filters_and_pages(self):
+        alerts = Alert.objects.filter(greenhouse=self.greenhouse)
+        since, until = self.start + timedelta(hours=5), self.start + timedelta(hours=20)
+        cases = [
+            ({}, alerts),
+            ({'severity': 'warning,CRITICAL'}, alerts.filter(severity__in=['WARNING', 'CRITICAL'])),
+            ({'sensor': self.sensors[1].id}, alerts.filter(sensor=self.sensors[1])),
+            ({'resolved': 'false'}, alerts.filter(is_resolved=False)),
+            ({'since': since.isoformat(), 'until': until.isoformat(), 'resolved': '1'},
+             alerts.filter(created_at__gte=since, created_at__lte=until, is_resolved=True)),
+        ]
+        for params, queryset in cases:
+            with self.subTest(params=params):
+                self.assertEqual(self.walk(params), self.expected(queryset))
+
+        for params in ({'severity': 'LOUD'}, {'sensor': 'x'}, {'resolved': 'maybe'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_counts(self):
+        alerts = Alert.objects.filter(greenhouse=self.greenhouse)
+        response = self.client.get(self.url + 'counts/')
+        self.assertEqual(response.status_code, 200)
+        open_alerts = alerts.filter(is_resolved=False)
+        self.assertEqual(response.data['by_severity'], {
+            severity: open_alerts.filter(severity=severity).count() for severity in ('INFO', 'WARNING', 'CRITICAL')
+        })
+        self.assertEqual(response.data['total'], open_alerts.count())
+
+        # ?severity= is ignored by counts (it is what the counts are broken down by)
+        response = self.client.get(self.url + 'counts/', {'resolved': 'true', 'sensor': self.sensors[0].id, 'severity': 'INFO'})
+        self.assertEqual(response.data['total'], alerts.filter(is_resolved=True, sensor=self.sensors[0]).count())
+
+    def test_other_users_greenhouse(self):
+        other, _ = make_greenhouse('alert-list-other')
+        client = APIClient()
+        client.force_authenticate(other)
+        self.assertEqual(client.get(self.url).data['results'], [])
+        self.assertEqual(client.get(self.url + 'counts/').status_code, 404)
+
+
+class AlertEngineBatchTests(TestCase):
+    """
+    evaluate_batch() must leave the same alerts and state as evaluate() called per reading.
+    """
+    def setUp(self):
+        _, self.greenhouse = make_greenhouse('alerts')
+        self.per_reading = Sensor.objects.create(greenhouse=self.greenhouse, type='TEMP', name='per reading')
+        self.batched = Sensor.objects.create(greenhouse=self.greenhouse, type='TEMP', name='batched')
+
+    def alerts(self, sensor):
+        return list(Alert.objects.filter(sensor=sensor).order_by('created_at', 'rule_key').values_list(
+            'rule_key', 'message', 'is_resolved', 'created_at', 'resolved_at', 'last_value', 'peak_value', 'reading_count',
+        ))
+
+    def test_batch_matches_per_reading_evaluation(self):
+        opened = 0
+        for trial in range(10):
+            rng = random.Random(trial)
+            engine = AlertEngine(StaticRules({'TEMP': {
+                'greater_than': {'threshold': 30.0, 'message': 'High {{ value }}', 'hysteresis': rng.choice([0.0, 1.0]),
+                                 'min_consecutive': rng.choice([1, 3]), 'min_duration': rng.choice([0, 5])},
+                'less_than': {'threshold': 10.0, 'message': 'Low {{ value }}', 'min_consecutive': rng.choice([1, 2])},
+            }}))
+            Alert.objects.filter(sensor__in=[self.per_reading, self.batched]).delete()
+
+            start = timezone.now().replace(microsecond=0) - timedelta(days=1)
+            timestamps = [start + timedelta(seconds=i) for i in range(300)]
+            value, values = 28.0, []
+            for _ in timestamps:
+                value += rng.uniform(-1.2, 1.2)
+                if rng.random() < 0.02:
+                    value = rng.choice([5.0, 9.5, 30.0, 31.0])
+                values.append(round(value, 2))
+
+            for timestamp, value in zip(timestamps, values):
+                engine.evaluate(self.per_reading, value, timestamp)
+            position = 0
+            while position < len(values):
+                end = min(len(values), position + rng.choice([1, 3, 17, 60, 300]))
+                engine.evaluate_batch(
+                    {self.batched.id: self.batched}, [self.batched.id] * (end - position),
+                    [to_micros(timestamp) for timestamp in timestamps[position:end]], values[position:end],
+                )
+                position = end
+            for sensor in (self.per_reading, self.batched):
+                engine.write_summaries(engine.sensor_state(sensor), force=True)
+
+            opened += Alert.objects.filter(sensor=self.per_reading).count()
+            with self.subTest(trial=trial):
+                self.assertEqual(self.alerts(self.per_reading), self.alerts(self.batched))
+                for created_at, resolved_at in Alert.objects.filter(is_resolved=True).values_list('created_at', 'resolved_at'):
+                    self.assertLessEqual(created_at, resolved_at)
+        self.assertGreater(opened, 0)
+
+
+class BacktestTests(TestCase):
+    thresholds = {'TEMP': {
+        'greater_than': {'threshold': 30.0, 'message': 'High', 'hysteresis': 1.0, 'min_consecutive': 3},
+        'less_than': {'threshold': 10.0, 'message': 'Low', 'min_duration': 60},
+    }}
+
+    def setUp(self):
+        self.user, self.greenhouse = make_greenhouse('backtest')
+        self.sensor = Sensor.objects.create(greenhouse=self.greenhouse, type='TEMP', name='history')
+        self.replayed = Sensor.objects.create(greenhouse=self.greenhouse, type='TEMP', name='replayed')
+        Alert.objects.filter(greenhouse=self.greenhouse).delete() # Opened by the sensors' initial 0.0 readings
+        self.since = timezone.now().replace(microsecond=0) - timedelta(days=3)
+        rng = random.Random(14)
+        value, self.readings = 20.0, []
+        for i in range(2000):
+            value += rng.uniform(-1.5, 1.5)
+            if rng.random() < 0.01:
+                value = rng.choice([5.0, 33.0, 20.0])
+            self.readings.append((self.since + timedelta(seconds=30 * i), round(value, 2)))
+        SensorData.objects.bulk_create([SensorData(sensor=self.sensor, value=v, timestamp=t) for t, v in self.readings])
+        self.until = self.readings[-1][0]
+
+    def test_report_matches_the_alert_engine(self):
+        engine = AlertEngine(StaticRules(self.thresholds))
+        for timestamp, value in self.readings:
+            engine.evaluate(self.replayed, value, timestamp)
+        alerts = Alert.objects.filter(sensor=self.replayed)
+        self.assertTrue(alerts.exists())
+
+        for chunk_size in (7, 500, 50000): # Excursions and pending breaches straddle chunk boundaries
+            with self.subTest(chunk_size=chunk_size):
+                report = Backtest({'rules': StaticRules(self.thresholds)}, chunk_size=chunk_size).run([self.sensor], self.since, self.until)
+                self.assertEqual(report['readings'], len(self.readings))
+                by_rule = {rule['rule_key']: rule for rule in report['rule_sets']['rules']}
+                for rule_key, rule in by_rule.items():
+                    opened = alerts.filter(rule_key=rule_key)
+                    resolved = opened.filter(is_resolved=True)
+                    self.assertEqual(
+                        (rule['alerts'], rule['resolved'], rule['open_at_end']),
+                        (opened.count(), resolved.count(), opened.count() - resolved.count()),
+                    )
+                    durations = sum((alert.resolved_at - alert.created_at).total_seconds() for alert in resolved)
+                    self.assertAlmostEqual(rule['duration_s']['total'], durations, places=2)
+
+    def test_endpoint_compares_rule_sets_without_writing_alerts(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/greenhouses/{self.greenhouse.id}/alert-backtest/'
+        before = Alert.objects.count()
+        response = client.post(url, {
+            'since': self.since.isoformat(), 'until': self.until.isoformat(), 'sensors': [self.sensor.id],
+            'rules': [{'sensor_type': 'TEMP', 'condition': 'greater_than', 'threshold': 25.0, 'min_consecutive': 2}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['rule_sets']), {'current', 'candidate'})
+        candidate = response.data['rule_sets']['candidate'][0]
+        current = {rule['rule_key']: rule for rule in response.data['rule_sets']['current']}['TEMP:greater_than']
+        self.assertEqual((candidate['threshold'], current['threshold']), (25.0, 30.0))
+        self.assertGreater(candidate['alerts'], 0)
+        self.assertEqual(Alert.objects.count(), before)
+
+        too_long = client.post(url, {'since': (self.until - timedelta(days=100)).isoformat(), 'until': self.until.isoformat()}, format='json')
+        self.assertEqual(too_long.status_code, 400)
+        _, other_greenhouse = make_greenhouse('backtest-other')
+        foreign = client.post(f'/api/greenhouses/{other_greenhouse.id}/alert-backtest/', {
+            'since': self.since.isoformat(), 'until': self.until.isoformat(),
+        }, format='json')
+        self.assertEqual(foreign.status_code, 404)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user, self.greenhouse = make_greenhouse('pages')
+        self.sensor = self.greenhouse.sensors.get(type='TEMP')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/greenhouses/{self.greenhouse.id}/sensors/{self.sensor.id}/data/'
+        timestamp = timezone.now() - timedelta(hours=1)
+        # Ties on the timestamp are broken by id
+        SensorData.objects.bulk_create([SensorData(sensor=self.sensor, value=i, timestamp=timestamp) for i in range(5)])
+
+    def test_pages_cover_every_row_once(self):
+        seen = []
+        url = f'{self.url}?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        expected = list(SensorData.objects.filter(sensor=self.sensor).order_by('-timestamp', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_previous_links_walk_back(self):
+        pages, url = [], f'{self.url}?page_size=2'
+        while url:
+            response = self.client.get(url)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data['next']
+        back, url = [], response.data['previous']
+        while url:
+            response = self.client.get(url)
+            back.insert(0, [row['id'] for row in response.data['results']])
+            url = response.data['previous']
+        self.assertEqual(back, pages[:-1])
+
+    def test_bad_cursor_is_not_found(self):
+        for cursor in ('not-base64!', b64encode(b'o=x').decode(), b64encode(b'p=not a date').decode(), b64encode(b'p=2025-13-40').decode()):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(str(response.data['detail']), 'Invalid cursor')
+
+
+class LiveStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _, self.greenhouse = make_greenhouse('live')
+        self.group = f'greenhouse_{self.greenhouse.id}'
+        self.sensor = self.greenhouse.sensors.get(type='TEMP')
+
+    def update(self, value):
+        return {'type': 'sensor_data_update', 'message': {
+            'sensor_id': self.sensor.id, 'latest_reading': {'value': value, 'timestamp': timezone.now().isoformat()},
+            'sensor_type': 'TEMP', 'sensor_name': self.sensor.name,
+        }}
+
+    def alert(self, event_type, open_key, **fields):
+        return {'type': event_type, 'alert': {'open_key': open_key, 'sensor_id': self.sensor.id, **fields}}
+
+    def test_fold_events(self):
+        before = {'sensors': {}, 'actuators': [], 'alerts': [{'id': 7, 'open_key': None}, {'id': 8, 'open_key': 'x:LOW'}]}
+        state = fold_events(new_state(before), [
+            self.update(20.0),
+            self.update(21.0),
+            self.alert('alert_opened', 'x:HIGH'),
+            self.alert('alert_resolved', 'x:HIGH'),
+            self.alert('alert_resolved', 'x:LOW'),
+            self.alert('alert_resolved', None, id=7), # Legacy alert without open_key
+            self.alert('alert_resolved', 'y:HIGH'), # Opened before the state
+        ])
+        self.assertEqual(state['sensors'][self.sensor.id]['latest_reading']['value'], 21.0)
+        self.assertEqual(state['alerts'], {})
+        self.assertEqual(state['resolved'], {'y:HIGH'})
+        self.assertEqual(alert_key({'id': 7, 'open_key': None}), 'id:7')
+
+    def test_connect_frame_delta_and_full(self):
+        journal_events(self.group, [self.update(20.0)])
+        full, seq = connect_frame(self.greenhouse.id, self.group)
+        self.assertEqual(full['mode'], 'full')
+        self.assertEqual(seq, 1)
+
+        journal_events(self.group, [self.update(25.0), self.alert('alert_opened', 'x:HIGH')])
+        delta, seq = connect_frame(self.greenhouse.id, self.group, full['token'])
+        self.assertEqual(delta['mode'], 'delta')
+        self.assertEqual(seq, 3)
+        self.assertEqual([sensor['latest_reading']['value'] for sensor in delta['sensors']], [25.0])
+        self.assertEqual([alert['open_key'] for alert in delta['alerts']], ['x:HIGH'])
+
+        epoch = full['token'].rpartition('.')[0]
+        for token in ('garbage', f'other-epoch.{seq}', f'{epoch}.{seq + 10}'):
+            with self.subTest(token=token):
+                frame, _ = connect_frame(self.greenhouse.id, self.group, token)
+                self.assertEqual(frame['mode'], 'full')
+
+        cache.clear() # Journal lost: the old token can't be trusted any more
+        frame, _ = connect_frame(self.greenhouse.id, self.group, delta['token'])
+        self.assertEqual(frame['mode'], 'full')
+
+
+class FakeChannelLayer:
+    def __init__(self, failing=(), stalled=()):
+        self.failing, self.stalled = set(failing), set(stalled)
+        self.sent = [] # (group, event)
+
+    async def group_send(self, group, event):
+        if group in self.stalled:
+            await asyncio.sleep(10)
+        if group in self.failing:
+            raise RuntimeError('channel layer down')
+        self.sent.append((group, event))
+
+
+class DispatcherTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def dispatcher(self, layer, capacity=100, send_timeout=1.0):
+        return FanoutDispatcher(layer, capacity=capacity, flush_interval_ms=25, max_batch=500, send_timeout=send_timeout)
+
+    def events(self, count):
+        return [{'type': 'sensor_data_update', 'message': {'sensor_id': 1, 'value': i}} for i in range(count)]
+
+    def journaled(self, group, count):
+        epoch, seq = current_position(group)
+        return seq, replay(group, epoch, seq - count, seq)
+
+    def test_one_send_per_group_in_order(self):
+        layer = FakeChannelLayer()
+        dispatcher = self.dispatcher(layer)
+        for event in self.events(3):
+            dispatcher.enqueue('greenhouse_1', event)
+        dispatcher.enqueue('greenhouse_2', self.events(1)[0])
+        dispatcher.flush()
+
+        sent = dict(layer.sent)
+        self.assertEqual(len(layer.sent), 2)
+        self.assertEqual(sent['greenhouse_1']['type'], 'dispatch_batch')
+        self.assertEqual([event['seq'] for event in sent['greenhouse_1']['events']], [1, 2, 3])
+        self.assertEqual([event['message']['value'] for event in sent['greenhouse_1']['events']], [0, 1, 2])
+        self.assertEqual((sent['greenhouse_2']['type'], sent['greenhouse_2']['group']), ('sensor_data_update', 'greenhouse_2'))
+        self.assertEqual(self.journaled('greenhouse_1', 3), (3, sent['greenhouse_1']['events']))
+        self.assertEqual(len(dispatcher), 0)
+
+    def test_failed_or_timed_out_sends_are_not_journaled(self):
+        layer = FakeChannelLayer(failing={'greenhouse_2'}, stalled={'greenhouse_3'})
+        dispatcher = self.dispatcher(layer, send_timeout=0.2)
+        for group in ('greenhouse_1', 'greenhouse_2'):
+            for event in self.events(2):
+                dispatcher.enqueue(group, event)
+        dispatcher.flush()
+        self.assertEqual([group for group, _ in layer.sent], ['greenhouse_1'])
+        self.assertEqual(self.journaled('greenhouse_1', 2)[1], layer.sent[0][1]['events'])
+        # Numbered but never delivered: a resume across them must fall back to a snapshot
+        self.assertEqual(self.journaled('greenhouse_2', 2), (2, None))
+
+        dispatcher.enqueue('greenhouse_3', self.events(1)[0])
+        dispatcher.flush()
+        self.assertEqual(self.journaled('greenhouse_3', 1), (1, None))
+
+        dispatcher.enqueue('greenhouse_2', self.events(1)[0]) # Layer back for this group
+        layer.failing.clear()
+        dispatcher.flush()
+        epoch, seq = current_position('greenhouse_2')
+        self.assertEqual(seq, 3)
+        self.assertEqual(replay('greenhouse_2', epoch, 2, 3), [layer.sent[-1][1]])
+
+    def test_overflow_drops_oldest(self):
+        layer = FakeChannelLayer()
+        dispatcher = self.dispatcher(layer, capacity=3)
+        for event in self.events(5):
+            dispatcher.enqueue('greenhouse_1', event)
+        dispatcher.flush()
+        self.assertEqual([event['message']['value'] for event in layer.sent[0][1]['events']], [2, 3, 4])
+
+    def test_publish_waits_for_commit(self):
+        layer = FakeChannelLayer()
+        dispatcher = self.dispatcher(layer)
+        with self.captureOnCommitCallbacks() as callbacks:
+            dispatcher.publish('greenhouse_1', self.events(1)[0])
+            self.assertEqual(len(dispatcher), 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(dispatcher), 1)
+
+
+def stalled_consumer(policy, subprotocols=()):
+    """
+    A GreenhouseConsumer whose client reads nothing until consumer.released is set.
+    """
+    consumer = GreenhouseConsumer()
+    consumer.scope = {'query_string': f'on_slow={policy}'.encode(), 'subprotocols': list(subprotocols)}
+    consumer.subscriptions = {}
+    consumer.setup_feed()
+    consumer.released = asyncio.Event()
+    consumer.delivered = []
+    consumer.close_code = None
+
+    async def send(text_data=None, bytes_data=None):
+        await consumer.released.wait()
+        consumer.delivered.append(json.loads(text_data) if text_data is not None else decode_updates(bytes_data))
+
+    async def close(code=None):
+        consumer.close_code = code
+
+    consumer.send, consumer.close = send, close
+    return consumer
+
+
+async def drain(consumer):
+    consumer.released.set()
+    while consumer.writer is not None:
+        await asyncio.sleep(0.01)
+
+
+class SlowClientQueueTests(TestCase):
+    def update(self, sensor_id, value):
+        return {'sensor_id': sensor_id, 'sensor_type': 'TEMP', 'sensor_name': f'sensor {sensor_id}',
+                'latest_reading': {'value': value, 'timestamp': timezone.now().isoformat()}}
+
+    @override_settings(WS_PUSH={'MAX_SEND_QUEUE': 6})
+    async def test_control_frames_are_never_evicted(self):
+        for policy in ('drop_oldest', 'coalesce'):
+            with self.subTest(policy=policy):
+                consumer = stalled_consumer(policy, [PUSH_SUBPROTOCOL])
+                subscription = Subscription(1)
+                await consumer.send_json(subscription.start({'type': 'snapshot', 'token': 'e.0', 'sensors': [], 'alerts': []}, 0))
+                for round in range(10):
+                    # Sensors 100..102 are new in the first rounds: each needs its dictionary frame
+                    sensors = [100 + round] if round < 3 else [100, 101, 102]
+                    await consumer.send_binary_updates(subscription, [self.update(sensor_id, round) for sensor_id in sensors])
+                self.assertEqual(len(consumer.outbox), 6)
+                await drain(consumer)
+
+                self.assertIsNone(consumer.close_code)
+                self.assertEqual(consumer.delivered[0]['type'], 'snapshot')
+                known = set()
+                for frame in consumer.delivered[1:]:
+                    if isinstance(frame, dict):
+                        self.assertEqual(frame['type'], 'sensor_dictionary')
+                        known |= {entry['index'] for entry in frame['sensors']}
+                    else:
+                        self.assertLessEqual(set(frame[3]['index'].tolist()), known) # Described before use
+                self.assertEqual(known, {0, 1, 2})
+                self.assertEqual(float(consumer.delivered[-1][3]['value'][-1]), 9.0) # The newest frame survives
+                await consumer.stop_feed()
+
+    @override_settings(WS_PUSH={'MAX_SEND_QUEUE': 3})
+    async def test_full_queue_of_control_frames_disconnects(self):
+        consumer = stalled_consumer('drop_oldest')
+        for i in range(4):
+            await consumer.send_json({'type': 'alert_opened', 'alert': {'open_key': f'{i}:TEMP:greater_than'}}, 'greenhouse_1')
+        self.assertEqual(consumer.close_code, SLOW_CLOSE_CODE)
+        self.assertEqual(len(consumer.outbox), 0)
+        await consumer.stop_feed()
+
+
+class UnreadConnection(FileDescriptor):
+    """
+    A Twisted connection whose peer reads nothing until drain(), driven without a reactor.
+    """
+    def __init__(self):
+        super().__init__(reactor=mock.Mock())
+        self.connected = 1
+        self.reading = False
+        self.daphne_producer = mock.Mock() # Stands for the HTTPChannel Daphne leaves registered
+        self.registerProducer(self.daphne_producer, True)
+
+    def startWriting(self):
+        pass
+
+    def stopWriting(self):
+        pass
+
+    def writeSomeData(self, data):
+        return len(data) if self.reading else 0
+
+    def drain(self):
+        self.reading = True
+        self.doWrite()
+
+
+def daphne_consumer(policy, connection):
+    """
+    A GreenhouseConsumer whose send writes into connection like Daphne's, with the
+    TransportFlow TransportFlowMiddleware would put in its scope.
+    """
+    protocol = mock.Mock(transport=connection)
+    flow = transport_flow(partial(mock.Mock(), protocol))
+    consumer = GreenhouseConsumer()
+    consumer.scope = {'query_string': f'on_slow={policy}'.encode(), 'subprotocols': [], 'transport_flow': flow}
+    consumer.subscriptions = {}
+    consumer.setup_feed()
+    consumer.delivered = []
+    consumer.close_code = None
+
+    async def send(text_data=None, bytes_data=None):
+        consumer.delivered.append(json.loads(text_data))
+        connection.write(text_data.encode())
+
+    async def close(code=None):
+        consumer.close_code = code
+
+    consumer.send, consumer.close = send, close
+    return consumer, flow
+
+
+@override_settings(WS_PUSH={'MAX_SEND_QUEUE': 5})
+class TransportFlowTests(TestCase):
+    def frame(self, i):
+        return json.dumps({'type': 'sensor_updates', 'n': i, 'updates': [{'pad': 'x' * 2000}]})
+
+    async def push(self, consumer, frames):
+        for i in range(frames):
+            await consumer.queue_frame('greenhouse_1', text_data=self.frame(i), droppable=True)
+            await asyncio.sleep(0) # Lets the writer run, as between channel layer messages
+
+    def test_flow_follows_the_transport_buffer(self):
+        connection = UnreadConnection()
+        send = partial(mock.Mock(), mock.Mock(transport=connection))
+        flow = transport_flow(send)
+        self.assertIs(transport_flow(send), flow)
+        self.assertIsNone(transport_flow(mock.AsyncMock())) # Not Daphne's send
+
+        connection.write(b'x' * (connection.bufferSize + 1))
+        self.assertFalse(flow.writable.is_set())
+        self.assertGreaterEqual(flow.stalled_for(), 0.0)
+        connection.daphne_producer.pauseProducing.assert_called_once()
+
+        connection.drain()
+        self.assertTrue(flow.writable.is_set())
+        self.assertEqual(flow.stalled_for(), 0.0)
+        connection.daphne_producer.resumeProducing.assert_called_once()
+
+    async def test_drop_oldest_keeps_the_newest_frames(self):
+        connection = UnreadConnection()
+        consumer, flow = daphne_consumer('drop_oldest', connection)
+        await self.push(consumer, 100)
+        self.assertFalse(flow.writable.is_set())
+        self.assertEqual(len(consumer.outbox), 5) # Held back in the consumer, not in Daphne's buffer
+        self.assertLess(len(connection._tempDataBuffer), 40)
+
+        connection.drain()
+        while consumer.writer is not None:
+            await asyncio.sleep(0.01)
+        sent = [frame['n'] for frame in consumer.delivered]
+        self.assertLess(len(sent), 100)
+        self.assertEqual(sent[-5:], [95, 96, 97, 98, 99])
+        self.assertIsNone(consumer.close_code)
+        await consumer.stop_feed()
+
+    async def test_disconnect_policy_closes_a_client_that_stopped_reading(self):
+        consumer, _ = daphne_consumer('disconnect', UnreadConnection())
+        await self.push(consumer, 100)
+        self.assertEqual(consumer.close_code, SLOW_CLOSE_CODE)
+        await consumer.stop_feed()
+
+    async def test_coalesce_defers_updates_while_the_client_is_behind(self):
+        connection = UnreadConnection()
+        consumer, flow = daphne_consumer('coalesce', connection)
+        consumer.tick = 0.01
+        subscription = Subscription(1)
+        subscription.start({'type': 'snapshot', 'token': 'e.0', 'sensors': [], 'alerts': []}, 0)
+        consumer.subscriptions[subscription.group] = subscription
+        for i in range(300):
+            consumer.queue_update(subscription, {'sensor_id': i % 3, 'sensor_type': 'TEMP', 'sensor_name': 'x' * 2000,
+                                                 'latest_reading': {'value': float(i), 'timestamp': '2026-01-01T00:00:00+00:00'}})
+            await asyncio.sleep(0.002)
+        self.assertFalse(flow.writable.is_set())
+        self.assertLessEqual(len(consumer.outbox), 1) # Ticks wait for the queued frame instead of piling up
+
+        connection.drain()
+        await asyncio.sleep(0.1)
+        newest = {update['sensor_id']: update['latest_reading']['value'] for frame in consumer.delivered for update in frame['updates']}
+        self.assertEqual(newest, {0: 297.0, 1: 298.0, 2: 299.0})
+        self.assertIsNone(consumer.close_code)
+        consumer.subscriptions.clear() # Never joined a channel layer group
+        await consumer.stop_feed()
+
+
+def reset_live_feed():
+    """
+    Empties the process-wide dispatcher, channel layer and live-state cache, so events of an
+    earlier test (whose ids TransactionTestCase reuses) don't reach this one's sockets.
+    """
+    dispatcher = get_dispatcher()
+    if dispatcher is not None:
+        dispatcher.flush()
+    async_to_sync(get_channel_layer().flush)()
+    cache.clear()
+
+
+class GreenhouseConsumerTests(TransactionTestCase):
+    def setUp(self):
+        reset_live_feed()
+        _, self.greenhouse = make_greenhouse('socket')
+        self.sensor = self.greenhouse.sensors.get(type='TEMP')
+        self.application = URLRouter(websocket_urlpatterns)
+
+    async def test_snapshot_then_coalesced_updates(self):
+        communicator = WebsocketCommunicator(self.application, f'/ws/greenhouses/{self.greenhouse.id}/data/?tick_ms=250')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(snapshot['type'], 'snapshot')
+        self.assertIn(self.sensor.id, [sensor['sensor_id'] for sensor in snapshot['sensors']])
+
+        for value in (20.0, 21.0, 22.0):
+            await sync_to_async(SensorData.objects.create)(sensor=self.sensor, value=value)
+        latest = None
+        while latest != 22.0:
+            frame = await communicator.receive_json_from(timeout=5)
+            if frame['type'] != 'sensor_updates':
+                continue
+            self.assertEqual(frame['greenhouse'], self.greenhouse.id)
+            # Coalesced: at most one entry per sensor and frame, carrying the newest value
+            mine = [update for update in frame['updates'] if update['sensor_id'] == self.sensor.id]
+            self.assertLessEqual(len(mine), 1)
+            if mine:
+                latest = mine[0]['latest_reading']['value']
+        await communicator.disconnect()
+
+    async def test_binary_updates_with_sensor_dictionary(self):
+        communicator = WebsocketCommunicator(
+            self.application, f'/ws/greenhouses/{self.greenhouse.id}/data/?tick_ms=250', subprotocols=[PUSH_SUBPROTOCOL],
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, PUSH_SUBPROTOCOL)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'snapshot')
+
+        index, values = None, []
+        for value in (23.5, 24.5):
+            await sync_to_async(SensorData.objects.create)(sensor=self.sensor, value=value)
+            while True:
+                frame = await communicator.receive_from(timeout=5)
+                if isinstance(frame, str):
+                    dictionary = json.loads(frame)
+                    if dictionary['type'] != 'sensor_dictionary':
+                        continue # Alerts of the initial 0.0 reading resolving
+                    described = {entry['sensor_id']: entry['index'] for entry in dictionary['sensors']}
+                    if self.sensor.id in described:
+                        self.assertIsNone(index, "A sensor is only described once per socket")
+                        index = described[self.sensor.id]
+                    continue
+                greenhouse_id, _, _, records = decode_updates(frame)
+                self.assertEqual(greenhouse_id, self.greenhouse.id)
+                mine = records[records['index'] == index] if index is not None else records[:0]
+                if len(mine) and float(mine['value'][-1]) == value:
+                    values.append(float(mine['value'][-1]))
+                    break
+        self.assertEqual(values, [23.5, 24.5])
+        await communicator.disconnect()
+
+    async def test_multiplexed_socket_requires_a_user(self):
+        communicator = WebsocketCommunicator(self.application, '/ws/greenhouses/')
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+
+class MultiplexedSocketTests(TransactionTestCase):
+    """
+    ws/greenhouses/ through the project's ASGI application, authenticated with JWT access tokens.
+    """
+    def setUp(self):
+        reset_live_feed()
+        self.user, self.greenhouse = make_greenhouse('multiplex')
+        _, self.other_greenhouse = make_greenhouse('multiplex-other')
+        self.temp = self.greenhouse.sensors.get(type='TEMP')
+        self.humidity = self.greenhouse.sensors.get(type='AIR_HUM')
+        self.token = str(AccessToken.for_user(self.user))
+
+    async def connect(self, path='/ws/greenhouses/?tick_ms=250', headers=None):
+        communicator = WebsocketCommunicator(asgi_application, path, headers=headers or [])
+        connected, code = await communicator.connect()
+        return communicator, connected, code
+
+    async def receive_type(self, communicator, frame_type):
+        while True:
+            frame = await communicator.receive_json_from(timeout=5)
+            if frame['type'] == frame_type:
+                return frame
+
+    async def test_access_token_authenticates(self):
+        communicator, connected, _ = await self.connect(f'/ws/greenhouses/?token={self.token}')
+        self.assertTrue(connected)
+        await communicator.send_json_to({'action': 'subscribe', 'greenhouse': self.greenhouse.id})
+        snapshot = await self.receive_type(communicator, 'snapshot')
+        self.assertEqual(snapshot['greenhouse'], self.greenhouse.id)
+        await communicator.send_json_to({'action': 'subscribe', 'greenhouse': self.other_greenhouse.id})
+        error = await self.receive_type(communicator, 'error')
+        self.assertIn(str(self.other_greenhouse.id), error['error'])
+        await communicator.disconnect()
+
+        communicator, connected, _ = await self.connect(headers=[(b'authorization', f'Bearer {self.token}'.encode())])
+        self.assertTrue(connected)
+        await communicator.disconnect()
+
+    async def test_bad_tokens_are_refused(self):
+        expired = AccessToken.for_user(self.user)
+        expired.set_exp(lifetime=-timedelta(minutes=1))
+        for token in ('not-a-jwt', self.token[:-2] + 'xx', str(expired)):
+            with self.subTest(token=token):
+                communicator, connected, code = await self.connect(f'/ws/greenhouses/?token={token}')
+                self.assertFalse(connected)
+                self.assertEqual(code, 4401)
+        _, connected, code = await self.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    async def test_subscribe_filters_and_unsubscribe(self):
+        communicator, connected, _ = await self.connect(f'/ws/greenhouses/?tick_ms=250&token={self.token}')
+        self.assertTrue(connected)
+        await communicator.send_json_to({'action': 'subscribe', 'greenhouse': self.greenhouse.id, 'sensors': [self.temp.id]})
+        snapshot = await self.receive_type(communicator, 'snapshot')
+        self.assertEqual({sensor['sensor_id'] for sensor in snapshot['sensors']}, {self.temp.id})
+
+        await sync_to_async(SensorData.objects.create)(sensor=self.humidity, value=55.0)
+        await sync_to_async(SensorData.objects.create)(sensor=self.temp, value=23.5)
+        latest = None
+        while latest != 23.5:
+            updates = await self.receive_type(communicator, 'sensor_updates')
+            self.assertEqual(updates['greenhouse'], self.greenhouse.id)
+            self.assertEqual({update['sensor_id'] for update in updates['updates']}, {self.temp.id})
+            latest = updates['updates'][-1]['latest_reading']['value']
+
+        # Subscribing again replaces the filter: by type now
+        await communicator.send_json_to({'action': 'subscribe', 'greenhouse': self.greenhouse.id, 'sensor_types': ['air_hum']})
+        snapshot = await self.receive_type(communicator, 'snapshot')
+        self.assertEqual({sensor['sensor_id'] for sensor in snapshot['sensors']}, {self.humidity.id})
+
+        await communicator.send_json_to({'action': 'unsubscribe', 'greenhouse': self.greenhouse.id})
+        self.assertEqual(await self.receive_type(communicator, 'unsubscribed'), {'type': 'unsubscribed', 'greenhouse': self.greenhouse.id})
+        await sync_to_async(SensorData.objects.create)(sensor=self.humidity, value=56.0)
+        self.assertTrue(await communicator.receive_nothing(timeout=0.6))
+        await communicator.disconnect()
+
+
+class LoadHarnessTests(TransactionTestCase):
+    def test_small_load_run(self):
+        cache.clear()
+        result = asyncio.run(run_load_test(greenhouses=2, connections=20, rate=40.0, duration=1.0, tick_ms=250, settle=0.5))
+        self.assertEqual(result['readings'], 40)
+        self.assertEqual(result['ingest_errors'], 0)
+        self.assertEqual(result['closed_sockets'], 0)
+        self.assertGreater(result['updates'], 0)
+        self.assertIsNotNone(result['latency_ms']['p50'])
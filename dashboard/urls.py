@@ -10,12 +10,20 @@ from .views import (
     SensorDataViewSet,
     ActuatorViewSet,
     ActuatorStatusViewSet,
+    AlertRuleViewSet,
+    GreenhouseAlertRuleViewSet,
+    AlertViewSet,
     GreenhouseOverview, # Your existing overview view
+    SensorDataBulkIngest,
+    SensorDataExport,
+    AlertBacktest,
+    MetricsView,
 )
 
 # Use DefaultRouter for top-level viewsets
 router = DefaultRouter()
 router.register(r'greenhouses', GreenhouseViewSet, basename='greenhouse')
+router.register(r'alert-rules', AlertRuleViewSet, basename='alert-rule') # Global rules
 
 # Create a nested router for sensors under greenhouses
 greenhouses_router = routers.NestedSimpleRouter(router, r'greenhouses', lookup='greenhouse')
@@ -28,6 +36,12 @@ sensors_router.register(r'data', SensorDataViewSet, basename='sensor-data')
 # Create a nested router for actuators under greenhouses
 greenhouses_router.register(r'actuators', ActuatorViewSet, basename='greenhouse-actuators')
 
+# Alert rules scoped to a greenhouse or one of its sensors
+greenhouses_router.register(r'alert-rules', GreenhouseAlertRuleViewSet, basename='greenhouse-alert-rules')
+
+# Alerts of a greenhouse (cursor-paginated list, filters, per-severity counts)
+greenhouses_router.register(r'alerts', AlertViewSet, basename='greenhouse-alerts')
+
 # Create a further nested router for actuator status under actuators
 actuators_router = routers.NestedSimpleRouter(greenhouses_router, r'actuators', lookup='actuator')
 actuators_router.register(r'status', ActuatorStatusViewSet, basename='actuator-status')
@@ -49,5 +63,18 @@ urlpatterns = [
     # Custom overview endpoint (make sure this path is correct and matches your urls.py)
     path('greenhouses/<int:greenhouse_id>/overview/', GreenhouseOverview.as_view(), name='greenhouse-overview'),
 
+    # Bulk ingestion of readings for many sensors of one greenhouse (JSON array or NDJSON)
+    path('greenhouses/<int:greenhouse_id>/readings/bulk/', SensorDataBulkIngest.as_view(), name='greenhouse-readings-bulk'),
+
+    # Streaming CSV/NDJSON export of reading history (whole greenhouse or one sensor)
+    path('greenhouses/<int:greenhouse_id>/export/', SensorDataExport.as_view(), name='greenhouse-export'),
+    path('greenhouses/<int:greenhouse_id>/sensors/<int:sensor_id>/export/', SensorDataExport.as_view(), name='sensor-export'),
+
+    # Replay of the reading history through current / candidate alert rules (no Alert rows written)
+    path('greenhouses/<int:greenhouse_id>/alert-backtest/', AlertBacktest.as_view(), name='greenhouse-alert-backtest'),
+
+    # Per-process metrics (ingestion buffer queue depth, flush latency, ...)
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+
     # Add other custom URLs if you have them
 ]
\ No newline at end of file
@@ -0,0 +1,36 @@
+# dashboard/utils.py
+from datetime import timezone as dt_timezone
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def parse_timestamp_param(query_params, name):
+    """
+    Reads an ISO 8601 timestamp from the query string.
+    Returns an aware datetime (naive values are taken as UTC) or None if the parameter is absent.
+    """
+    raw = query_params.get(name)
+    if not raw:
+        return None
+    try:
+        value = parse_datetime(raw)
+    except ValueError:
+        value = None
+    if value is None:
+        raise ValidationError({name: "Expected an ISO 8601 timestamp, e.g. 2025-05-10T12:00:00Z."})
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, dt_timezone.utc)
+    return value
+
+
+def parse_time_range(query_params):
+    """
+    Returns (since, until) from the 'since'/'until' query parameters; either may be None.
+    """
+    since = parse_timestamp_param(query_params, 'since')
+    until = parse_timestamp_param(query_params, 'until')
+    if since and until and since > until:
+        raise ValidationError({'since': "'since' must be before 'until'."})
+    return since, until
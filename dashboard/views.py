@@ -4,28 +4,63 @@ from django.core.exceptions import PermissionDenied
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from .models import Sensor, SensorData, Greenhouse, Actuator, ActuatorStatus
-from .serializers import SensorSerializer, SensorDataSerializer, GreenhouseSerializer, ActuatorSerializer, ActuatorStatusSerializer
+from .models import Sensor, SensorData, Greenhouse, Actuator, ActuatorStatus, AlertRule, Alert
+from .serializers import SensorSerializer, SensorDataSerializer, GreenhouseSerializer, ActuatorSerializer, ActuatorStatusSerializer, SensorRollupSerializer, AlertRuleSerializer, BacktestSerializer, AlertSerializer
 from .permissions import IsAdminOrReadOnly, IsOwner
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404, render
 from django.db.models import Prefetch
 from rest_framework.response import Response
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from django.utils import timezone
+from datetime import timedelta
+from .parsers import NDJSONParser, SensorFrameParser
+from .frames import ReadingFrame
+from .ingest import ingest_readings, ingest_frame, ingest_setting, validate_readings, validate_frame
+from .buffer import BufferFull, buffered_mode, get_ingest_buffer
+from . import metrics
+from rest_framework.permissions import IsAdminUser
+from .rollups import RAW, RESOLUTIONS, choose_resolution, rollup_history
+from .utils import parse_time_range
+from .pagination import KeysetPagination, AlertPagination
+from .constants import ALERT_SEVERITIES
+from django.db.models import Count
+from .archive import archived_until, sensor_readings, EPOCH
+from .export import EXPORT_FORMATS, aexport_stream, export_stream
+from .backtest import Backtest, candidate_rules
+from .alerting import alert_engine
+from django.http import StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from itertools import islice
 import pdb
 
 
 
+OVERVIEW_ALERT_LIMIT = 20 # Open alert messages embedded in GreenhouseOverview
+
+
+def buffer_full_response(error):
+    """
+    429 with a Retry-After hint matching the buffer's flush interval.
+    """
+    response = Response({'error': str(error)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = max(1, round(ingest_setting('FLUSH_INTERVAL_MS') / 1000))
+    return response
+
+
 # ------------ Sensor ViewSet ------------
 class SensorViewSet(viewsets.ModelViewSet):
     serializer_class = SensorSerializer
     queryset = Sensor.objects.select_related(
-        'greenhouse'
-    ).prefetch_related('readings').all()
+        'greenhouse', 'current_state'
+    ).all()
     
     def get_queryset(self):
         return Sensor.objects.filter(
             greenhouse_id=self.kwargs['greenhouse_pk'],
             greenhouse__user=self.request.user
-        )
+        ).select_related('current_state') # latest_reading comes from the current-state table
     
     def perform_create(self, serializer):
         greenhouse = Greenhouse.objects.get(pk=self.kwargs['greenhouse_pk']) # Corrected line
@@ -33,22 +68,121 @@ class SensorViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("You do not own this greenhouse.")
         serializer.save(greenhouse=greenhouse) # Corrected line
 
+    @action(detail=True, methods=['get'])
+    def history(self, request, greenhouse_pk=None, pk=None):
+        """
+        Chart data for one sensor: GET .../sensors/{id}/history/?since=&until=&points=500
+        Returns raw readings when they fit in the point budget, otherwise the finest
+        rollup (minute, hour, day) that does. ?resolution= forces a specific one.
+        """
+        sensor = self.get_object()
+        since, until = parse_time_range(request.query_params)
+        until = until or timezone.now()
+        since = since or until - timedelta(days=1)
+
+        try:
+            max_points = int(request.query_params.get('points', 500))
+        except ValueError:
+            raise ValidationError({'points': "Expected an integer."})
+        if not 1 <= max_points <= 10000:
+            raise ValidationError({'points': "Must be between 1 and 10000."})
+
+        resolution = request.query_params.get('resolution') or choose_resolution(sensor, since, until, max_points)
+        if resolution == RAW:
+            # Reads through the cold-storage archive and the live table as one series
+            points = [
+                {'timestamp': timestamp, 'value': value}
+                for timestamp, value in islice(sensor_readings(sensor, since, until), max_points)
+            ]
+        elif resolution in RESOLUTIONS:
+            points = SensorRollupSerializer(rollup_history(sensor, resolution, since, until), many=True).data
+        else:
+            raise ValidationError({'resolution': f"Expected one of: {', '.join([RAW, *RESOLUTIONS])}."})
+
+        return Response({
+            'sensor': sensor.id,
+            'resolution': resolution,
+            'since': since,
+            'until': until,
+            'points': points,
+        })
+
 
 class SensorDataViewSet(viewsets.ModelViewSet):
+    """
+    Readings of one sensor, newest first, paginated by cursor.
+    Optional ?since= / ?until= (ISO 8601) restrict the time range.
+    Only readings still in the SensorData table are listed: a range reaching readings moved
+    to the archive (archive_sensordata) is refused with 400, the sensor's history/ endpoint
+    (?resolution=raw) and export/ read archived and live readings as one series.
+    """
     serializer_class = SensorDataSerializer
+    pagination_class = KeysetPagination
+
+    def create(self, request, *args, **kwargs):
+        """
+        In buffered ingestion mode the reading is queued and acknowledged with 202
+        (429 when the buffer is full); otherwise it is saved as usual.
+        """
+        if not buffered_mode():
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        sensor = self.get_sensor()
+        reading = SensorData(**{**serializer.validated_data, 'sensor': sensor})
+        try:
+            get_ingest_buffer().offer(sensor.greenhouse, [reading])
+        except BufferFull as e:
+            return buffer_full_response(e)
+        return Response(SensorDataSerializer(reading).data, status=status.HTTP_202_ACCEPTED)
+
+    def get_sensor(self):
+        """
+        The sensor from the URL, if it belongs to one of the user's greenhouses (404 otherwise).
+        Readings are always stored for it, whatever 'sensor' the body names.
+        """
+        return get_object_or_404(
+            Sensor.objects.select_related('greenhouse'),
+            pk=self.kwargs['sensor_pk'],
+            greenhouse_id=self.kwargs['greenhouse_pk'],
+            greenhouse__user=self.request.user,
+        )
+
+    def perform_create(self, serializer):
+        serializer.save(sensor=self.get_sensor())
 
     def get_queryset(self):
-        return SensorData.objects.filter(
+        queryset = SensorData.objects.filter(
             sensor_id=self.kwargs['sensor_pk'],
             sensor__greenhouse__user_id=self.request.user.id
         )
+        since, until = parse_time_range(self.request.query_params)
+        if since or until:
+            self.check_archived_range(since)
+        if since:
+            queryset = queryset.filter(timestamp__gte=since)
+        if until:
+            queryset = queryset.filter(timestamp__lte=until)
+        return queryset
+
+    def check_archived_range(self, since):
+        """
+        Refuses a range that starts at or before the newest archived reading: its pages
+        would silently miss the archived rows.
+        """
+        newest = archived_until(self.get_sensor().id)
+        if newest is not None and (since is None or since <= newest):
+            raise ValidationError({'since': (
+                f"Readings up to {newest.isoformat()} are archived and not listed here; "
+                "use the sensor's history/ (resolution=raw) or export/ endpoint for this range."
+            )})
     
 
 class GreenhouseViewSet(viewsets.ModelViewSet):
     serializer_class = GreenhouseSerializer
     permission_classes = [IsAdminOrReadOnly | IsOwner]
     queryset = Greenhouse.objects.prefetch_related(
-        Prefetch('sensors', queryset=Sensor.objects.all().prefetch_related('readings'))
+        Prefetch('sensors', queryset=Sensor.objects.select_related('current_state'))
     ).all()
 
     # Add pdb.set_trace() here
@@ -68,7 +202,10 @@ class GreenhouseViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         # This is where the error happens if request.user is AnonymousUser
         print(f"--- In GreenhouseViewSet get_queryset. Request User: {self.request.user} ---") # Debug print
-        return Greenhouse.objects.filter(user=self.request.user)
+        # Two queries for any number of greenhouses: greenhouses, then sensors joined with their current state
+        return Greenhouse.objects.filter(user=self.request.user).prefetch_related(
+            Prefetch('sensors', queryset=Sensor.objects.select_related('current_state'))
+        )
 
     def perform_create(self, serializer):
         greenhouse = serializer.save(user=self.request.user)
@@ -85,7 +222,7 @@ class ActuatorViewSet(viewsets.ModelViewSet):
         return Actuator.objects.filter(
             greenhouse_id=self.kwargs['greenhouse_pk'], # 'greenhouse_pk' comes from nested URL
             greenhouse__user=self.request.user
-        ).select_related('greenhouse').prefetch_related('statuses') # Pre-fetch statuses for latest_status field
+        ).select_related('greenhouse', 'current_state') # current_state feeds the latest_status field
 
     def perform_create(self, serializer):
         """
@@ -105,15 +242,23 @@ class ActuatorViewSet(viewsets.ModelViewSet):
 class ActuatorStatusViewSet(viewsets.ModelViewSet):
     serializer_class = ActuatorStatusSerializer
     permission_classes = [IsAuthenticated, IsOwner] # Or a specific permission for creating statuses
+    pagination_class = KeysetPagination # Cursor on (timestamp, id), newest first
 
     def get_queryset(self):
         """
         Returns status updates for a specific actuator, ensuring the user owns the greenhouse.
+        Optional ?since= / ?until= (ISO 8601) restrict the time range.
         """
-        return ActuatorStatus.objects.filter(
+        queryset = ActuatorStatus.objects.filter(
             actuator_id=self.kwargs['actuator_pk'], # 'actuator_pk' comes from nested URL
             actuator__greenhouse__user=self.request.user # Ensure user owns the greenhouse
         ).select_related('actuator') # Select related actuator to avoid extra queries
+        since, until = parse_time_range(self.request.query_params)
+        if since:
+            queryset = queryset.filter(timestamp__gte=since)
+        if until:
+            queryset = queryset.filter(timestamp__lte=until)
+        return queryset
 
     def perform_create(self, serializer):
         """
@@ -129,6 +274,108 @@ class ActuatorStatusViewSet(viewsets.ModelViewSet):
 
         serializer.save(actuator=actuator)
 
+class AlertViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Alerts of one greenhouse, newest first, paginated by cursor on (created_at, id).
+    Filters: ?severity=WARNING,CRITICAL  ?sensor=<id>  ?resolved=true|false  ?since= / ?until= (on created_at)
+    """
+    serializer_class = AlertSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = AlertPagination
+
+    def get_queryset(self):
+        return self.filter_alerts(Alert.objects.filter(
+            greenhouse_id=self.kwargs['greenhouse_pk'],
+            greenhouse__user=self.request.user
+        ))
+
+    def filter_alerts(self, queryset, severity=True):
+        params = self.request.query_params
+        resolved = params.get('resolved')
+        if resolved is not None:
+            if resolved.lower() not in ('true', 'false', '1', '0'):
+                raise ValidationError({'resolved': "Expected true or false."})
+            queryset = queryset.filter(is_resolved=resolved.lower() in ('true', '1'))
+        if params.get('sensor'):
+            try:
+                queryset = queryset.filter(sensor_id=int(params['sensor']))
+            except ValueError:
+                raise ValidationError({'sensor': "Expected a sensor ID."})
+        if severity and params.get('severity'):
+            severities = params['severity'].upper().split(',')
+            known = dict(ALERT_SEVERITIES)
+            if any(value not in known for value in severities):
+                raise ValidationError({'severity': f"Expected one or more of: {', '.join(known)}."})
+            queryset = queryset.filter(severity__in=severities)
+        since, until = parse_time_range(params)
+        if since:
+            queryset = queryset.filter(created_at__gte=since)
+        if until:
+            queryset = queryset.filter(created_at__lte=until)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def counts(self, request, greenhouse_pk=None):
+        """
+        Alert counts per severity for badges: GET .../alerts/counts/ (open alerts unless ?resolved= is given).
+        One GROUP BY over the (greenhouse, is_resolved, severity) index; no alert body is read.
+        """
+        if not Greenhouse.objects.filter(pk=greenhouse_pk, user=request.user).exists():
+            return Response({'error': 'Greenhouse not found.'}, status=status.HTTP_404_NOT_FOUND)
+        queryset = Alert.objects.filter(greenhouse_id=greenhouse_pk)
+        if 'resolved' not in request.query_params:
+            queryset = queryset.filter(is_resolved=False)
+        queryset = self.filter_alerts(queryset, severity=False)
+
+        by_severity = {value: 0 for value, _ in ALERT_SEVERITIES}
+        for row in queryset.order_by().values('severity').annotate(count=Count('id')):
+            by_severity[row['severity']] = row['count']
+        return Response({
+            'greenhouse': int(greenhouse_pk),
+            'total': sum(by_severity.values()),
+            'by_severity': by_severity,
+        })
+
+
+class AlertRuleViewSet(viewsets.ModelViewSet):
+    """
+    Global alert rules (/alert-rules/): readable by any user, editable by admins.
+    """
+    serializer_class = AlertRuleSerializer
+    permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
+    queryset = AlertRule.objects.filter(greenhouse__isnull=True, sensor__isnull=True)
+
+
+class GreenhouseAlertRuleViewSet(viewsets.ModelViewSet):
+    """
+    Rules scoped to one greenhouse, or to one of its sensors when 'sensor' is set.
+    They override the global rule of the same sensor type and condition.
+    """
+    serializer_class = AlertRuleSerializer
+    permission_classes = [IsAuthenticated, IsOwner]
+
+    def get_greenhouse(self):
+        try:
+            return Greenhouse.objects.get(pk=self.kwargs['greenhouse_pk'], user=self.request.user)
+        except Greenhouse.DoesNotExist:
+            raise PermissionDenied("Greenhouse not found or you do not own it.")
+
+    def get_queryset(self):
+        return AlertRule.objects.filter(
+            greenhouse_id=self.kwargs['greenhouse_pk'],
+            greenhouse__user=self.request.user
+        ).select_related('greenhouse', 'sensor')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if 'greenhouse_pk' in self.kwargs and self.request.method not in permissions.SAFE_METHODS:
+            context['greenhouse'] = self.get_greenhouse() # Needed to validate the sensor field
+        return context
+
+    def perform_create(self, serializer):
+        serializer.save(greenhouse=serializer.context['greenhouse'])
+
+
 class GreenhouseOverview(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -139,10 +386,8 @@ class GreenhouseOverview(APIView):
             return Response({'error': 'Greenhouse not found.'}, status=status.HTTP_404_NOT_FOUND)
 
         # --- Fetch Actuators and their latest statuses ---
-        # Prefetch 'statuses' for the ActuatorSerializer's 'latest_status' field to avoid N+1 queries
-        actuators_queryset = Actuator.objects.filter(greenhouse=greenhouse).prefetch_related(
-            Prefetch('statuses', queryset=ActuatorStatus.objects.order_by('-timestamp'))
-        )
+        # Join the current-state table for the ActuatorSerializer's 'latest_status' field (one query for all actuators)
+        actuators_queryset = Actuator.objects.filter(greenhouse=greenhouse).select_related('current_state')
         # Serialize the actuators
         actuators_data = ActuatorSerializer(actuators_queryset, many=True).data
 
@@ -158,12 +403,15 @@ class GreenhouseOverview(APIView):
         #     timestamp = models.DateTimeField(auto_now_add=True)
         #
         try:
-            alerts = greenhouse.alerts.filter(is_resolved=False).values_list('message', flat=True)
-            alerts_data = list(alerts)
+            # Newest open alerts only; the full list is paginated at .../alerts/?resolved=false
+            alerts = greenhouse.alerts.filter(is_resolved=False).order_by('-created_at').values_list('message', flat=True)
+            alerts_data = list(alerts[:OVERVIEW_ALERT_LIMIT])
+            open_alert_count = greenhouse.alerts.filter(is_resolved=False).count()
         except AttributeError:
             # This means greenhouse.alerts does not exist, e.g., no Alert model or ForeignKey
             print("Warning: 'alerts' relationship not found on Greenhouse model. Skipping alerts.")
             alerts_data = [] # Default to empty list if alerts relationship doesn't exist
+            open_alert_count = 0
 
         overview_data = {
             'id': greenhouse.id,
@@ -171,7 +419,157 @@ class GreenhouseOverview(APIView):
             'location': greenhouse.location, # Include location too, as it's useful for overview
             'actuators': actuators_data, # Now it's a list of serialized actuator objects
             'alerts': alerts_data,
+            'open_alert_count': open_alert_count,
             # Add other relevant basic info here, like sensor_count if you add it to serializer
         }
 
-        return Response(overview_data)
\ No newline at end of file
+        return Response(overview_data)
+
+class SensorDataBulkIngest(APIView):
+    """
+    Ingests many readings, for any sensors of one greenhouse, in a single request.
+    Accepts a JSON array (or {"readings": [...]}) or NDJSON, one reading per line:
+        {"sensor": 12, "value": 23.4, "timestamp": "2025-05-10T12:00:00Z", "notes": ""}
+    or the binary frame format (Content-Type: application/vnd.greengrow.readings, see dashboard/frames.py).
+    Invalid items are reported by index; the valid ones are still stored.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, NDJSONParser, SensorFrameParser]
+
+    def post(self, request, greenhouse_id):
+        try:
+            greenhouse = Greenhouse.objects.get(pk=greenhouse_id, user=request.user)
+        except Greenhouse.DoesNotExist:
+            return Response({'error': 'Greenhouse not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get('readings')
+        if not isinstance(items, (list, ReadingFrame)):
+            return Response({'error': 'Expected a list of readings.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_batch_size = ingest_setting('MAX_BATCH_SIZE')
+        if len(items) > max_batch_size:
+            return Response(
+                {'error': f'Too many readings in one batch (max {max_batch_size}).'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+
+        if buffered_mode():
+            # Write-behind: acknowledge once queued, the flusher thread does the inserts
+            validate = validate_frame if isinstance(items, ReadingFrame) else validate_readings
+            readings, errors = validate(greenhouse, items)
+            try:
+                get_ingest_buffer().offer(greenhouse, readings)
+            except BufferFull as e:
+                return buffer_full_response(e)
+            return Response({
+                'received': len(items),
+                'accepted': len(readings),
+                'errors': errors,
+            }, status=status.HTTP_202_ACCEPTED if readings or not errors else status.HTTP_400_BAD_REQUEST)
+
+        if isinstance(items, ReadingFrame):
+            created, errors = ingest_frame(greenhouse, items)
+        else:
+            created, errors = ingest_readings(greenhouse, items)
+
+        if created:
+            response_status = status.HTTP_201_CREATED
+        elif errors:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_200_OK # Empty batch
+        return Response({
+            'received': len(items),
+            'created': len(created),
+            'errors': errors,
+        }, status=response_status)
+
+
+class SensorDataExport(APIView):
+    """
+    Streams the reading history of one greenhouse (or one sensor) as a file download.
+    GET .../greenhouses/{id}/export/?sensor=&since=&until=&output=csv|ndjson&gzip=1
+    GET .../greenhouses/{id}/sensors/{sensor_id}/export/?since=&until=&output=&gzip=
+    Ownership is checked the same way as SensorDataViewSet.get_queryset.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, greenhouse_id, sensor_id=None):
+        sensors = Sensor.objects.filter(
+            greenhouse_id=greenhouse_id,
+            greenhouse__user_id=request.user.id
+        ).order_by('id')
+        sensor_ids = [sensor_id] if sensor_id is not None else request.query_params.getlist('sensor')
+        if sensor_ids:
+            try:
+                sensors = sensors.filter(pk__in=[int(pk) for pk in sensor_ids])
+            except ValueError:
+                raise ValidationError({'sensor': "Expected sensor IDs."})
+        sensors = list(sensors)
+        if not sensors:
+            return Response({'error': 'Sensor or greenhouse not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        since, until = parse_time_range(request.query_params)
+        since = since or EPOCH
+        until = until or timezone.now()
+
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({'output': f"Expected one of: {', '.join(EXPORT_FORMATS)}."})
+        compress = request.query_params.get('gzip') in ('1', 'true')
+
+        filename = f"greenhouse_{greenhouse_id}" + (f"_sensor_{sensor_id}" if sensor_id is not None else '')
+        filename += f"_{since:%Y%m%d}-{until:%Y%m%d}.{output}" + ('.gz' if compress else '')
+        # Under ASGI (Daphne) a sync iterator would be read to the end before the first byte goes out
+        stream = aexport_stream if isinstance(request._request, ASGIRequest) else export_stream
+        response = StreamingHttpResponse(
+            stream(sensors, since, until, output=output, compress=compress),
+            content_type='application/gzip' if compress else EXPORT_FORMATS[output],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class AlertBacktest(APIView):
+    """
+    Replays a greenhouse's reading history through the current alert rules and, optionally,
+    a candidate rule set, and reports alert counts, durations and time-to-detect. Writes nothing.
+    POST .../greenhouses/{id}/alert-backtest/ {"since": ..., "until": ..., "sensors": [...], "rules": [...]}
+    Runs within the request, so the range is capped; use the backtest_alerts command for longer ones.
+    """
+    permission_classes = [IsAuthenticated]
+    max_span = timedelta(days=92)
+
+    def post(self, request, greenhouse_id):
+        serializer = BacktestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if data['until'] - data['since'] > self.max_span:
+            raise ValidationError({'until': f"Range is limited to {self.max_span.days} days."})
+
+        sensors = Sensor.objects.filter(
+            greenhouse_id=greenhouse_id,
+            greenhouse__user_id=request.user.id
+        ).order_by('id')
+        if data.get('sensors'):
+            sensors = sensors.filter(pk__in=data['sensors'])
+        sensors = list(sensors)
+        if not sensors:
+            return Response({'error': 'Sensor or greenhouse not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        rule_sets = {'current': alert_engine.rules}
+        if data.get('rules'):
+            rule_sets['candidate'] = candidate_rules(data['rules'])
+        return Response(Backtest(rule_sets).run(sensors, data['since'], data['until']))
+
+
+class MetricsView(APIView):
+    """
+    In-process metrics of this worker (ingestion buffer, fan-out...), for staff users.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(metrics.snapshot())
@@ -13,11 +13,8 @@ import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter
 from django.urls import path
-from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 
-import dashboard.routing
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greengrow.settings')
 
 
@@ -25,14 +22,20 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greengrow.settings')
 # This handles regular HTTP requests
 django_asgi_app = get_asgi_application()
 
+# Imported once Django is set up: they import models
+import dashboard.routing # noqa: E402
+from dashboard.middleware import JWTAuthMiddlewareStack, TransportFlowMiddleware # noqa: E402
+
 # Define the Protocol Type Router
 # It routes incoming connections based on their protocol (HTTP or WebSocket)
 application = ProtocolTypeRouter({
     "http": django_asgi_app, # Route HTTP requests to Django's core ASGI app
 
-    "websocket": AuthMiddlewareStack( # Route WebSocket connections
+    # Route WebSocket connections, authenticated by ?token=<JWT access token> (or the session);
+    # TransportFlowMiddleware lets consumers see when a client stops reading (dashboard/middleware.py)
+    "websocket": TransportFlowMiddleware(JWTAuthMiddlewareStack(
         URLRouter(
             dashboard.routing.websocket_urlpatterns # Route WebSocket URLs to your app's routing
         )
-    ),
+    )),
 })
\ No newline at end of file
@@ -11,6 +11,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -89,20 +90,89 @@ WSGI_APPLICATION = 'greengrow.wsgi.application'
 # ASGI application definition
 ASGI_APPLICATION = 'greengrow.asgi.application'
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': "channels.layers.InMemoryChannelLayer",
+# Channel layer. The in-memory layer only reaches sockets of the same process: set
+# CHANNEL_LAYER_URL (e.g. redis://127.0.0.1:6379/0, needs channels-redis) whenever more
+# than one Daphne/worker process runs. CHANNEL_LAYER_KIND=pubsub uses Redis pub/sub
+# (one PUBLISH per group_send, better for large groups); the default 'core' layer
+# queues one message per channel. Any local Redis works as a stand-in for tests, e.g.
+#   docker run --rm -p 6379:6379 redis:7   or   redis-server --port 6379
+# and the benchmark_fanout command measures the configured layer.
+CHANNEL_LAYER_URL = os.environ.get('CHANNEL_LAYER_URL')
+CHANNEL_LAYER_KIND = os.environ.get('CHANNEL_LAYER_KIND', 'core')
+
+if CHANNEL_LAYER_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer' if CHANNEL_LAYER_KIND == 'pubsub' else 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_LAYER_URL],
+            },
+        },
+    }
+    if CHANNEL_LAYER_KIND != 'pubsub':
+        CHANNEL_LAYERS['default']['CONFIG'].update({
+            'capacity': int(os.environ.get('CHANNEL_LAYER_CAPACITY', 1000)), # Messages queued per channel
+            'expiry': 10, # Seconds before an undelivered message is dropped; live updates go stale fast
+        })
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': "channels.layers.InMemoryChannelLayer",
+        }
+    }
+
+# Cache (alert rule versions, live-feed snapshots and resume journal). Per-process memory by
+# default; set CACHE_URL (e.g. redis://127.0.0.1:6379/1) to share it between processes.
+CACHE_URL = os.environ.get('CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        },
     }
+
+# WebSocket fan-out after commit (see dashboard/dispatch.py for defaults)
+WS_DISPATCH = {
+    'CAPACITY': 10000,
+    'FLUSH_INTERVAL_MS': 25,
+    'MAX_BATCH': 500,
+}
+
+# Live feed: sensor updates are coalesced per socket and sent once per tick (see dashboard/consumers.py)
+WS_PUSH = {
+    'DEFAULT_TICK_MS': 1000,
+    'MIN_TICK_MS': 250,
+    'MAX_TICK_MS': 5000,
+    # Frames queued for a slow client before SLOW_POLICY applies. Under Daphne frames queue up once the
+    # connection's 64 KiB transport buffer is full (TransportFlowMiddleware in greengrow/asgi.py)
+    'MAX_SEND_QUEUE': 100,
+    'SLOW_POLICY': 'coalesce', # 'drop_oldest', 'coalesce' or 'disconnect'
+}
+
+# Snapshot and resume journal sent on WebSocket connect (see dashboard/live_state.py)
+LIVE_STATE = {
+    'SNAPSHOT_TTL_S': 30,
+    'JOURNAL_TTL_S': 300,
+    'MAX_REPLAY': 1000,
+}
+
+# Sensor reading ingestion (see dashboard/ingest.py for defaults)
+SENSOR_INGEST = {
+    'MAX_BATCH_SIZE': 5000,
+    'BULK_CREATE_BATCH_SIZE': 1000,
+    # 'buffered' acknowledges readings once queued and writes them in the background
+    'MODE': 'sync',
+    'BUFFER_CAPACITY': 50000,
+    'FLUSH_INTERVAL_MS': 200,
+    'FLUSH_BATCH_SIZE': 2000,
+}
+
+# Cold storage for old readings (see dashboard/archive.py and the archive_sensordata command)
+SENSOR_ARCHIVE = {
+    'ROOT': BASE_DIR / 'archive',
+    'MIN_AGE_DAYS': 90,
 }
-# For production, you would typically use Redis:
-# CHANNEL_LAYERS = {
-#    "default": {
-#        "BACKEND": "channels_redis.core.RedisChannelLayer",
-#        "CONFIG": {
-#            "hosts": [("127.0.0.1", 6379)], # Adjust Redis host/port
-#        },
-#    },
-# }
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases